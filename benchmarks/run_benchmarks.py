@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+
+"""
+Measures the overhead of http_test itself on its hot paths: parsing the
+response headers, decoding and verifying the responses, loading large spec
+files, and running whole test suites against local stand-in servers (see
+`benchmarks/servers.py`).
+
+All the results are rates, in operations (or tests) per second, so higher
+is better. They are saved to a JSON file, by default
+`benchmarks/results/<version>-<git revision>.json`, that can be compared
+with the results of another version:
+
+    PYTHONPATH=. python3 benchmarks/run_benchmarks.py --compare benchmarks/results/1.0.20-abc1234.json
+"""
+
+import datetime
+import gzip
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from pathlib import Path
+
+import brotli
+import click
+import pycurl
+
+from http_test import __version__
+from http_test.cache import SpecCache
+from http_test.request import Request
+from http_test.runner import run_specfiles
+from http_test.spec import Requirements, SpecFile, verify_response
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from servers import TEXT, StandInServers  # noqa: E402
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+RESPONSE_HEADER_LINES = [
+    b"HTTP/1.1 200 OK\r\n",
+    b"Date: Sat, 18 Oct 2026 10:00:00 GMT\r\n",
+    b"Content-Type: text/html; charset=utf-8\r\n",
+    b"Content-Length: 65536\r\n",
+    b"Connection: keep-alive\r\n",
+    b"Server: openresty\r\n",
+    b"Cache-Control: public, max-age=300\r\n",
+    b"Vary: Accept-Encoding\r\n",
+    b"Vary: Origin\r\n",
+    b"Content-Encoding: gzip\r\n",
+    b'ETag: W/"5f3c-1a2b3c4d"\r\n',
+    b"Last-Modified: Fri, 17 Oct 2026 08:00:00 GMT\r\n",
+    b"Strict-Transport-Security: max-age=31536000; includeSubDomains\r\n",
+    b"X-Content-Type-Options: nosniff\r\n",
+    b"X-Frame-Options: SAMEORIGIN\r\n",
+    b"Set-Cookie: session=abc123; Path=/; HttpOnly\r\n",
+    b"Set-Cookie: lang=en; Path=/\r\n",
+    b"Age: 42\r\n",
+    b"X-Cache: HIT\r\n",
+    b"Via: 1.1 varnish\r\n",
+    b"X-Request-Id: 0b8e5f4a-2c1d-4e6f-9a7b-3c2d1e0f9a8b\r\n",
+    b"\r\n",
+]
+
+MATCH = {
+    "status": [200, 301],
+    "headers": ["content-type: text/html; charset=utf-8", "server: openresty", "vary: Origin"],
+    "headers_absent": ["x-debug", "x-powered-by"],
+    "body": ["<html>", "<body>", "consectetur"],
+    "timing": {"total": "500ms", "connect": "100ms"},
+}
+
+
+def ops_per_second(func, repeat: int) -> float:
+    """
+    Runs `func` repeatedly, and returns how many times per second it can
+    run, for the fastest of `repeat` rounds.
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return number / best
+
+
+def request_with_headers(lines: list) -> Request:
+    request = Request("http://127.0.0.1/")
+    for line in lines:
+        request.header_function(line)
+    return request
+
+
+def bench_header_function(repeat: int) -> dict:
+    request = Request("http://127.0.0.1/")
+
+    def parse_headers():
+        request.response_headers.clear()
+        for line in RESPONSE_HEADER_LINES:
+            request.header_function(line)
+
+    return {"header_function": ops_per_second(parse_headers, repeat)}
+
+
+def bench_inflate_response(repeat: int) -> dict:
+    body = TEXT[: 64 * 1024]
+    results = {}
+
+    for encoding, compressed in (("gzip", gzip.compress(body)), ("br", brotli.compress(body))):
+        request = request_with_headers([f"Content-Encoding: {encoding}\r\n".encode()])
+        assert request.inflate_response(compressed) == body
+        results[f"inflate_response[{encoding}]"] = ops_per_second(lambda: request.inflate_response(compressed), repeat)
+
+    return results
+
+
+def bench_verify_response(repeat: int) -> dict:
+    request = request_with_headers(RESPONSE_HEADER_LINES)
+    result = {
+        "status_code": 200,
+        "response_headers": request.response_headers,
+        "response_body_decoded": TEXT[: 64 * 1024],
+        "timings": {"total": 0.05, "connect": 0.001},
+    }
+    requirements = Requirements(MATCH)
+    assert verify_response(result, MATCH)
+
+    return {
+        "verify_response": ops_per_second(lambda: verify_response(result, MATCH), repeat),
+        "Requirements.verify": ops_per_second(lambda: requirements.verify(result), repeat),
+    }
+
+
+def write_spec_file(path: Path, count: int, url: str, **extra) -> Path:
+    """
+    Writes a spec file with `count` tests of the `/` route of a stand-in
+    server, or of any URL, all passing.
+    """
+    lines = ["tests:"]
+    for i in range(count):
+        lines += [
+            f'  - url: "{url}?test={i}"',
+            f'    description: "Test {i}"',
+        ]
+        lines += [f"    {key}: {json.dumps(value)}" for key, value in extra.items()]
+        lines += [
+            "    headers:",
+            '      - "Accept: text/plain"',
+            "    match:",
+            "      status: 200",
+            "      headers:",
+            '        - "content-type: text/plain"',
+            "      body:",
+            '        - "hello"',
+        ]
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+
+def bench_load_tests(workdir: Path, test_count: int) -> dict:
+    """
+    Loading a spec file is too slow for `timeit.autorange()` to be useful,
+    so the rates are for a few rounds instead.
+    """
+    spec_file = SpecFile(write_spec_file(workdir / "large.yaml", test_count, "http://127.0.0.1/"))
+    cache = SpecCache(workdir / "cache")
+
+    def load_rate(**kwargs) -> float:
+        timings = []
+        for _ in range(3):
+            t_start = time.perf_counter()
+            tests = spec_file.load_tests(**kwargs)
+            timings.append(time.perf_counter() - t_start)
+            assert len(tests) == test_count
+        return test_count / min(timings)
+
+    uncached = load_rate()
+    # Fill the cache first
+    spec_file.load_tests(cache=cache)
+    cached = load_rate(cache=cache)
+
+    return {"SpecFile.load_tests": uncached, "SpecFile.load_tests[cached]": cached}
+
+
+def run_rate(test_file: Path, test_count: int, **kwargs) -> float:
+    t_start = time.perf_counter()
+    failed = run_specfiles([test_file], **kwargs)
+    elapsed = time.perf_counter() - t_start
+    assert failed == 0, f"{failed} tests failed in {test_file}"
+    return test_count / elapsed
+
+
+def bench_run_specfiles(workdir: Path, servers: StandInServers, test_count: int) -> dict:
+    http_file = write_spec_file(workdir / "http.yaml", test_count, f"{servers.http_url}/")
+    results = {
+        "run_specfiles[http1]": run_rate(http_file, test_count),
+        "run_specfiles[http1,jobs=20]": run_rate(http_file, test_count, concurrency=20),
+    }
+
+    if servers.h2_url:
+        h2_file = write_spec_file(workdir / "h2.yaml", test_count, f"{servers.h2_url}/", http2=True)
+        results["run_specfiles[http2,jobs=20,multiplex]"] = run_rate(
+            h2_file, test_count, concurrency=20, multiplex=True
+        )
+
+    ws_count = max(test_count // 10, 10)
+    ws_file = workdir / "ws.yaml"
+    ws_file.write_text(
+        "tests:\n"
+        + "".join(
+            f'  - url: "{servers.ws_url}/?test={i}"\n'
+            f'    description: "Websocket test {i}"\n'
+            '    payload: "hello"\n'
+            "    match:\n"
+            "      body:\n"
+            '        - "hello"\n'
+            for i in range(ws_count)
+        )
+    )
+    results["run_specfiles[websocket,jobs=20]"] = run_rate(ws_file, ws_count, concurrency=20)
+
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_results(results: dict, previous: dict = None) -> None:
+    benchmarks = results["benchmarks"]
+    previous_benchmarks = previous["benchmarks"] if previous else {}
+    width = max(len(name) for name in benchmarks)
+
+    if previous:
+        print(f"Compared with {previous['version']} ({previous['revision']}):")
+
+    for name, rate in benchmarks.items():
+        line = f"{name:<{width}}  {rate:>14,.1f}/s"
+        previous_rate = previous_benchmarks.get(name)
+        if previous_rate:
+            line += f"  {(rate - previous_rate) / previous_rate * 100:+7.1f}%"
+        print(line)
+
+
+@click.command()
+@click.option("--quick", is_flag=True, default=False, help="Smaller specs and fewer rounds, for a quick check")
+@click.option("--output", type=click.Path(dir_okay=False), help="File to save the results to, as JSON")
+@click.option(
+    "--compare",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Results of a previous run to compare with",
+)
+def main(quick, output, compare):
+    repeat = 3 if quick else 5
+    spec_test_count = 500 if quick else 5000
+    run_test_count = 200 if quick else 1000
+
+    benchmarks = {}
+    benchmarks.update(bench_header_function(repeat))
+    benchmarks.update(bench_inflate_response(repeat))
+    benchmarks.update(bench_verify_response(repeat))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        benchmarks.update(bench_load_tests(Path(workdir), spec_test_count))
+
+        with StandInServers() as servers:
+            benchmarks.update(bench_run_specfiles(Path(workdir), servers, run_test_count))
+
+    revision = git_revision()
+    results = {
+        "version": __version__,
+        "revision": revision,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "pycurl": pycurl.version,
+        "quick": quick,
+        "benchmarks": benchmarks,
+    }
+
+    previous = json.loads(Path(compare).read_text()) if compare else None
+    print_results(results, previous)
+
+    output_path = Path(output) if output else RESULTS_DIR / f"{__version__}-{revision}.json"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(results, indent=2) + "\n")
+    print(f"Results saved to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Local stand-in servers for the benchmarks, so that they measure the overhead
+of http_test itself rather than the network or a real server.
+
+All the servers run in the same asyncio event loop, in a background thread:
+
+- HTTP/1.1, with keep-alive
+- HTTP/2 over cleartext, upgraded from HTTP/1.1 (`Upgrade: h2c`), the way
+  curl does it for `http://` URLs. Only available if the `h2` package is
+  installed.
+- websocket, echoing back each message
+
+The HTTP servers respond to:
+
+- `/` with a small text body
+- `/headers` with a small body and 30 extra response headers
+- `/gzip` with a 64KB body, gzip-compressed
+- `/large` with a 1MB body
+"""
+
+import asyncio
+import gzip
+import threading
+
+import websockets
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+except ImportError:
+    h2 = None
+
+TEXT = b"<html><body>" + b"lorem ipsum dolor sit amet, consectetur adipiscing elit " * 1170 + b"</body></html>"
+
+ROUTES = {
+    "/": ([("content-type", "text/plain")], b"hello"),
+    "/headers": (
+        [("content-type", "text/plain")] + [(f"x-header-{i}", f"value {i} " * 4) for i in range(30)],
+        b"hello",
+    ),
+    "/gzip": ([("content-type", "text/html"), ("content-encoding", "gzip")], gzip.compress(TEXT[: 64 * 1024])),
+    "/large": ([("content-type", "application/octet-stream")], b"x" * (1024 * 1024)),
+}
+
+NOT_FOUND = ([("content-type", "text/plain")], b"not found")
+
+
+def route(path: str) -> tuple:
+    """
+    Returns the `(status, headers, body)` of the response to `path`.
+    """
+    path = path.split("?", 1)[0]
+    if path in ROUTES:
+        return (200, *ROUTES[path])
+    return (404, *NOT_FOUND)
+
+
+async def handle_http1(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, allow_h2: bool = False):
+    try:
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+
+            request_line, *header_lines = head.decode("iso-8859-1").split("\r\n")
+            method, path, _ = request_line.split(" ", 2)
+            headers = {}
+            for line in header_lines:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+
+            content_length = int(headers.get("content-length", 0))
+            if content_length:
+                await reader.readexactly(content_length)
+
+            if allow_h2 and headers.get("upgrade", "").lower() == "h2c":
+                await handle_h2_upgrade(reader, writer, path, headers["http2-settings"])
+                break
+
+            status, response_headers, body = route(path)
+            head = [f"HTTP/1.1 {status} {'OK' if status == 200 else 'Not Found'}", f"content-length: {len(body)}"]
+            head += [f"{name}: {value}" for name, value in response_headers]
+            writer.write("\r\n".join(head).encode("iso-8859-1") + b"\r\n\r\n")
+            if method != "HEAD":
+                writer.write(body)
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+class H2Connection:
+    """
+    Serves the HTTP/2 streams of an upgraded connection, honouring the
+    client's flow control windows for the larger responses.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False))
+        # Response bodies not sent yet, by stream id
+        self.pending = {}
+
+    def respond(self, stream_id: int, path: str) -> None:
+        status, response_headers, body = route(path)
+        headers = [(":status", str(status)), ("content-length", str(len(body)))] + response_headers
+        self.conn.send_headers(stream_id, headers)
+        self.pending[stream_id] = memoryview(body)
+        self.send_pending()
+
+    def send_pending(self) -> None:
+        for stream_id, body in list(self.pending.items()):
+            while body:
+                size = min(self.conn.local_flow_control_window(stream_id), self.conn.max_outbound_frame_size, len(body))
+                if size <= 0:
+                    break
+                self.conn.send_data(stream_id, body[:size].tobytes())
+                body = body[size:]
+
+            if body:
+                self.pending[stream_id] = body
+            else:
+                self.conn.end_stream(stream_id)
+                del self.pending[stream_id]
+
+    async def flush(self) -> None:
+        data = self.conn.data_to_send()
+        if data:
+            self.writer.write(data)
+            await self.writer.drain()
+
+
+async def handle_h2_upgrade(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, path: str, settings: str):
+    connection = H2Connection(writer)
+    connection.conn.initiate_upgrade_connection(settings_header=settings.encode("ascii"))
+    writer.write(b"HTTP/1.1 101 Switching Protocols\r\nConnection: Upgrade\r\nUpgrade: h2c\r\n\r\n")
+
+    # The upgraded request is stream 1
+    connection.respond(1, path)
+    await connection.flush()
+
+    while True:
+        data = await reader.read(65536)
+        if not data:
+            break
+
+        for event in connection.conn.receive_data(data):
+            if isinstance(event, h2.events.RequestReceived):
+                headers = {name.decode(): value.decode() for name, value in event.headers}
+                connection.respond(event.stream_id, headers[":path"])
+            elif isinstance(event, h2.events.WindowUpdated):
+                connection.send_pending()
+            elif isinstance(event, h2.events.StreamReset):
+                connection.pending.pop(event.stream_id, None)
+            elif isinstance(event, h2.events.ConnectionTerminated):
+                await connection.flush()
+                return
+
+        await connection.flush()
+
+
+async def ws_echo(websocket):
+    async for message in websocket:
+        await websocket.send(message)
+
+
+class StandInServers:
+    """
+    Starts all the stand-in servers on local random ports, in a background
+    thread, and exposes their base URLs. `h2_url` is None if the `h2`
+    package isn't installed.
+    """
+
+    def __init__(self, host: str = "127.0.0.1"):
+        self.host = host
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="stand-in-servers", daemon=True)
+        self.servers = []
+        # Connections being served, with their handler tasks
+        self.connections = {}
+        self.http_url = self.h2_url = self.ws_url = None
+
+    def __enter__(self):
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.start(), self.loop).result()
+        return self
+
+    def __exit__(self, *exc_info):
+        asyncio.run_coroutine_threadsafe(self.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, allow_h2: bool = False):
+        self.connections[writer] = asyncio.current_task()
+        try:
+            await handle_http1(reader, writer, allow_h2)
+        finally:
+            del self.connections[writer]
+
+    async def start(self) -> None:
+        http_server = await asyncio.start_server(self.serve, self.host, 0)
+        self.http_url = self.url("http", http_server)
+        self.servers.append(http_server)
+
+        if h2 is not None:
+            h2_server = await asyncio.start_server(
+                lambda reader, writer: self.serve(reader, writer, allow_h2=True), self.host, 0
+            )
+            self.h2_url = self.url("http", h2_server)
+            self.servers.append(h2_server)
+
+        ws_server = await websockets.serve(ws_echo, self.host, 0)
+        self.ws_url = self.url("ws", ws_server)
+        self.servers.append(ws_server)
+
+    async def stop(self) -> None:
+        for server in self.servers:
+            server.close()
+
+        # Connections kept alive by the clients are still being served:
+        # closing them ends their handlers
+        tasks = list(self.connections.values())
+        for writer in list(self.connections):
+            writer.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        for server in self.servers:
+            await server.wait_closed()
+
+    def url(self, scheme: str, server) -> str:
+        port = list(server.sockets)[0].getsockname()[1]
+        return f"{scheme}://{self.host}:{port}"
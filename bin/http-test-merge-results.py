@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""
+Merge the results files written by `http-test-runner.py --results-file`
+when a test suite is split across several machines with `--shard K/N`.
+
+Prints the merged results and exits with the total number of failed tests,
+so CI can gate on a single step. Optionally, writes the test durations to
+a JSON file, to balance the shards of the next runs with `--durations`.
+"""
+
+import json
+import sys
+
+import click
+
+from http_test.results import durations_from_results, merge_results
+from http_test.runner import RED, RESET, print_result_record
+
+
+@click.command()
+@click.argument("results_files", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option(
+    "output",
+    "--output",
+    "-o",
+    type=click.Path(),
+    help="Write the merged results to this JSON lines file",
+)
+@click.option(
+    "durations_output",
+    "--durations-output",
+    type=click.Path(),
+    help="Write the test durations to this JSON file, to be used with `http-test-runner.py --durations`",
+)
+@click.option(
+    "verbose",
+    "--verbose",
+    "-v",
+    is_flag=True,
+    help="Print all the test results, and not only the failed ones",
+)
+def merge(results_files, output=None, durations_output=None, verbose=False):
+    merged = merge_results(results_files)
+    records = merged["records"]
+
+    fail_count = 0
+    for record in records:
+        if record["status"] == "fail":
+            fail_count += 1
+        if verbose or record["status"] == "fail":
+            print_result_record(record)
+
+    if merged["incomplete_files"]:
+        incomplete_files = ", ".join(merged["incomplete_files"])
+        print(f"{RED}Incomplete results, the run was interrupted: {incomplete_files}{RESET}")
+        fail_count += len(merged["incomplete_files"])
+
+    if merged["missing_shards"]:
+        missing_shards = ", ".join(map(str, merged["missing_shards"]))
+        print(f"{RED}Missing results for shard(s) {missing_shards}{RESET}")
+        fail_count += len(merged["missing_shards"])
+
+    print(f"{len(records)} tests, {fail_count} failed")
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+    if durations_output:
+        with open(durations_output, "w", encoding="utf-8") as f:
+            json.dump(durations_from_results(records), f, indent=2, sort_keys=True)
+
+    sys.exit(fail_count)
+
+
+if __name__ == "__main__":
+    merge()
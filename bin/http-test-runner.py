@@ -11,11 +11,46 @@ small script provides a starting point for how to invoke the `http_test.runner`
 module.
 """
 
+import contextlib
+import os
+import signal
 import sys
 
 import click
 
+from http_test.baseline import BaselineStore
+from http_test.bench import bench_specfiles
+from http_test.cache import SpecCache
+from http_test.cassette import CASSETTE_MODES, REPLAY
+from http_test.fanout import fan_out_specfiles
+from http_test.metrics import HttpExporter, TextfileExporter
+from http_test.monitor import Monitor, MonitoredSuite, parse_interval
+from http_test.multi import DEFAULT_MAX_STREAMS
+from http_test.results import JsonLinesWriter, JUnitXmlWriter
 from http_test.runner import run_specfiles
+from http_test.sharding import load_durations, parse_shard
+from http_test.spec import SpecError, parse_duration, parse_size
+
+
+def validate_shard(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return parse_shard(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+@contextlib.contextmanager
+def reporting_spec_errors():
+    """
+    Reports the invalid tests, found while loading the test files before
+    any request is sent, as usage errors rather than with a traceback.
+    """
+    try:
+        yield
+    except SpecError as e:
+        raise click.UsageError(str(e))
 
 
 @click.command()
@@ -33,7 +68,8 @@ from http_test.runner import run_specfiles
     "--target-host",
     "-h",
     required=False,
-    help="Works similarly to curl's --connect-to option. Typically used to send a set of test requests to an alternative IP address/port or hostname/port",
+    multiple=True,
+    help="Works similarly to curl's --connect-to option. Typically used to send a set of test requests to an alternative IP address/port or hostname/port. When given more than once, each test request is sent to all the target hosts, and their responses are compared",
 )
 @click.option(
     "template_vars",
@@ -49,9 +85,415 @@ from http_test.runner import run_specfiles
     is_flag=True,
     help="Print verbose output",
 )
-def run_tests(test_files, target_host=None, template_vars=None, verbose=False):
+@click.option(
+    "concurrency",
+    "--jobs",
+    "-j",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of test requests to keep in flight at the same time",
+)
+@click.option(
+    "workers",
+    "--workers",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of worker processes to split the tests across. Each worker runs up to --jobs requests at a time",
+)
+@click.option(
+    "ws_concurrency",
+    "--ws-jobs",
+    type=click.IntRange(min=1),
+    help="Number of websocket test requests to run at the same time. Same as --jobs by default",
+)
+@click.option(
+    "max_body_size",
+    "--max-body-size",
+    help="Fail the tests whose response body is larger than this size (f.ex. `10MB`), unless set in the test files",
+)
+@click.option(
+    "share_requests",
+    "--share-requests",
+    is_flag=True,
+    help="Fire identical test requests only once, and verify all their tests against the same response",
+)
+@click.option(
+    "multiplex",
+    "--multiplex",
+    is_flag=True,
+    help="Send the concurrent HTTP/2 test requests to the same origin as streams over a single connection. Needs --jobs",
+)
+@click.option(
+    "max_streams",
+    "--max-streams",
+    type=click.IntRange(min=1),
+    default=DEFAULT_MAX_STREAMS,
+    show_default=True,
+    help="Maximum number of concurrent HTTP/2 streams to the same origin, with --multiplex",
+)
+@click.option(
+    "cassette",
+    "--cassette",
+    type=click.Path(dir_okay=False),
+    help="Record the test results to, or replay them from, this cassette file, see --cassette-mode",
+)
+@click.option(
+    "cassette_mode",
+    "--cassette-mode",
+    type=click.Choice(CASSETTE_MODES),
+    default=REPLAY,
+    show_default=True,
+    help="With --cassette: `record` fires all the requests and records their results, `replay` never fires any request, and `once` only fires the requests that weren't recorded yet",
+)
+@click.option(
+    "bench",
+    "--bench",
+    is_flag=True,
+    help="Benchmark mode: replay the tests and report latency percentiles, throughput and errors",
+)
+@click.option(
+    "rps",
+    "--rps",
+    type=click.FloatRange(min=0, min_open=True),
+    help="Benchmark mode: send requests open-loop at this overall rate per second. "
+    "Without it, --jobs requests are kept in flight at all times",
+)
+@click.option(
+    "duration",
+    "--duration",
+    help="Benchmark mode: how long to replay the tests for (f.ex. `60s`)",
+)
+@click.option(
+    "iterations",
+    "--iterations",
+    type=click.IntRange(min=1),
+    help="Benchmark mode: how many times to replay each test",
+)
+@click.option(
+    "ws_connections",
+    "--ws-connections",
+    default=10,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Benchmark mode: number of concurrent connections to open for each websocket test",
+)
+@click.option(
+    "ws_messages",
+    "--ws-messages",
+    default=10,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Benchmark mode: number of messages to send on each websocket connection",
+)
+@click.option(
+    "ws_rate",
+    "--ws-rate",
+    default=10.0,
+    show_default=True,
+    type=click.FloatRange(min=0, min_open=True),
+    help="Benchmark mode: messages per second to send on each websocket connection",
+)
+@click.option(
+    "monitor",
+    "--monitor",
+    is_flag=True,
+    help="Monitor mode: keep running each test file on its own schedule, until stopped",
+)
+@click.option(
+    "interval",
+    "--interval",
+    default="60s",
+    show_default=True,
+    help="Monitor mode: how often to run each test file, unless set in the file itself (f.ex. `5m`)",
+)
+@click.option(
+    "jitter",
+    "--jitter",
+    default="0s",
+    show_default=True,
+    help="Monitor mode: random delay added to each run, unless set in the file itself (f.ex. `10s`)",
+)
+@click.option(
+    "spec_cache",
+    "--spec-cache",
+    is_flag=True,
+    help="Cache the loaded test files on disk, to skip rendering and parsing them again while unchanged. Not for templates whose output changes on each run",
+)
+@click.option(
+    "clear_cache",
+    "--clear-cache",
+    is_flag=True,
+    help="Clear the cache of previously loaded test files before running",
+)
+@click.option(
+    "shard",
+    "--shard",
+    callback=validate_shard,
+    help="Only run the K-th of N shards of the tests (f.ex. `--shard 2/4`), to split the tests across several machines",
+)
+@click.option(
+    "durations_file",
+    "--durations",
+    type=click.Path(exists=True),
+    help="JSON file with the test durations of a previous run, used to balance the --shard test split",
+)
+@click.option(
+    "results_file",
+    "--results-file",
+    type=click.Path(),
+    help="Write the test results to this JSON lines file, to be merged with http-test-merge-results.py",
+)
+@click.option(
+    "junit_file",
+    "--junit-file",
+    type=click.Path(),
+    help="Write the test results to this JUnit XML file",
+)
+@click.option(
+    "metrics_file",
+    "--metrics-file",
+    type=click.Path(),
+    help="Write the test results as Prometheus metrics to this file, f.ex. for the node exporter's textfile collector",
+)
+@click.option(
+    "metrics_port",
+    "--metrics-port",
+    type=click.IntRange(min=0, max=65535),
+    help="Serve the test results as Prometheus metrics at http://<host>:<port>/metrics. Mostly useful with --monitor",
+)
+@click.option(
+    "deadline",
+    "--deadline",
+    help="Maximum duration of the whole run (or of each run, with --monitor), f.ex. `5m`. Tests still running or not started yet by then fail as timed out",
+)
+@click.option(
+    "baseline_file",
+    "--baseline",
+    type=click.Path(),
+    help="Record the response time of each test, per target host, in this SQLite file",
+)
+@click.option(
+    "check_baseline",
+    "--check-baseline",
+    is_flag=True,
+    help="Compare the recent response times of each test with its --baseline, and exit with an error if any test is slower",
+)
+@click.option(
+    "baseline_tolerance",
+    "--baseline-tolerance",
+    type=click.FloatRange(min=0),
+    default=20.0,
+    show_default=True,
+    help="How much slower than its baseline median (in %) the median of a test's recent response times must be to fail --check-baseline",
+)
+def run_tests(
+    test_files,
+    target_host=None,
+    template_vars=None,
+    verbose=False,
+    concurrency=1,
+    workers=1,
+    ws_concurrency=None,
+    max_body_size=None,
+    share_requests=False,
+    multiplex=False,
+    max_streams=DEFAULT_MAX_STREAMS,
+    cassette=None,
+    cassette_mode=REPLAY,
+    bench=False,
+    rps=None,
+    duration=None,
+    iterations=None,
+    ws_connections=10,
+    ws_messages=10,
+    ws_rate=10.0,
+    monitor=False,
+    interval="60s",
+    jitter="0s",
+    spec_cache=False,
+    clear_cache=False,
+    shard=None,
+    durations_file=None,
+    results_file=None,
+    junit_file=None,
+    metrics_file=None,
+    metrics_port=None,
+    deadline=None,
+    baseline_file=None,
+    check_baseline=False,
+    baseline_tolerance=20.0,
+):
     template_vars_dict = dict((x.split("=") for x in template_vars))
-    fail_count = run_specfiles(test_files, target_host=target_host, template_vars=template_vars_dict, verbose=verbose)
+
+    targets = list(target_host)
+    if len(set(targets)) != len(targets):
+        raise click.BadParameter("The same target host can't be given more than once", param_hint="--target-host")
+    target_host = targets[0] if len(targets) == 1 else None
+    # Each test request is already sent to all the targets at the same time
+    if len(targets) > 1 and (
+        bench or monitor or concurrency > 1 or workers > 1 or shard or share_requests or multiplex
+    ):
+        raise click.UsageError(
+            "Multiple --target-host options can't be combined with --bench, --monitor, --jobs, --workers, --shard, "
+            "--share-requests or --multiplex"
+        )
+
+    # Settings added to the config of every test, also sent to the workers
+    run_config = {}
+
+    if max_body_size:
+        try:
+            parse_size(max_body_size)
+        except ValueError:
+            raise click.BadParameter(f"Invalid size '{max_body_size}'", param_hint="--max-body-size")
+        run_config["max_body_size"] = max_body_size
+
+    if cassette:
+        if cassette_mode == REPLAY and not os.path.exists(cassette):
+            raise click.BadParameter(f"Cassette '{cassette}' doesn't exist", param_hint="--cassette")
+        run_config["cassette"] = cassette
+        run_config["cassette_mode"] = cassette_mode
+    if deadline:
+        try:
+            deadline = parse_duration(deadline)
+        except ValueError:
+            raise click.BadParameter(f"Invalid duration '{deadline}'", param_hint="--deadline")
+
+    # Open-loop benchmarks don't depend on --jobs
+    if multiplex and concurrency <= 1 and not (bench and rps):
+        raise click.UsageError("--multiplex needs more than one request in flight at a time, see --jobs")
+
+    if check_baseline and not baseline_file:
+        raise click.UsageError("--check-baseline needs a --baseline file")
+    durations = load_durations(durations_file) if durations_file else None
+
+    if clear_cache:
+        SpecCache().clear()
+    cache = SpecCache() if spec_cache else None
+
+    if bench:
+        if not duration and not iterations:
+            raise click.UsageError("Benchmark mode needs either --duration or --iterations")
+
+        with reporting_spec_errors():
+            fail_count = bench_specfiles(
+                test_files,
+                target_host=target_host,
+                template_vars=template_vars_dict,
+                rps=rps,
+                duration=parse_duration(duration) if duration else None,
+                iterations=iterations,
+                concurrency=concurrency,
+                ws_connections=ws_connections,
+                ws_messages=ws_messages,
+                ws_rate=ws_rate,
+                cache=cache,
+                run_config=run_config,
+                shard=shard,
+                durations=durations,
+                multiplex=multiplex,
+                max_streams=max_streams,
+            )
+        sys.exit(fail_count)
+
+    result_sinks = []
+    if results_file:
+        extra = {"shard": f"{shard[0]}/{shard[1]}"} if shard else None
+        result_sinks.append(JsonLinesWriter(results_file, extra=extra))
+    if junit_file:
+        result_sinks.append(JUnitXmlWriter(junit_file))
+    if metrics_file:
+        result_sinks.append(TextfileExporter(metrics_file))
+    if metrics_port is not None:
+        result_sinks.append(HttpExporter(metrics_port))
+
+    baseline = None
+    if baseline_file:
+        baseline = BaselineStore(baseline_file, check=check_baseline, tolerance=baseline_tolerance / 100)
+        result_sinks.append(baseline)
+
+    if len(targets) > 1:
+        with reporting_spec_errors():
+            fail_count = fan_out_specfiles(
+                test_files,
+                targets,
+                template_vars=template_vars_dict,
+                verbose=verbose,
+                cache=cache,
+                run_config=run_config,
+                result_sinks=result_sinks,
+                deadline=deadline,
+            )
+
+        for sink in result_sinks:
+            sink.close()
+        if baseline is not None:
+            fail_count += len(baseline.regressions)
+        sys.exit(fail_count)
+
+    if monitor:
+        try:
+            interval = parse_interval(interval)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--interval")
+        suites = [
+            MonitoredSuite(
+                test_file,
+                interval=interval,
+                jitter=parse_duration(jitter),
+                target_host=target_host,
+                template_vars=template_vars_dict,
+                cache=cache,
+                run_config=run_config,
+            )
+            for test_file in test_files
+        ]
+        test_monitor = Monitor(
+            suites,
+            concurrency=concurrency,
+            ws_concurrency=ws_concurrency,
+            share_requests=share_requests,
+            verbose=verbose,
+            result_sinks=result_sinks,
+            deadline=deadline,
+        )
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: test_monitor.stop())
+        try:
+            test_monitor.run()
+        except KeyboardInterrupt:
+            pass
+
+        for sink in result_sinks:
+            sink.close()
+        sys.exit(0)
+
+    with reporting_spec_errors():
+        fail_count = run_specfiles(
+            test_files,
+            target_host=target_host,
+            template_vars=template_vars_dict,
+            verbose=verbose,
+            concurrency=concurrency,
+            ws_concurrency=ws_concurrency,
+            cache=cache,
+            run_config=run_config,
+            workers=workers,
+            shard=shard,
+            durations=durations,
+            result_sinks=result_sinks,
+            share_requests=share_requests,
+            deadline=deadline,
+            multiplex=multiplex,
+            max_streams=max_streams,
+        )
+
+    for sink in result_sinks:
+        sink.close()
+    if baseline is not None:
+        fail_count += len(baseline.regressions)
 
     # We need to sys.exit() right here if we want our shell to be able to
     # get the exit code with the number of failed tests.
@@ -0,0 +1,188 @@
+"""
+This module keeps a local store of the response times of each test, per
+target host, and flags the tests that have become slower than usual.
+
+Instead of a fixed `timing` threshold, the most recent response times of
+each test against each host are compared with the earlier ones: a test is
+flagged when the median of its recent samples is more than a given tolerance
+above the median of its baseline. Medians keep the occasional slow response
+from flagging a test, and a lasting slowdown gradually becomes the new
+baseline, as all the samples are stored.
+"""
+
+import sqlite3
+import statistics
+import time
+from pathlib import Path
+
+from http_test.runner import RED, RESET
+
+# Most recent samples kept for each test and host
+MAX_SAMPLES = 1000
+
+# A test isn't checked until its baseline has at least this many samples
+MIN_SAMPLES = 5
+
+# The most recent samples of a test, including those of the current run,
+# are compared with the baseline: the samples before them. A test isn't
+# checked until it has at least `MIN_RECENT_SAMPLES` recent samples.
+RECENT_SAMPLES = 5
+MIN_RECENT_SAMPLES = 3
+
+# Default tolerance, relative to the baseline percentile
+DEFAULT_TOLERANCE = 0.2
+
+# Shifts smaller than this are never flagged, as they're mostly noise
+MIN_SHIFT = 0.005
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    host TEXT NOT NULL,
+    test_id TEXT NOT NULL,
+    run_id INTEGER NOT NULL,
+    timestamp REAL NOT NULL,
+    elapsed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS samples_test ON samples (host, test_id, run_id);
+"""
+
+
+def record_samples(record: dict) -> list:
+    """
+    Returns the `(host, test_id, elapsed)` samples of a result record. Only
+    passed tests are sampled, as failed requests often fail fast, or only
+    after timing out. Fan-out records (see `http_test.fanout`) have one
+    sample for each target.
+    """
+    if record["status"] != "pass":
+        return []
+
+    if record.get("targets"):
+        return [(row["target"], record["id"], row["elapsed"]) for row in record["targets"] if row["elapsed"]]
+
+    if record.get("elapsed") is None:
+        return []
+
+    return [(record["host"], record["id"], record["elapsed"])]
+
+
+class BaselineStore:
+    """
+    A result sink (see `http_test.results`) storing the response time of
+    each test in an SQLite database.
+
+    The samples of a run are kept aside until the run is over, at `flush()`,
+    when they're stored. With `check`, the recent samples of each test are
+    then compared with its baseline, and the tests that are slower are
+    listed in `regressions`.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        check: bool = False,
+        tolerance: float = DEFAULT_TOLERANCE,
+        min_samples: int = MIN_SAMPLES,
+        max_samples: int = MAX_SAMPLES,
+        recent_samples: int = RECENT_SAMPLES,
+        min_recent_samples: int = MIN_RECENT_SAMPLES,
+    ):
+        self.path = Path(path)
+        self.check = check
+        self.tolerance = tolerance
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.recent_samples = recent_samples
+        self.min_recent_samples = min_recent_samples
+
+        self.db = sqlite3.connect(str(self.path))
+        self.db.executescript(SCHEMA)
+        (last_run_id,) = self.db.execute("SELECT MAX(run_id) FROM samples").fetchone()
+        self.run_id = (last_run_id or 0) + 1
+
+        self.samples = {}
+        self.regressions = []
+
+    def write(self, record: dict) -> None:
+        for host, test_id, elapsed in record_samples(record):
+            self.samples.setdefault((host, test_id), []).append(elapsed)
+
+    def stored_samples(self, host: str, test_id: str) -> list:
+        """
+        Returns the stored samples of a test, the most recent first.
+        """
+        rows = self.db.execute(
+            "SELECT elapsed FROM samples WHERE host = ? AND test_id = ? ORDER BY run_id DESC, rowid DESC LIMIT ?",
+            (host, test_id, self.max_samples),
+        )
+        return [elapsed for (elapsed,) in rows]
+
+    def compare(self, host: str, test_id: str) -> dict:
+        """
+        Returns the details of the regression if the recent samples of the
+        test are slower than its baseline, or else None.
+        """
+        samples = self.stored_samples(host, test_id)
+        recent, baseline = samples[: self.recent_samples], samples[self.recent_samples :]
+        if len(recent) < self.min_recent_samples or len(baseline) < self.min_samples:
+            return None
+
+        expected = statistics.median(baseline)
+        actual = statistics.median(recent)
+
+        if actual <= expected * (1 + self.tolerance) or actual - expected < MIN_SHIFT:
+            return None
+
+        return {
+            "host": host,
+            "id": test_id,
+            "baseline": expected,
+            "actual": actual,
+            "baseline_samples": len(baseline),
+            "recent_samples": len(recent),
+        }
+
+    def flush(self) -> None:
+        """
+        Ends the current run: stores its samples, and checks them if needed.
+        """
+        now = time.time()
+        self.regressions = []
+
+        with self.db:
+            for (host, test_id), samples in self.samples.items():
+                self.db.executemany(
+                    "INSERT INTO samples (host, test_id, run_id, timestamp, elapsed) VALUES (?, ?, ?, ?, ?)",
+                    [(host, test_id, self.run_id, now, elapsed) for elapsed in samples],
+                )
+                self.prune(host, test_id)
+
+                regression = self.compare(host, test_id) if self.check else None
+                if regression is not None:
+                    self.regressions.append(regression)
+
+        for regression in self.regressions:
+            print_regression(regression)
+
+        self.samples = {}
+        self.run_id += 1
+
+    def prune(self, host: str, test_id: str) -> None:
+        self.db.execute(
+            "DELETE FROM samples WHERE host = ? AND test_id = ? AND rowid NOT IN "
+            "(SELECT rowid FROM samples WHERE host = ? AND test_id = ? ORDER BY run_id DESC, rowid DESC LIMIT ?)",
+            (host, test_id, host, test_id, self.max_samples),
+        )
+
+    def close(self) -> None:
+        if self.samples:
+            self.flush()
+        self.db.close()
+
+
+def print_regression(regression: dict) -> None:
+    print(
+        f"{RED}Slower than baseline:{RESET} {regression['id']} on {regression['host']}: "
+        f"median {regression['actual'] * 1000:.1f}ms ({regression['recent_samples']} recent samples), "
+        f"baseline {regression['baseline'] * 1000:.1f}ms ({regression['baseline_samples']} samples)"
+    )
@@ -0,0 +1,257 @@
+"""
+This module replays the spec tests at a target request rate, and reports
+latency percentiles, throughput and errors for each of them.
+
+Requests are sent open-loop: each one is scheduled at a fixed time according
+to the target rate, regardless of how long the previous ones took. Latency is
+measured from the scheduled time rather than from the time the request was
+actually sent, which corrects for coordinated omission: if the target (or the
+client itself) stalls, the requests that should have been sent in the
+meantime are accounted for with their full waiting time.
+"""
+
+import time
+from urllib.parse import urlparse
+
+import pycurl
+
+from http_test.cache import SpecCache
+from http_test.histogram import LatencyHistogram, format_percentiles
+from http_test.multi import DEFAULT_MAX_STREAMS, CurlMultiDriver
+from http_test.runner import RED, RESET, iter_spec_tests
+from http_test.spec import SpecTest, url_from_spec
+from http_test.ws_load import print_ws_report, ws_load
+from http_test.ws_request import get_background_loop
+
+# Upper limit to the number of requests in flight at the same time
+# in open-loop mode, to avoid running out of file descriptors
+MAX_IN_FLIGHT = 1000
+
+
+class BenchStats:
+    """
+    Collects the benchmark results of a single spec test.
+    """
+
+    def __init__(self, spec: SpecTest):
+        self.spec = spec
+        self.latency = LatencyHistogram()
+        self.service_time = LatencyHistogram()
+        self.count = 0
+        self.errors = {}
+
+    def record(self, latency_s: float, service_time_s: float, error: str = None) -> None:
+        self.count += 1
+        self.latency.record(latency_s)
+        self.service_time.record(service_time_s)
+
+        if error is not None:
+            self.errors[error] = self.errors.get(error, 0) + 1
+
+    def error_count(self) -> int:
+        return sum(self.errors.values())
+
+
+def is_websockets_spec(spec: SpecTest) -> bool:
+    return urlparse(url_from_spec(spec.spec)).scheme in ("ws", "wss")
+
+
+def classify_error(spec: SpecTest, result: dict, error: pycurl.error) -> str:
+    """
+    Returns a short description of what went wrong with a request, or None
+    if the request succeeded. Requests failing in the same way share the
+    same description, so they can be counted together.
+    """
+    if error is not None:
+        return f"curl error {error.args[0]}"
+
+    try:
+        spec.verify(result)
+    except AssertionError as e:
+        return str(e).splitlines()[0] if str(e) else "assertion failed"
+
+    return None
+
+
+def run_benchmark(
+    specs: list,
+    rps: float = None,
+    duration: float = None,
+    iterations: int = None,
+    concurrency: int = 1,
+    max_in_flight: int = MAX_IN_FLIGHT,
+    multiplex: bool = False,
+    max_streams: int = DEFAULT_MAX_STREAMS,
+):
+    """
+    Replays the given tests, round-robin, until either `duration` seconds
+    have passed or each test has been replayed `iterations` times.
+
+    With `rps`, requests are sent open-loop at that overall rate. Without it,
+    `concurrency` requests are kept in flight at all times (closed-loop).
+    With `multiplex`, HTTP/2 requests share a single connection per origin
+    (see `CurlMultiDriver`), and the time they spend waiting for a free
+    stream counts towards their latency.
+
+    Returns a `(stats, elapsed)` tuple, where `stats` is a list of
+    `BenchStats`, one for each test.
+    """
+    stats = [BenchStats(spec) for spec in specs]
+    if not stats:
+        return stats, 0.0
+
+    total_requests = iterations * len(stats) if iterations else None
+    interval = 1 / rps if rps else None
+
+    driver = CurlMultiDriver(multiplex=multiplex, max_streams=max_streams)
+    sent = 0
+    start_time = time.monotonic()
+    end_time = start_time + duration if duration else None
+
+    try:
+        while True:
+            now = time.monotonic()
+            more_to_send = (total_requests is None or sent < total_requests) and (end_time is None or now < end_time)
+
+            while more_to_send:
+                if interval is not None:
+                    scheduled_time = start_time + sent * interval
+                    if scheduled_time > now or len(driver) >= max_in_flight:
+                        break
+                else:
+                    scheduled_time = now
+                    if len(driver) >= concurrency:
+                        break
+
+                test_stats = stats[sent % len(stats)]
+                driver.add(test_stats.spec.build_request(), tag=(test_stats, scheduled_time, time.monotonic()))
+                sent += 1
+                more_to_send = total_requests is None or sent < total_requests
+
+            if not more_to_send and not len(driver):
+                break
+
+            timeout = 1.0
+            if more_to_send and interval is not None and len(driver) < max_in_flight:
+                timeout = max(0.0, start_time + sent * interval - time.monotonic())
+
+            if not len(driver):
+                time.sleep(timeout)
+                continue
+
+            for (test_stats, scheduled_time, sent_time), result, error in driver.poll(timeout):
+                now = time.monotonic()
+                test_stats.record(
+                    latency_s=now - scheduled_time,
+                    service_time_s=now - sent_time,
+                    error=classify_error(test_stats.spec, result, error),
+                )
+    finally:
+        driver.close()
+
+    return stats, time.monotonic() - start_time
+
+
+def print_report(stats: list, elapsed: float, open_loop: bool) -> None:
+    total_count = sum(s.count for s in stats)
+    total_errors = sum(s.error_count() for s in stats)
+    throughput = total_count / elapsed if elapsed else 0.0
+
+    print(f"{total_count} requests in {elapsed:.2f}s, {throughput:.1f} req/s, {total_errors} errors")
+
+    for test_stats in stats:
+        count = test_stats.count
+        errors = test_stats.error_count()
+        throughput = count / elapsed if elapsed else 0.0
+
+        print()
+        print(test_stats.spec.describe())
+        print(f"    requests: {count} (ok {count - errors}, errors {errors}), throughput {throughput:.1f} req/s")
+
+        if open_loop:
+            # Measured from the time each request was scheduled to be sent
+            print(f"    latency:  {format_percentiles(test_stats.latency)}")
+        print(f"    service:  {format_percentiles(test_stats.service_time)}")
+
+        for error, error_count in sorted(test_stats.errors.items(), key=lambda e: -e[1]):
+            print(f"    {RED}{error_count}x {error}{RESET}")
+
+
+def bench_specfiles(
+    test_files: list,
+    target_host: str = None,
+    template_vars: dict = None,
+    rps: float = None,
+    duration: float = None,
+    iterations: int = None,
+    concurrency: int = 1,
+    ws_connections: int = 10,
+    ws_messages: int = 10,
+    ws_rate: float = 10.0,
+    cache: SpecCache = None,
+    shard: tuple = None,
+    durations: dict = None,
+    multiplex: bool = False,
+    max_streams: int = DEFAULT_MAX_STREAMS,
+    run_config: dict = None,
+):
+    """
+    Benchmarks the tests in the given YAML files, and prints a report.
+    Websocket tests are load tested with `ws_connections` concurrent
+    connections, each sending `ws_messages` messages at `ws_rate`
+    messages per second. The `run_config` settings apply to all the tests,
+    see `run_specfiles()`.
+
+    Returns the number of tests that had at least one failed request.
+    """
+    specs = []
+    ws_specs = []
+    all_specs = iter_spec_tests(
+        test_files,
+        target_host=target_host,
+        template_vars=template_vars,
+        cache=cache,
+        shard=shard,
+        durations=durations,
+        run_config=run_config,
+    )
+    for spec in all_specs:
+        if spec.skip():
+            continue
+        if is_websockets_spec(spec):
+            ws_specs.append(spec)
+        else:
+            specs.append(spec)
+
+    fail_count = 0
+
+    if specs:
+        stats, elapsed = run_benchmark(
+            specs,
+            rps=rps,
+            duration=duration,
+            iterations=iterations,
+            concurrency=concurrency,
+            multiplex=multiplex,
+            max_streams=max_streams,
+        )
+
+        print_report(stats, elapsed, open_loop=rps is not None)
+        fail_count += sum(1 for s in stats if s.error_count())
+
+    for spec in ws_specs:
+        request = spec.build_request()
+        ws_stats = get_background_loop().run(
+            ws_load(
+                request.websockets_connect_params(),
+                message=request.payload or "Hello",
+                connections=ws_connections,
+                messages=ws_messages,
+                rate=ws_rate,
+            )
+        )
+
+        print_ws_report(spec.describe(), ws_stats)
+        fail_count += 1 if ws_stats.error_count() else 0
+
+    return fail_count
@@ -0,0 +1,83 @@
+"""
+This module implements the buffers holding the response bodies while they
+are downloaded, so that large responses don't have to fit in memory.
+"""
+
+import mmap
+import tempfile
+from io import BytesIO
+
+# Bodies larger than this are spilled to a temporary file
+MAX_IN_MEMORY_BODY_SIZE = 1024 * 1024
+
+
+class SpillBuffer:
+    """
+    A write-only buffer that keeps its content in memory up to `max_memory`
+    bytes, and spills it to an anonymous temporary file beyond that.
+    """
+
+    def __init__(self, max_memory: int = MAX_IN_MEMORY_BODY_SIZE):
+        self.max_memory = max_memory
+        self.buffer = BytesIO()
+        self.file = None
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+
+        if self.file is None and self.size > self.max_memory:
+            self.file = tempfile.TemporaryFile(prefix="http-test-")
+            self.file.write(self.buffer.getbuffer())
+            self.buffer = None
+
+        if self.file is not None:
+            return self.file.write(data)
+
+        return self.buffer.write(data)
+
+    def is_spilled(self) -> bool:
+        return self.file is not None
+
+    def getvalue(self):
+        """
+        Returns the content as `bytes` if it was kept in memory, or else as
+        a read-only memory map of the temporary file. Memory maps can be
+        sliced and searched like `bytes`, and their pages are loaded from,
+        and dropped back to, the file as needed.
+        """
+        if self.file is None:
+            return self.buffer.getvalue()
+
+        self.file.flush()
+        return mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self) -> None:
+        # An existing memory map stays valid after its file is closed
+        if self.file is not None:
+            self.file.close()
+        self.buffer = None
+        self.file = None
+
+
+class DiscardBuffer:
+    """
+    A buffer that only counts the bytes written to it, for response bodies
+    that are checked on the fly, f.ex. hashed, but never needed as a whole.
+    """
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        return len(data)
+
+    def is_spilled(self) -> bool:
+        return False
+
+    def getvalue(self) -> bytes:
+        return b""
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,77 @@
+"""
+This module implements an on-disk cache of the tests loaded from the YAML
+spec files, so that repeated runs of the same files can skip the Jinja2
+rendering and YAML parsing steps.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+from http_test import __version__
+
+
+def default_cache_dir() -> Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(cache_home) / "py-http-auto-test"
+
+
+class SpecCache:
+    """
+    Cache entries are keyed by the content of the YAML file and by all the
+    template variables used to render it, so any change to either of them
+    results in a cache miss.
+
+    Note that YAML files whose Jinja2 templates produce a different output
+    on each run (f.ex. using `random`) shouldn't be cached.
+    """
+
+    def __init__(self, directory: Path = None):
+        self.directory = Path(directory) if directory else default_cache_dir()
+
+    def key(self, content: bytes, template_vars: dict) -> str:
+        h = hashlib.sha256()
+        h.update(__version__.encode())
+        h.update(content)
+        h.update(json.dumps(template_vars, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.pickle"
+
+    def get(self, key: str):
+        """
+        Returns the cached tests for the given key, or None.
+        """
+        try:
+            with self.path(key).open("rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Corrupted or incompatible entry, treat it as a miss
+            return None
+
+    def put(self, key: str, tests: list) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temporary file first, so concurrent runs never
+        # read a partially written entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(tests, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def clear(self) -> None:
+        if not self.directory.is_dir():
+            return
+
+        for entry in self.directory.glob("*.pickle"):
+            entry.unlink()
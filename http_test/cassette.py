@@ -0,0 +1,126 @@
+"""
+This module records the results of the test requests to a cassette file, and
+replays them later without sending any request, f.ex. to run a large suite
+offline while working on its tests.
+
+A cassette is an SQLite file with the results keyed by request fingerprint
+(see `Request.fingerprint()`): the status code, headers, timings and sizes
+as JSON, and the decoded response body, compressed.
+"""
+
+import json
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+
+from http_test.headers import ResponseHeaders
+
+# Always fire the requests, and record their results
+RECORD = "record"
+# Never fire the requests, only replay the recorded results
+REPLAY = "replay"
+# Replay the recorded results, fire and record the other requests
+ONCE = "once"
+
+CASSETTE_MODES = (RECORD, REPLAY, ONCE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    fingerprint TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    result TEXT NOT NULL,
+    body BLOB NOT NULL
+);
+"""
+
+# Results are recorded without their bodies, that are stored separately,
+# nor what is specific to a single request
+UNRECORDED_KEYS = ("response_body", "response_body_decoded", "body_matches", "request_id", "request_headers")
+
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+
+def json_default(value):
+    if isinstance(value, ResponseHeaders):
+        return value.as_dict()
+    # F.ex. exceptions
+    if hasattr(value, "items"):
+        return dict(value.items())
+    return str(value)
+
+
+class Cassette:
+    """
+    Records and replays request results. Results can be recorded and
+    replayed from any thread, f.ex. by the websocket event loop, and by
+    many processes, f.ex. with `--workers`.
+    """
+
+    def __init__(self, path: Path, mode: str = REPLAY):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode '{mode}', expected one of: {', '.join(CASSETTE_MODES)}")
+
+        self.path = Path(path)
+        self.mode = mode
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        # Readers don't block the writers, f.ex. other worker processes
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def replay(self, fingerprint: str, url: str) -> dict:
+        """
+        Returns the recorded result of a request, or None if it has to be
+        fired. In replay mode, requests without a recorded result get an
+        error result instead.
+        """
+        if self.mode == RECORD:
+            return None
+
+        with self.lock:
+            row = self.db.execute("SELECT result, body FROM results WHERE fingerprint = ?", (fingerprint,)).fetchone()
+
+        if row is None:
+            if self.mode == ONCE:
+                return None
+            return {"status_code": 0, "error": f"No recorded result for {url} in cassette {self.path}"}
+
+        result = json.loads(row[0])
+        body = zlib.decompress(row[1])
+        result.update(response_body=body, response_body_decoded=body, replayed=True)
+
+        return result
+
+    def record(self, fingerprint: str, url: str, result: dict) -> None:
+        if self.mode == REPLAY or result.get("replayed"):
+            return
+
+        recorded_result = {key: value for key, value in result.items() if key not in UNRECORDED_KEYS}
+        body = result.get("response_body_decoded")
+        if body is None:
+            body = b""
+
+        row = (fingerprint, url, json.dumps(recorded_result, default=json_default), zlib.compress(body))
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO results (fingerprint, url, result, body) VALUES (?, ?, ?, ?)", row)
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.close()
+
+
+def get_cassette(path: str, mode: str = REPLAY) -> Cassette:
+    """
+    Returns the cassette for the given path and mode, opened only once
+    for each process.
+    """
+    key = (str(path), mode)
+
+    with _cassettes_lock:
+        if key not in _cassettes:
+            _cassettes[key] = Cassette(path, mode)
+
+    return _cassettes[key]
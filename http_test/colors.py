@@ -0,0 +1,8 @@
+"""
+This module holds the ANSI escape codes coloring the terminal output.
+"""
+
+RED = "\033[91m"
+GREEN = "\033[92m"
+YELLOW = "\033[93m"
+RESET = "\033[0m"
@@ -0,0 +1,176 @@
+"""
+This module decodes (decompresses) response bodies incrementally, one chunk
+at a time, based on the `content-encoding` response header.
+"""
+
+import zlib
+
+import brotli
+
+from http_test.headers import as_response_headers
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Decoded bodies larger than this are considered decompression bombs
+DEFAULT_MAX_DECODED_SIZE = 128 * 1024 * 1024
+
+# Decompressors that can't limit their output size are fed small slices of
+# their input, and their output is checked after each slice. Slices grow
+# while the output stays well within the limit, so that regular bodies are
+# still decompressed in a few calls.
+MIN_INPUT_SLICE = 16
+MAX_INPUT_SLICE = 64 * 1024
+
+# Newer versions of brotli can limit the output size by themselves
+BROTLI_HAS_OUTPUT_LIMIT = hasattr(brotli.Decompressor, "can_accept_more_data")
+
+
+def decompress_in_slices(process, chunk: bytes, max_length: int) -> bytes:
+    """
+    Decompresses `chunk` with the `process` function, one input slice at a
+    time, and raises `ValueError` as soon as the output grows larger than
+    `max_length` bytes.
+    """
+    output = []
+    size = 0
+    position = 0
+    slice_size = MIN_INPUT_SLICE
+
+    while position < len(chunk):
+        data = process(chunk[position : position + slice_size])
+        position += slice_size
+        size += len(data)
+        if size >= max_length:
+            raise ValueError("Decoded response body exceeds the maximum allowed size")
+        output.append(data)
+
+        if len(data) * 16 < max_length - size:
+            slice_size = min(slice_size * 2, MAX_INPUT_SLICE)
+        else:
+            slice_size = MIN_INPUT_SLICE
+
+    return b"".join(output)
+
+
+class ZlibDecoder:
+    """
+    Handles both the `gzip` and `deflate` encodings. Servers are known
+    to send raw deflate streams instead of zlib-wrapped ones for `deflate`,
+    so we look at the first bytes to figure out which one we got.
+    """
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        self.decompressor = None
+        if encoding in ("gzip", "x-gzip"):
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, chunk: bytes, max_length: int) -> bytes:
+        if self.decompressor is None:
+            is_zlib_wrapped = len(chunk) >= 2 and (chunk[0] & 0x0F) == 8 and (chunk[0] << 8 | chunk[1]) % 31 == 0
+            self.decompressor = zlib.decompressobj(zlib.MAX_WBITS if is_zlib_wrapped else -zlib.MAX_WBITS)
+
+        # Limiting the output size means a tiny chunk can't be inflated
+        # into gigabytes of data before we get to check its size.
+        data = self.decompressor.decompress(chunk, max_length)
+        if self.decompressor.unconsumed_tail:
+            raise ValueError("Decoded response body exceeds the maximum allowed size")
+
+        return data
+
+    def flush(self) -> bytes:
+        return self.decompressor.flush() if self.decompressor is not None else b""
+
+
+class BrotliDecoder:
+    def __init__(self, encoding: str):
+        self.decompressor = brotli.Decompressor()
+
+    def decompress(self, chunk: bytes, max_length: int) -> bytes:
+        if BROTLI_HAS_OUTPUT_LIMIT:
+            # Any output beyond the limit fails the size check anyway
+            return self.decompressor.process(chunk, output_buffer_limit=max_length)
+        return decompress_in_slices(self.decompressor.process, chunk, max_length)
+
+    def flush(self) -> bytes:
+        return b""
+
+
+class ZstdDecoder:
+    def __init__(self, encoding: str):
+        if zstandard is None:
+            raise ValueError("Can't decode zstd response body: the `zstandard` package is not installed")
+        self.decompressor = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, chunk: bytes, max_length: int) -> bytes:
+        return decompress_in_slices(self.decompressor.decompress, chunk, max_length)
+
+    def flush(self) -> bytes:
+        return b""
+
+
+DECODERS = {
+    "gzip": ZlibDecoder,
+    "x-gzip": ZlibDecoder,
+    "deflate": ZlibDecoder,
+    "br": BrotliDecoder,
+    "zstd": ZstdDecoder,
+}
+
+
+class ResponseDecoder:
+    """
+    Decodes a response body according to the given `content-encoding`
+    header value. Feed the raw body with `decode()`, and call `flush()`
+    once the whole body has been received.
+
+    Raises `ValueError` for unsupported encodings, or as soon as the
+    decoded body grows larger than `max_size` bytes.
+    """
+
+    def __init__(self, content_encoding: str, max_size: int = DEFAULT_MAX_DECODED_SIZE):
+        self.max_size = max_size
+        self.size = 0
+
+        # Multiple encodings are listed in the order they were applied,
+        # so they have to be decoded in reverse order
+        encodings = [e.strip().lower() for e in content_encoding.split(",")]
+        encodings = [e for e in encodings if e and e != "identity"]
+
+        self.decoders = []
+        for encoding in reversed(encodings):
+            if encoding not in DECODERS:
+                raise ValueError(f"Unsupported content-encoding '{encoding}'")
+            self.decoders.append(DECODERS[encoding](encoding))
+
+    def decode(self, chunk: bytes) -> bytes:
+        for decoder in self.decoders:
+            chunk = decoder.decompress(chunk, self.max_size - self.size + 1)
+        return self.check_size(chunk)
+
+    def flush(self) -> bytes:
+        data = b""
+        for decoder in self.decoders:
+            if data:
+                data = decoder.decompress(data, self.max_size - self.size + 1)
+            data += decoder.flush()
+        return self.check_size(data)
+
+    def check_size(self, data: bytes) -> bytes:
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise ValueError(f"Decoded response body exceeds the maximum allowed size of {self.max_size} bytes")
+        return data
+
+
+def get_content_encoding(response_headers) -> str:
+    """
+    Returns the `content-encoding` response header value, if any.
+    """
+    content_encodings = as_response_headers(response_headers).getall("content-encoding")
+    if not content_encodings:
+        return None
+    return ",".join(content_encodings)
@@ -0,0 +1,230 @@
+"""
+This module sends each test request to several target hosts at the same
+time, f.ex. the old and the new servers during a rollout, verifies each
+response against the test requirements, and compares the responses with
+each other.
+
+Response bodies are compared through a SHA-256 hash of their decoded
+content, computed while they're being downloaded. Unless the test has body
+requirements, the bodies aren't kept at all.
+"""
+
+import concurrent.futures
+import hashlib
+import time
+
+from http_test.cache import SpecCache
+from http_test.colors import GREEN, RED, RESET
+from http_test.headers import as_response_headers
+from http_test.multi import CurlMultiDriver
+from http_test.runner import DEADLINE_EXCEEDED, is_past_deadline, iter_spec_tests, print_result_record, result_record
+from http_test.spec import SpecTest, request_from_spec
+from http_test.ws_request import get_background_loop
+
+# Headers compared across targets, unless `compare_headers` is set
+# in the test, or at the top level of the YAML file
+DEFAULT_COMPARE_HEADERS = ("content-type",)
+
+# Requirements that need the whole response body
+BODY_REQUIREMENTS = ("body", "body_regex")
+
+
+def compare_headers_of(spec: SpecTest) -> list:
+    compare_headers = spec.spec.get("compare_headers", spec.spec["config"].get("compare_headers"))
+    if compare_headers is None:
+        compare_headers = DEFAULT_COMPARE_HEADERS
+    return [header.strip().lower() for header in compare_headers]
+
+
+def fire_to_targets(spec: SpecTest, targets: list, deadline: float = None) -> dict:
+    """
+    Sends the test request to all the targets at the same time.
+    Returns a dict with the `(result, error)` tuple of each target.
+    """
+    match = spec.spec.get("match") or {}
+    keep_body = any(requirement in match for requirement in BODY_REQUIREMENTS)
+
+    driver = CurlMultiDriver()
+    ws_futures = {}
+    outcomes = {}
+
+    try:
+        for target in targets:
+            # Each target replaces any connect-to setting of the test
+            test_config = dict(spec.spec["config"], target_host=target, connect_to=None)
+            request = request_from_spec(spec.spec, test_config, body_matcher=spec.requirements.body_matcher)
+            request.hash_body = True
+            request.keep_body = keep_body
+            request.deadline = deadline
+
+            if request.is_websockets_request():
+                ws_futures[get_background_loop().submit(request.websockets_request())] = (target, request)
+            else:
+                driver.add(request, tag=target)
+
+        while len(driver):
+            for target, result, error in driver.poll():
+                outcomes[target] = (result, error)
+
+        for future in concurrent.futures.as_completed(ws_futures):
+            target, request = ws_futures[future]
+            try:
+                outcomes[target] = (request.decode_result(future.result()), None)
+            except Exception as e:
+                outcomes[target] = (None, e)
+    finally:
+        driver.close()
+
+    return outcomes
+
+
+def response_signature(result: dict, compare_headers: list) -> dict:
+    """
+    Returns what is compared across targets: the status, the selected
+    headers and the hash of the decoded body.
+    """
+    body_sha256 = result.get("body_sha256")
+    if body_sha256 is None:
+        # Websocket responses are small, and hashed only once complete
+        body_sha256 = hashlib.sha256(result.get("response_body_decoded") or b"").hexdigest()
+
+    signature = {"status": result.get("status_code")}
+    response_headers = as_response_headers(result.get("response_headers"))
+    for header in compare_headers:
+        signature[header] = response_headers.getall(header)
+    signature["body"] = body_sha256
+
+    return signature
+
+
+def fan_out_spec_test(spec: SpecTest, targets: list, deadline: float = None) -> tuple:
+    """
+    Runs a single test against all the targets. The test passes if all the
+    responses meet the test requirements, and they're all the same as the
+    response of the first target.
+
+    Returns a `(is_success, fail_reason, rows)` tuple, with a row of
+    details for each target.
+    """
+    compare_headers = compare_headers_of(spec)
+    outcomes = fire_to_targets(spec, targets, deadline)
+
+    rows = []
+    reference = reference_result = None
+    failures = []
+
+    for target in targets:
+        result, error = outcomes[target]
+        row = {"target": target, "status_code": None, "elapsed": None, "body_sha256": None, "differs": []}
+        rows.append(row)
+
+        if error is not None:
+            row["error"] = str(error)
+            failures.append(f"{target}: {error}")
+            continue
+
+        row.update(status_code=result.get("status_code"), elapsed=result.get("elapsed"))
+
+        try:
+            spec.verify(result)
+        except AssertionError as e:
+            row["error"] = str(e).splitlines()[0]
+            failures.append(f"{target}: {row['error']}")
+
+        signature = response_signature(result, compare_headers)
+        row["body_sha256"] = signature["body"]
+
+        if reference is None:
+            reference = (target, signature)
+            reference_result = result
+        else:
+            row["differs"] = [key for key, value in signature.items() if reference[1].get(key) != value]
+            if row["differs"]:
+                failures.append(f"{target}: differs from {reference[0]} in {', '.join(row['differs'])}")
+
+    # The first target's response is the one the test record refers to
+    spec.test_result = [reference_result] if reference_result else []
+
+    if failures:
+        return False, "\n".join(failures), rows
+
+    return True, spec.describe(), rows
+
+
+def print_fan_out_rows(rows: list) -> None:
+    target_width = max(len(row["target"]) for row in rows)
+
+    for row in rows:
+        elapsed = f"{row['elapsed'] * 1000:.1f}ms" if row["elapsed"] is not None else "-"
+        body_hash = row["body_sha256"][:12] if row["body_sha256"] else "-"
+        line = f"    {row['target']:<{target_width}}  {row['status_code'] or '-':>3}  {elapsed:>10}  {body_hash}"
+
+        if row.get("error"):
+            line += f"  {RED}{row['error']}{RESET}"
+        elif row["differs"]:
+            line += f"  {RED}differs: {', '.join(row['differs'])}{RESET}"
+        else:
+            line += f"  {GREEN}ok{RESET}"
+
+        print(line)
+
+
+def fan_out_specfiles(
+    test_files: list,
+    targets: list,
+    template_vars: dict = None,
+    verbose: bool = False,
+    cache: SpecCache = None,
+    result_sinks: list = None,
+    deadline: float = None,
+    run_config: dict = None,
+) -> int:
+    """
+    Runs all the tests in the given YAML files against all the `targets`.
+    Failed tests, or all of them with `verbose`, are printed along with each
+    target's response status, latency and body hash, side by side. With
+    a `deadline`, in seconds, the tests still running or not started yet
+    when the run has taken that long fail as timed out. The `run_config`
+    settings apply to all the tests, see `run_specfiles()`.
+    Returns the number of failed tests.
+    """
+    if len(set(targets)) != len(targets):
+        raise ValueError("The same target host can't be given more than once")
+
+    fail_count = 0
+    result_sinks = result_sinks or []
+
+    if deadline is not None:
+        deadline = time.time() + deadline
+
+    # All the tests are loaded, and validated, before the first request
+    specs = list(iter_spec_tests(test_files, template_vars=template_vars, cache=cache, run_config=run_config))
+
+    for spec in specs:
+        if spec.skip():
+            record = result_record(spec, True, "skipped")
+            rows = []
+        elif is_past_deadline(spec, deadline):
+            record = result_record(spec, False, DEADLINE_EXCEEDED)
+            rows = []
+        else:
+            is_success, fail_reason, rows = fan_out_spec_test(spec, targets, deadline)
+            record = result_record(spec, is_success, fail_reason)
+            record["targets"] = rows
+            spec.test_result = []
+
+        if verbose or record["status"] == "fail":
+            print_result_record(record)
+            if rows:
+                print_fan_out_rows(rows)
+
+        for sink in result_sinks:
+            sink.write(record)
+
+        if record["status"] == "fail":
+            fail_count += 1
+
+    for sink in result_sinks:
+        sink.flush()
+
+    return fail_count
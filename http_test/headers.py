@@ -0,0 +1,197 @@
+"""
+This module parses the response headers into `ResponseHeaders`, a compact,
+ordered and case-insensitive multidict, for both the pycurl and the
+websocket requests.
+"""
+
+# Most responses use the same few header names, so each raw name is decoded
+# and lowercased only once. The cache is bounded, as a server could send any
+# number of different names.
+MAX_CACHED_HEADER_NAMES = 4096
+
+# Lowercased header names, by raw name as received
+_header_names = {}
+
+
+class ResponseHeaders:
+    """
+    Response headers, by lowercased name, in the order they were received.
+    Lookups are case-insensitive: `get()` and `headers[name]` return the
+    first value of a header, `getall()` all of them.
+
+    Header lines are added with `parse_line()`, as received, and are also
+    kept in `raw_lines`. Only the headers of the last response are kept,
+    f.ex. the final response after a `100 Continue`, whose status line is
+    in `status_line`.
+    """
+
+    __slots__ = ("status_line", "raw_lines", "_values")
+
+    def __init__(self, headers=None):
+        self.status_line = None
+        self.raw_lines = []
+        # Lists of values, by lowercased name
+        self._values = {}
+
+        if headers is not None:
+            self.update(headers)
+
+    def parse_line(self, line: bytes) -> None:
+        """
+        Adds a raw header line, including the status line, the continuation
+        lines of folded headers and the empty line ending the headers.
+        """
+        name, _, value = line.partition(b":")
+
+        # Header lines with an already known name are the hot path, all the
+        # other lines are only known names once they've been checked
+        lowercase_name = _header_names.get(name)
+        if lowercase_name is None:
+            lowercase_name = self._parse_other_line(line, name)
+            if lowercase_name is None:
+                return
+
+        self.raw_lines.append(line)
+        value = value.strip().decode("iso-8859-1")
+
+        values = self._values.get(lowercase_name)
+        if values is None:
+            self._values[lowercase_name] = [value]
+        else:
+            values.append(value)
+
+    def _parse_other_line(self, line: bytes, name: bytes) -> str:
+        """
+        Returns the lowercased name of a header line not seen before, or
+        None after handling any other line.
+        """
+        if line[:1] in (b" ", b"\t"):
+            self._continue_header(line)
+            return None
+
+        if line.startswith(b"HTTP/"):
+            self.clear()
+            self.status_line = line.rstrip().decode("iso-8859-1")
+            self.raw_lines.append(line)
+            return None
+
+        if len(name) == len(line):
+            # No colon, f.ex. the empty line ending the headers
+            return None
+
+        lowercase_name = name.strip().decode("iso-8859-1").lower()
+        if len(_header_names) < MAX_CACHED_HEADER_NAMES:
+            _header_names[name] = lowercase_name
+        return lowercase_name
+
+    def _continue_header(self, line: bytes) -> None:
+        """
+        Appends a continuation line to the value of the header it folds.
+        """
+        value = line.strip()
+        if not value:
+            return
+
+        for header_line in reversed(self.raw_lines):
+            if header_line[:1] not in (b" ", b"\t"):
+                break
+        else:
+            return
+
+        name = header_line.partition(b":")[0].strip().decode("iso-8859-1").lower()
+        if name not in self._values:
+            # Not a header line, f.ex. the status line
+            return
+
+        values = self._values[name]
+        values[-1] = f"{values[-1]} {value.decode('iso-8859-1')}"
+        self.raw_lines.append(line)
+
+    def add(self, name: str, value: str) -> None:
+        name = name.strip().lower()
+        values = self._values.get(name)
+        if values is None:
+            self._values[name] = [value]
+        else:
+            values.append(value)
+
+    def update(self, headers) -> None:
+        """
+        Adds the headers of a dict, where repeated headers have a list of
+        values (see `as_dict()`), or of a list of `(name, value)` pairs.
+        """
+        items = headers.items() if hasattr(headers, "items") else headers
+        for name, value in items:
+            if isinstance(value, list):
+                for v in value:
+                    self.add(name, v)
+            else:
+                self.add(name, value)
+
+    def _lookup(self, name: str) -> list:
+        values = self._values.get(name)
+        if values is None:
+            values = self._values.get(name.lower())
+        return values
+
+    def getall(self, name: str) -> list:
+        """
+        Returns all the values of a header, or an empty list. The list
+        must not be modified.
+        """
+        return self._lookup(name) or []
+
+    def get(self, name: str, default=None):
+        values = self._lookup(name)
+        return values[0] if values else default
+
+    def __getitem__(self, name: str) -> str:
+        values = self._lookup(name)
+        if not values:
+            raise KeyError(name)
+        return values[0]
+
+    def __contains__(self, name: str) -> bool:
+        return self._lookup(name) is not None
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def keys(self):
+        return self._values.keys()
+
+    def items(self):
+        """
+        Yields all the `(name, value)` pairs, repeated headers included.
+        """
+        for name, values in self._values.items():
+            for value in values:
+                yield name, value
+
+    def clear(self) -> None:
+        self.status_line = None
+        self.raw_lines.clear()
+        self._values.clear()
+
+    def as_dict(self) -> dict:
+        """
+        Returns the headers as a plain dict, where repeated headers have a
+        list of values, f.ex. to serialize them.
+        """
+        return {name: values[0] if len(values) == 1 else list(values) for name, values in self._values.items()}
+
+    def __repr__(self) -> str:
+        return f"ResponseHeaders({self.as_dict()!r})"
+
+
+def as_response_headers(headers) -> ResponseHeaders:
+    """
+    Returns the given headers as `ResponseHeaders`, f.ex. for the plain
+    dicts of replayed results.
+    """
+    if isinstance(headers, ResponseHeaders):
+        return headers
+    return ResponseHeaders(headers or {})
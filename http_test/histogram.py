@@ -0,0 +1,97 @@
+"""
+HDR-style latency histogram, shared by the benchmark and load modes.
+"""
+
+PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of latency values.
+
+    Values are recorded in microseconds into log-linear buckets: each power
+    of two range is split into `2 ** (precision_bits - 1)` equal buckets, so
+    every recorded value is within `2 ** -(precision_bits - 1)` of the real
+    one (about 0.1% with the default of 11 bits) no matter how large it is.
+    Recording a value is O(1), and memory only depends on the range of the
+    recorded values, not on their number.
+    """
+
+    def __init__(self, precision_bits: int = 11):
+        self.precision_bits = precision_bits
+        self.counts = {}
+        self.total_count = 0
+        self.min_value = None
+        self.max_value = None
+
+    def bucket_index(self, value: int) -> int:
+        exponent = max(0, value.bit_length() - self.precision_bits)
+        return (exponent << self.precision_bits) + (value >> exponent)
+
+    def bucket_value(self, index: int) -> int:
+        """
+        Returns the highest value that falls into the given bucket.
+        """
+        exponent = index >> self.precision_bits
+        mantissa = index & ((1 << self.precision_bits) - 1)
+        return ((mantissa + 1) << exponent) - 1
+
+    def record(self, value_s: float, count: int = 1) -> None:
+        value = max(0, int(value_s * 1_000_000))
+        index = self.bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.total_count += count
+
+        if self.min_value is None or value < self.min_value:
+            self.min_value = value
+        if self.max_value is None or value > self.max_value:
+            self.max_value = value
+
+    def record_corrected(self, value_s: float, expected_interval_s: float) -> None:
+        """
+        Records a value measured by a closed-loop client, adding the values
+        that the client would have measured if it hadn't been stuck waiting
+        for this response for longer than the expected interval between
+        requests (same as HdrHistogram's `recordValueWithExpectedInterval`).
+        """
+        self.record(value_s)
+
+        if not expected_interval_s or expected_interval_s <= 0:
+            return
+
+        missing_value_s = value_s - expected_interval_s
+        while missing_value_s >= expected_interval_s:
+            self.record(missing_value_s)
+            missing_value_s -= expected_interval_s
+
+    def value_at_percentile(self, percentile: float) -> float:
+        """
+        Returns the value at the given percentile, in seconds.
+        """
+        if not self.total_count:
+            return 0.0
+
+        target_count = max(1, round(self.total_count * percentile / 100))
+        cumulative_count = 0
+
+        for index in sorted(self.counts):
+            cumulative_count += self.counts[index]
+            if cumulative_count >= target_count:
+                return min(self.bucket_value(index), self.max_value) / 1_000_000
+
+        return self.max_value / 1_000_000
+
+    def percentiles(self) -> dict:
+        return {p: self.value_at_percentile(p) for p in PERCENTILES}
+
+
+def format_duration(value_s: float) -> str:
+    if value_s < 1:
+        return f"{value_s * 1000:.1f}ms"
+    return f"{value_s:.2f}s"
+
+
+def format_percentiles(histogram: LatencyHistogram) -> str:
+    values = [f"p{p:g} {format_duration(v)}" for p, v in histogram.percentiles().items()]
+    values.append(f"max {format_duration((histogram.max_value or 0) / 1_000_000)}")
+    return "  ".join(values)
@@ -0,0 +1,95 @@
+"""
+This module implements a streaming matcher that looks for a set of string
+patterns in a response body while it's being downloaded, without having to
+buffer the whole body or to scan it once per pattern.
+"""
+
+import re
+
+# Each matcher compiles an alternation for every set of patterns still to be
+# found, which its copies reuse. Only so many are kept, as there can be up
+# to one per subset of the patterns.
+MAX_CACHED_REGEXES = 64
+
+
+class BodyMatcher:
+    """
+    Searches for all the given patterns in a single left-to-right pass over
+    the data fed through `feed()`, one chunk at a time.
+
+    All the patterns still to be found are compiled into a single regular
+    expression alternation, so the scanning happens in C rather than one
+    byte at a time in Python. Every time a pattern is found, it's dropped
+    from the alternation and the search resumes from the same position, so
+    overlapping patterns are found too.
+
+    The last `len(longest pattern) - 1` bytes of each chunk are carried over
+    to the next one, so a pattern split across two chunks is still found.
+
+    A matcher is only used once: `copy()` returns a new one for the same
+    patterns, without compiling them again.
+    """
+
+    def __init__(self, patterns: list, regexes: dict = None):
+        self.patterns = [p.encode("utf-8") if isinstance(p, str) else p for p in patterns]
+        self.found = set(p for p in self.patterns if not p)
+        self.tail = b""
+        self.max_tail = max((len(p) for p in self.patterns), default=1) - 1
+        # Compiled alternations, by set of patterns still to be found, shared
+        # with the copies of this matcher
+        self.regexes = {} if regexes is None else regexes
+        self.compile()
+
+    def copy(self) -> "BodyMatcher":
+        """
+        Returns a new matcher for the same patterns, with none found yet.
+        """
+        return BodyMatcher(self.patterns, self.regexes)
+
+    def compile(self) -> None:
+        remaining = frozenset(self.patterns) - self.found
+        if not remaining:
+            self.regex = None
+            return
+
+        self.regex = self.regexes.get(remaining)
+        if self.regex is None:
+            ordered = sorted(remaining, key=lambda p: (-len(p), p))
+            self.regex = re.compile(b"|".join(map(re.escape, ordered)))
+            if len(self.regexes) < MAX_CACHED_REGEXES:
+                self.regexes[remaining] = self.regex
+
+    def all_found(self) -> bool:
+        return self.regex is None
+
+    def is_found(self, pattern) -> bool:
+        if isinstance(pattern, str):
+            pattern = pattern.encode("utf-8")
+        return pattern in self.found
+
+    def feed(self, chunk: bytes) -> bool:
+        """
+        Scans the next chunk of data. Returns True once all the patterns
+        have been found.
+        """
+        if self.regex is None:
+            return True
+
+        data = self.tail + chunk if self.tail else chunk
+        pos = 0
+
+        while self.regex is not None:
+            m = self.regex.search(data, pos)
+            if m is None:
+                break
+
+            self.found.add(m.group())
+            self.compile()
+
+            # Other, shorter patterns may start at the same position
+            pos = m.start()
+
+        if self.max_tail:
+            self.tail = data[-self.max_tail :]
+
+        return self.regex is None
@@ -0,0 +1,227 @@
+"""
+This module exports the test results as Prometheus metrics, in the text
+exposition format, either to a file for the node exporter's textfile
+collector, or through an HTTP endpoint.
+
+Metrics are aggregated as each test result record comes in (see
+`runner.result_record()`), so exporting never holds on to the results.
+"""
+
+import bisect
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Histogram buckets, in seconds for the durations, and bytes for the sizes
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: tuple) -> str:
+    return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in labels) + "}"
+
+
+def format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    A Prometheus histogram for a single set of labels. Only the count of
+    each bucket is kept, and they are made cumulative when exported.
+    """
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str, labels: tuple):
+        cumulative_count = 0
+        for upper_bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative_count += count
+            yield f"{name}_bucket", labels + (("le", upper_bound),), cumulative_count
+
+        yield f"{name}_sum", labels, self.sum
+        yield f"{name}_count", labels, self.count
+
+
+class PrometheusMetrics:
+    """
+    A result sink that aggregates the test results into metrics labeled by
+    spec file, test and target host:
+
+    - `httptest_tests_total`: counter of test outcomes, by `status`
+    - `httptest_request_duration_seconds`: histogram of the request
+      duration, by `phase` (see `Request.get_timings()`)
+    - `httptest_response_size_bytes`: histogram of the response sizes
+    - `httptest_last_result_timestamp_seconds`: when the test last ran
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.outcomes = {}
+        self.durations = {}
+        self.sizes = {}
+        self.last_result_times = {}
+
+    def write(self, record: dict) -> None:
+        labels = (("file", record.get("file") or ""), ("test", record["name"]), ("host", record.get("host") or ""))
+        timings = record.get("timings") or {}
+        if not timings and record.get("elapsed") is not None:
+            timings = {"total": record["elapsed"]}
+
+        with self.lock:
+            outcome_labels = labels + (("status", record["status"]),)
+            self.outcomes[outcome_labels] = self.outcomes.get(outcome_labels, 0) + 1
+            self.last_result_times[labels] = time.time()
+
+            for phase, duration in timings.items():
+                if duration is None:
+                    continue
+                phase_labels = labels + (("phase", phase),)
+                histogram = self.durations.get(phase_labels)
+                if histogram is None:
+                    histogram = self.durations[phase_labels] = Histogram(DURATION_BUCKETS)
+                histogram.observe(duration)
+
+            if record.get("size_download") is not None:
+                histogram = self.sizes.get(labels)
+                if histogram is None:
+                    histogram = self.sizes[labels] = Histogram(SIZE_BUCKETS)
+                histogram.observe(record["size_download"])
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def render(self) -> str:
+        """
+        Returns all the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+
+        def add_metric(name, metric_type, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{format_labels(labels)} {format_value(value)}")
+
+        with self.lock:
+            add_metric(
+                "httptest_tests_total",
+                "counter",
+                "Test outcomes.",
+                (("httptest_tests_total", labels, count) for labels, count in self.outcomes.items()),
+            )
+            add_metric(
+                "httptest_request_duration_seconds",
+                "histogram",
+                "Duration of the test requests, by phase.",
+                (
+                    sample
+                    for labels, histogram in self.durations.items()
+                    for sample in histogram.samples("httptest_request_duration_seconds", labels)
+                ),
+            )
+            add_metric(
+                "httptest_response_size_bytes",
+                "histogram",
+                "Size of the test responses.",
+                (
+                    sample
+                    for labels, histogram in self.sizes.items()
+                    for sample in histogram.samples("httptest_response_size_bytes", labels)
+                ),
+            )
+            add_metric(
+                "httptest_last_result_timestamp_seconds",
+                "gauge",
+                "Time of the last result of each test.",
+                (
+                    ("httptest_last_result_timestamp_seconds", labels, timestamp)
+                    for labels, timestamp in self.last_result_times.items()
+                ),
+            )
+
+        return "\n".join(lines) + "\n"
+
+
+class TextfileExporter(PrometheusMetrics):
+    """
+    Writes the metrics to a `.prom` file for the node exporter's textfile
+    collector, after each run and when closed. The file is replaced
+    atomically, so it's never read half written.
+    """
+
+    def __init__(self, path: Path):
+        super().__init__()
+        self.path = Path(path)
+
+    def flush(self) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(self.render())
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def close(self) -> None:
+        self.flush()
+
+
+class HttpExporter(PrometheusMetrics):
+    """
+    Serves the metrics at `http://<host>:<port>/metrics`, from a background
+    thread, until closed.
+    """
+
+    def __init__(self, port: int, host: str = ""):
+        super().__init__()
+
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="http-test-metrics", daemon=True)
+        self.thread.start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
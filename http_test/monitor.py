@@ -0,0 +1,242 @@
+"""
+This module runs the spec tests continuously, as a long-running process,
+instead of relaunching the runner script every few minutes.
+
+Each YAML file is a suite, run on its own interval. The tests are loaded
+only once, and reloaded only when their file changes on disk, and the
+connections to the tested hosts are kept warm between runs.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from http_test.cache import SpecCache
+from http_test.colors import GREEN, RED, RESET
+from http_test.runner import iter_result_records, iter_spec_tests, print_result_record, run_spec_tests
+from http_test.spec import parse_duration
+
+DEFAULT_INTERVAL = 60.0
+
+
+def parse_interval(interval) -> float:
+    """
+    Parses the interval between two runs of a suite, see `parse_duration()`.
+    Raises a ValueError unless it's positive.
+    """
+    seconds = parse_duration(interval)
+    if seconds <= 0:
+        raise ValueError(f"Invalid monitor interval '{interval}', it must be positive")
+    return seconds
+
+
+class MonitoredSuite:
+    """
+    The tests of a single YAML file, and their schedule.
+
+    The interval and jitter can be set in the YAML file itself, and
+    default to the ones given here:
+
+    ```
+    monitor:
+      interval: 5m
+      jitter: 30s
+    ```
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        interval: float = DEFAULT_INTERVAL,
+        jitter: float = 0.0,
+        target_host: str = None,
+        template_vars: dict = None,
+        cache: SpecCache = None,
+        run_config: dict = None,
+    ):
+        self.path = path
+        self.default_interval = interval
+        self.default_jitter = jitter
+        self.target_host = target_host
+        self.template_vars = template_vars
+        self.cache = cache
+        # Settings for all the tests, see `run_specfiles()`
+        self.run_config = run_config
+
+        self.specs = []
+        self.file_stat = None
+        self.interval = interval
+        self.jitter = jitter
+
+        self.scheduled_time = None
+        self.next_run = None
+        self.runs = 0
+        self.missed_runs = 0
+
+    def reload_if_changed(self) -> bool:
+        """
+        Loads the tests again if the YAML file has changed since the last
+        time. If the new version can't be loaded, f.ex. because of a syntax
+        error, the previous version of the tests keeps running.
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError as e:
+            logging.warning(f"Can't check {self.path} for changes: {e}")
+            return False
+
+        file_stat = (stat.st_mtime_ns, stat.st_size)
+        if file_stat == self.file_stat:
+            return False
+
+        # Whatever happens, don't try again until the file changes again
+        self.file_stat = file_stat
+
+        try:
+            specs = iter_spec_tests(
+                [self.path],
+                target_host=self.target_host,
+                template_vars=self.template_vars,
+                cache=self.cache,
+                run_config=self.run_config,
+            )
+            specs = list(specs)
+
+            monitor_config = {}
+            if specs:
+                monitor_config = specs[0].spec["config"].get("monitor") or {}
+
+            interval = parse_interval(monitor_config.get("interval", self.default_interval))
+            jitter = parse_duration(monitor_config.get("jitter", self.default_jitter))
+        except Exception as e:
+            logging.error(f"Failed to load {self.path}, keeping the previous version of its tests: {e}")
+            return False
+
+        self.specs = specs
+        self.interval = interval
+        self.jitter = jitter
+
+        return True
+
+    def schedule_first(self, now: float) -> None:
+        # The jitter also spreads the first runs of all the suites
+        self.scheduled_time = now
+        self.next_run = now + random.uniform(0, self.jitter)
+
+    def schedule_next(self, now: float) -> None:
+        """
+        Schedules the next run one interval after the previous scheduled
+        time. If the previous run took longer than that, the runs that
+        should have started in the meantime are skipped rather than queued.
+        """
+        self.scheduled_time += self.interval
+
+        if self.scheduled_time < now:
+            missed = int((now - self.scheduled_time) // self.interval) + 1
+            self.missed_runs += missed
+            self.scheduled_time += missed * self.interval
+            logging.warning(f"{self.path}: run took longer than the {self.interval}s interval, skipped {missed} run(s)")
+
+        self.next_run = self.scheduled_time + random.uniform(0, self.jitter)
+
+
+class Monitor:
+    """
+    Runs the suites one at a time, each one when it's due, until stopped.
+    A suite can never overlap with itself or with other suites, so a slow
+    target can't make runs pile up: it only delays or skips them.
+    """
+
+    def __init__(
+        self,
+        suites: list,
+        concurrency: int = 1,
+        ws_concurrency: int = None,
+        share_requests: bool = False,
+        verbose: bool = False,
+        result_sinks: list = None,
+        deadline: float = None,
+    ):
+        self.suites = suites
+        self.concurrency = concurrency
+        self.ws_concurrency = ws_concurrency
+        self.share_requests = share_requests
+        self.verbose = verbose
+        self.result_sinks = result_sinks or []
+        # Longest time a single run can take, in seconds
+        self.deadline = deadline
+        self.stop_event = threading.Event()
+
+    def stop(self) -> None:
+        """
+        Stops the monitor after the current run, if any. Can be called
+        from any thread, or from a signal handler.
+        """
+        self.stop_event.set()
+
+    def run(self) -> None:
+        now = time.monotonic()
+        for suite in self.suites:
+            suite.reload_if_changed()
+            suite.schedule_first(now)
+
+        while not self.stop_event.is_set():
+            suite = min(self.suites, key=lambda s: s.next_run)
+
+            delay = suite.next_run - time.monotonic()
+            if delay > 0:
+                self.stop_event.wait(delay)
+                continue
+
+            self.run_suite(suite)
+            suite.schedule_next(time.monotonic())
+
+    def run_suite(self, suite: MonitoredSuite) -> dict:
+        """
+        Runs all the tests of a suite once, and returns the count of
+        passed, failed and skipped tests.
+        """
+        suite.reload_if_changed()
+
+        counts = {"pass": 0, "fail": 0, "skip": 0}
+        start_time = time.monotonic()
+
+        outcomes = run_spec_tests(
+            suite.specs,
+            concurrency=self.concurrency,
+            ws_concurrency=self.ws_concurrency,
+            share_requests=self.share_requests,
+            deadline=time.time() + self.deadline if self.deadline is not None else None,
+        )
+
+        try:
+            for record in iter_result_records(outcomes):
+                counts[record["status"]] += 1
+                if self.verbose or record["status"] == "fail":
+                    print_result_record(record)
+
+                for sink in self.result_sinks:
+                    sink.write(record)
+        except Exception as e:
+            # Anything other than a failed test, f.ex. a connection error,
+            # interrupts this run, but not the monitor itself
+            logging.error(f"{suite.path}: run interrupted: {e}")
+            counts["fail"] += 1
+
+        for sink in self.result_sinks:
+            sink.flush()
+
+        suite.runs += 1
+        elapsed = time.monotonic() - start_time
+        color = RED if counts["fail"] else GREEN
+
+        print(
+            f"[{datetime.now().isoformat(timespec='seconds')}] {suite.path}: {color}{counts['pass']} passed, "
+            f"{counts['fail']} failed{RESET}, {counts['skip']} skipped in {elapsed:.2f}s"
+        )
+
+        return counts
@@ -0,0 +1,192 @@
+"""
+This module drives many pycurl requests at the same time through a single
+`pycurl.CurlMulti` instance, instead of one blocking `perform()` per request.
+"""
+
+from collections import deque
+
+import pycurl
+
+from http_test.request import Request
+
+# Most servers allow 100 (or more) concurrent streams on an HTTP/2 connection
+DEFAULT_MAX_STREAMS = 100
+
+
+class CurlMultiDriver:
+    """
+    Wraps a `pycurl.CurlMulti` instance. Requests are added with `add()`, and
+    `poll()` drives all the in-flight transfers, returning the ones that
+    have completed.
+
+    With `multiplex`, all the HTTP/2 requests to the same origin are sent as
+    concurrent streams over a single connection, instead of each one opening
+    its own connection. Up to `max_streams` of them are in flight at the same
+    time for each origin, the others wait for a stream to become available.
+    """
+
+    def __init__(self, multiplex: bool = False, max_streams: int = DEFAULT_MAX_STREAMS):
+        self.multi = pycurl.CurlMulti()
+        self.in_flight = {}
+        # Results replayed from a cassette, and errors of the waiting requests
+        # that couldn't be started, returned by the next `poll()`
+        self.replayed = []
+        self.failed = []
+
+        self.multiplex = multiplex
+        self.max_streams = max_streams
+        # Streams in flight, and requests waiting for a stream, by origin
+        self.streams = {}
+        self.waiting = {}
+        self.waiting_count = 0
+
+        if multiplex:
+            self.multi.setopt(pycurl.M_PIPELINING, pycurl.PIPE_MULTIPLEX)
+            self.multi.setopt(pycurl.M_MAX_CONCURRENT_STREAMS, max_streams)
+
+    def __len__(self):
+        return len(self.in_flight) + self.waiting_count + len(self.replayed) + len(self.failed)
+
+    def is_multiplexed(self, request: Request) -> bool:
+        return self.multiplex and request.http2
+
+    def add(self, request: Request, tag=None) -> None:
+        """
+        Starts the given request. `tag` is an arbitrary object that will be
+        handed back by `poll()` once the request is complete.
+        """
+        result = request.replay()
+        if result is not None:
+            self.replayed.append((tag, request.decode_result(result), None))
+            return
+
+        if self.is_multiplexed(request):
+            origin = request.pool_key()
+            if self.streams.get(origin, 0) >= self.max_streams:
+                self.waiting.setdefault(origin, deque()).append((request, tag))
+                self.waiting_count += 1
+                return
+
+            # The stream is only taken once the request has started, as
+            # preparing it can fail, f.ex. on a missing payload file
+            self._start(request, tag)
+            self.streams[origin] = self.streams.get(origin, 0) + 1
+            return
+
+        self._start(request, tag)
+
+    def _start(self, request: Request, tag) -> None:
+        c = request.prepare_pycurl_request()
+
+        if self.is_multiplexed(request):
+            # Wait for the connection to the origin to be established, and
+            # use a stream on it, rather than opening another connection
+            c.setopt(pycurl.PIPEWAIT, 1)
+
+        self.in_flight[c] = (request, tag)
+        self.multi.add_handle(c)
+
+    def _release_stream(self, request: Request) -> None:
+        """
+        Hands the stream of a completed request over to the next request
+        waiting for the same origin, if any. The waiting requests that can't
+        be started fail, and are returned by the next `poll()`.
+        """
+        origin = request.pool_key()
+        waiting = self.waiting.get(origin)
+
+        while waiting:
+            next_request, tag = waiting.popleft()
+            self.waiting_count -= 1
+            if not waiting:
+                del self.waiting[origin]
+
+            try:
+                self._start(next_request, tag)
+                return
+            except Exception as e:
+                self.failed.append((tag, None, e))
+
+        if self.streams[origin] > 1:
+            self.streams[origin] -= 1
+        else:
+            del self.streams[origin]
+
+    def poll(self, timeout: float = 1.0) -> list:
+        """
+        Waits up to `timeout` seconds for activity on any of the in-flight
+        transfers, and returns a list of `(tag, result, error)` tuples, one
+        for each completed request. Either `result` or `error` is `None`.
+        """
+        if self.replayed or self.failed:
+            completed = self.replayed + self.failed
+            self.replayed, self.failed = [], []
+            return completed
+
+        if not self.in_flight:
+            return []
+
+        completed = self._perform()
+        if completed:
+            return completed
+
+        # Don't sleep past the point where libcurl wants to be called again,
+        # f.ex. to handle its own internal timeouts.
+        curl_timeout = self.multi.timeout()
+        if curl_timeout >= 0:
+            timeout = min(timeout, curl_timeout / 1000)
+
+        self.multi.select(timeout)
+
+        return self._perform()
+
+    def _perform(self) -> list:
+        while True:
+            ret, _ = self.multi.perform()
+            if ret != pycurl.E_CALL_MULTI_PERFORM:
+                break
+
+        completed = []
+
+        while True:
+            queued, ok_list, err_list = self.multi.info_read()
+
+            for c in ok_list:
+                completed.append(self._complete(c, None))
+
+            for c, errno, errmsg in err_list:
+                completed.append(self._complete(c, pycurl.error(errno, errmsg)))
+
+            if queued == 0:
+                break
+
+        return completed
+
+    def _complete(self, c: pycurl.Curl, error: pycurl.error):
+        self.multi.remove_handle(c)
+        request, tag = self.in_flight.pop(c)
+
+        if self.is_multiplexed(request):
+            self._release_stream(request)
+
+        # Stopping early on a body match, or on a decoding error, aborts
+        # the transfer on purpose
+        if error is not None and not request.transfer_aborted():
+            request.release_client(c)
+            request.close_buffers()
+            return tag, None, error
+
+        result = request.decode_result(request.finish_pycurl_request(c))
+        return tag, result, None
+
+    def close(self) -> None:
+        for c, (request, _) in list(self.in_flight.items()):
+            self.multi.remove_handle(c)
+            c.close()
+            request.close_buffers()
+
+        self.in_flight.clear()
+        self.waiting.clear()
+        self.waiting_count = 0
+        self.failed.clear()
+        self.multi.close()
@@ -0,0 +1,116 @@
+"""
+This module implements the request payloads, streamed to curl one chunk at
+a time through its read callback, so that large request bodies, f.ex. for
+upload endpoints, don't have to fit in memory.
+"""
+
+import mmap
+import os
+import stat
+from pathlib import Path
+
+import pycurl
+
+
+class RequestPayload:
+    """
+    A request body, either in memory (`data`) or read from a file (`path`).
+
+    Regular files are memory mapped, so their pages are loaded as curl reads
+    them. Other files, f.ex. named pipes, are read in chunks, and their size
+    is unknown until they've been read completely, which makes curl send
+    them with chunked transfer encoding.
+    """
+
+    def __init__(self, data=None, path: Path = None):
+        self.file = None
+        self.position = 0
+
+        if path is None:
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            elif not isinstance(data, (bytes, bytearray)):
+                # `bytes(42)` would silently send 42 NUL bytes
+                raise ValueError(f"Invalid payload {data!r}, must be a string or bytes")
+            self.data = bytes(data)
+            self.size = len(self.data)
+            return
+
+        self.file = open(path, "rb")
+        file_stat = os.fstat(self.file.fileno())
+
+        if not stat.S_ISREG(file_stat.st_mode):
+            self.data = None
+            self.size = None
+        elif file_stat.st_size == 0:
+            # Empty files can't be memory mapped
+            self.data = b""
+            self.size = 0
+        else:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.size = file_stat.st_size
+
+    def read(self, size: int) -> bytes:
+        """
+        Returns the next chunk of up to `size` bytes, see
+        https://curl.se/libcurl/c/CURLOPT_READFUNCTION.html
+        """
+        if self.data is None:
+            return self.file.read(size)
+
+        chunk = self.data[self.position : self.position + size]
+        self.position += len(chunk)
+        return chunk
+
+    def seek(self, offset: int, origin: int) -> int:
+        """
+        Rewinds the payload, f.ex. when curl resends the request on a new
+        connection because the reused one was closed, see
+        https://curl.se/libcurl/c/CURLOPT_SEEKFUNCTION.html
+        """
+        if self.data is None:
+            return pycurl.SEEKFUNC_CANTSEEK
+
+        if origin == os.SEEK_CUR:
+            offset += self.position
+        elif origin == os.SEEK_END:
+            offset += self.size
+
+        if not 0 <= offset <= self.size:
+            return pycurl.SEEKFUNC_FAIL
+
+        self.position = offset
+        return pycurl.SEEKFUNC_OK
+
+    def setup(self, c: pycurl.Curl, chunked: bool = False) -> None:
+        """
+        Sets the pycurl handle up to send this payload. Unless `chunked`,
+        the payload size is sent in the `content-length` header, in bytes.
+        """
+        c.setopt(c.POST, 1)
+        c.setopt(c.READFUNCTION, self.read)
+        c.setopt(c.SEEKFUNCTION, self.seek)
+
+        # Without a size, curl uses chunked transfer encoding over HTTP/1.1,
+        # and sends the body until the end of the data over HTTP/2
+        c.setopt(c.POSTFIELDSIZE_LARGE, -1 if chunked or self.size is None else self.size)
+
+    def close(self) -> None:
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        if self.file is not None:
+            self.file.close()
+        self.data = None
+        self.file = None
+
+
+def file_fingerprint(path: Path) -> tuple:
+    """
+    Returns what identifies the content of a payload file, without reading
+    it: its path, size and modification time.
+    """
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        return (str(path), None, None)
+    return (str(path), file_stat.st_size, file_stat.st_mtime_ns)
@@ -0,0 +1,80 @@
+"""
+This module keeps a pool of reusable pycurl handles, so that tests hitting
+the same hosts can reuse warm connections instead of performing a new
+TCP and TLS handshake for each request.
+"""
+
+import pycurl
+
+# How many idle handles to keep around for each pool key
+MAX_IDLE_PER_KEY = 32
+
+_default_pool = None
+
+
+class ConnectionPool:
+    """
+    Pool of pycurl handles keyed by scheme, host, port, connect-to and
+    http2 settings (see `Request.pool_key()`).
+
+    All the handles coming from the same pool are attached to a single
+    `pycurl.CurlShare` instance, which shares the DNS, TLS session and
+    connection caches between them.
+    """
+
+    def __init__(self, max_idle_per_key: int = MAX_IDLE_PER_KEY):
+        self.max_idle_per_key = max_idle_per_key
+        self.idle = {}
+
+        self.share = pycurl.CurlShare()
+        self.share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_DNS)
+        self.share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_SSL_SESSION)
+        self.share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_CONNECT)
+
+    def acquire(self, key: tuple) -> pycurl.Curl:
+        """
+        Returns an idle handle for the given key, or a new one if there's none.
+        """
+        handles = self.idle.get(key)
+        if handles:
+            return handles.pop()
+
+        c = pycurl.Curl()
+        c.setopt(pycurl.SHARE, self.share)
+        return c
+
+    def release(self, key: tuple, c: pycurl.Curl) -> None:
+        """
+        Gives a handle back to the pool once its transfer is complete.
+        """
+        # Resetting the handle drops its options, including the callbacks
+        # referencing the previous `Request` object, but keeps its
+        # connections alive. pycurl keeps the handle attached to the share.
+        c.reset()
+
+        handles = self.idle.setdefault(key, [])
+        if len(handles) < self.max_idle_per_key:
+            handles.append(c)
+        else:
+            c.close()
+
+    def close(self) -> None:
+        for handles in self.idle.values():
+            for c in handles:
+                c.close()
+
+        self.idle.clear()
+        self.share.close()
+
+
+def get_default_pool() -> ConnectionPool:
+    """
+    Returns the connection pool that is used by `Request` objects
+    when no explicit pool is given.
+    """
+    global _default_pool
+
+    if _default_pool is None:
+        _default_pool = ConnectionPool()
+
+    return _default_pool
@@ -1,17 +1,35 @@
 import asyncio
+import concurrent.futures
+import hashlib
 import logging
+import math
 import random
 import string
 import time
-import zlib
-from io import BytesIO, StringIO
+from pathlib import Path
 from urllib.parse import urlparse
 
-import brotli
 import certifi
 import pycurl
 
-from http_test.ws_request import ws_connect
+from http_test.buffers import DiscardBuffer, SpillBuffer
+from http_test.cassette import Cassette
+from http_test.decoding import DEFAULT_MAX_DECODED_SIZE, ResponseDecoder, get_content_encoding
+from http_test.headers import ResponseHeaders
+from http_test.matcher import BodyMatcher
+from http_test.payload import RequestPayload, file_fingerprint
+from http_test.pool import ConnectionPool, get_default_pool
+from http_test.ws_request import get_background_loop, ws_connect
+
+# curl waits up to 5 minutes for a connection by default, which is way more
+# than any test should. There's no default limit to the whole transfer.
+DEFAULT_CONNECT_TIMEOUT = 30.0
+
+# Time to wait for a websocket response, when the test has no `timeout`
+DEFAULT_WS_TIMEOUT = 3.0
+
+# How long the transfer speed must stay below `min_speed` before giving up
+DEFAULT_MIN_SPEED_TIME = 10.0
 
 
 class Request:
@@ -28,16 +46,65 @@ class Request:
         headers: list = None,
         connect_to: list = None,
         http2: bool = False,
-        payload: str = None,
+        payload=None,
         verbose: bool = False,
+        fresh_connection: bool = False,
+        pool: ConnectionPool = None,
+        body_patterns: list = None,
+        body_matcher: BodyMatcher = None,
+        stop_on_match: bool = False,
+        max_decoded_size: int = DEFAULT_MAX_DECODED_SIZE,
+        max_body_size: int = None,
+        hash_body: bool = False,
+        keep_body: bool = True,
+        timeout: float = None,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        min_speed: int = None,
+        min_speed_time: float = DEFAULT_MIN_SPEED_TIME,
+        deadline: float = None,
+        cassette: Cassette = None,
+        payload_file: str = None,
+        chunked: bool = False,
     ):
         self.url = url
         self.method = method
-        self.headers = headers if headers else []
+        # Copy the headers, as the list often comes straight from the test
+        # spec, and the same spec can be used to build many requests
+        self.headers = list(headers) if headers else []
         self.connect_to = connect_to
         self.http2 = http2
         self.verbose = verbose
-        self.payload: str = payload if payload else None
+        # Either a `str`, sent encoded as UTF-8, or `bytes`
+        self.payload = payload if payload else None
+        # A file whose content is streamed as the request body, instead
+        # of an inline payload
+        self.payload_file = payload_file
+        # Send the payload with chunked transfer encoding, instead of
+        # a `content-length` header
+        self.chunked = chunked
+        self.fresh_connection = fresh_connection
+        self.pool = pool
+        self.body_patterns = body_patterns
+        # Copied for each transfer, to match the body patterns while the
+        # response is being downloaded, f.ex. the one of the test requirements
+        if body_matcher is None and body_patterns:
+            body_matcher = BodyMatcher(body_patterns)
+        self.body_patterns_matcher = body_matcher
+        self.stop_on_match = stop_on_match
+        self.max_decoded_size = max_decoded_size
+        self.max_body_size = max_body_size
+        self.hash_body = hash_body
+        # Without `keep_body`, the response body is only hashed and matched
+        # while it's being downloaded, and the result has an empty body
+        self.keep_body = keep_body
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.min_speed = min_speed
+        self.min_speed_time = min_speed_time
+        # Wall clock time (see `time.time()`) by which the request must
+        # be complete, f.ex. the deadline of the whole test suite
+        self.deadline = deadline
+        self.cassette = cassette
 
         self.request_id = self.get_unique_request_identifier()
 
@@ -46,15 +113,78 @@ class Request:
         self.user_agent = f"User-Agent: {self.request_id}"
         self.headers.append(self.user_agent)
 
-        self.response_headers = dict()
+        self.response_headers = ResponseHeaders()
+        self.response = None
+        self.response_decoded = None
+        self.decoder = None
+        self.transfer_error = None
+        self.body_matcher = None
+        self.body_hash = None
+        self.stopped_early = False
+        self.request_payload = None
 
     def get_unique_request_identifier(self):
         ts = int(time.time())
         random_str = "".join(random.choice(string.ascii_uppercase + string.digits) for _ in range(4))
         return f"HTTPTEST/{ts}.{random_str}"
 
+    def pool_key(self) -> tuple:
+        """
+        Requests with the same pool key can safely share pycurl handles.
+        """
+        parsed_url = urlparse(self.url)
+        connect_to = tuple(self.connect_to) if self.connect_to else ()
+        return (parsed_url.scheme, parsed_url.hostname, parsed_url.port, connect_to, self.http2)
+
+    def fingerprint(self) -> str:
+        """
+        Requests with the same fingerprint are expected to get the same
+        response, so they can share a single fetch. The per-request
+        `User-Agent` header is left out, as it's different every time.
+        """
+        headers = tuple(h for h in self.headers if h != self.user_agent)
+        connect_to = tuple(self.connect_to) if self.connect_to else ()
+
+        # When stopping early, the response body depends on the patterns
+        body_patterns = tuple(self.body_patterns or ()) if self.stop_on_match else ()
+
+        request_parts = (
+            self.method.upper(),
+            self.url,
+            headers,
+            connect_to,
+            self.http2,
+            self.payload,
+            file_fingerprint(self.payload_file) if self.payload_file else None,
+            self.chunked,
+            self.fresh_connection,
+            self.max_decoded_size,
+            body_patterns,
+        )
+
+        return hashlib.sha256(repr(request_parts).encode("utf-8")).hexdigest()
+
+    def effective_timeout(self) -> float:
+        """
+        Returns how long the whole request may take, in seconds: its own
+        `timeout`, cut short by the `deadline` if any. Returns None if
+        there's no limit.
+        """
+        timeout = self.timeout
+        if self.deadline is not None:
+            remaining = self.deadline - time.time()
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        return timeout
+
     def client(self):
-        c = pycurl.Curl()
+        if self.fresh_connection:
+            # Cold-path checks: don't reuse any existing connection, and
+            # don't leave this one around for other requests either.
+            c = pycurl.Curl()
+            c.setopt(c.FRESH_CONNECT, True)
+            c.setopt(c.FORBID_REUSE, True)
+        else:
+            c = (self.pool or get_default_pool()).acquire(self.pool_key())
 
         if self.method != "GET":
             c.setopt(c.CUSTOMREQUEST, self.method)
@@ -69,6 +199,19 @@ class Request:
 
         c.setopt(c.CAINFO, certifi.where())
 
+        # Pooled handles are reset when released, so these don't carry over
+        # to other requests. A timeout of zero means no timeout for curl,
+        # so an expired deadline still gets a (tiny) positive timeout, and
+        # it's rounded up, so that curl doesn't give up before the deadline.
+        timeout = self.effective_timeout()
+        if timeout is not None:
+            c.setopt(c.TIMEOUT_MS, max(1, math.ceil(timeout * 1000)))
+        if self.connect_timeout:
+            c.setopt(c.CONNECTTIMEOUT_MS, max(1, int(self.connect_timeout * 1000)))
+        if self.min_speed:
+            c.setopt(c.LOW_SPEED_LIMIT, self.min_speed)
+            c.setopt(c.LOW_SPEED_TIME, max(1, round(self.min_speed_time)))
+
         if self.verbose:
             c.setopt(c.VERBOSE, True)
 
@@ -86,63 +229,23 @@ class Request:
 
         return c
 
-    def header_function(self, header_line):
+    def header_function(self, header_line: bytes):
         """
-        From pycurl's documentation:
-        http://pycurl.io/docs/latest/quickstart.html#examining-response-headers
+        Receives the response headers from pycurl, one line at a time,
+        status line included, see `ResponseHeaders.parse_line()`.
         """
-        # HTTP standard specifies that headers are encoded in iso-8859-1.
-        # On Python 2, decoding step can be skipped.
-        # On Python 3, decoding step is required.
-        header_line = header_line.decode("iso-8859-1")
-
-        # Header lines include the first status line (HTTP/1.x ...).
-        # We are going to ignore all lines that don't have a colon in them.
-        # This will botch headers that are split on multiple lines...
-        if ":" not in header_line:
-            return
-
-        # Break the header line into header name and value.
-        name, value = header_line.split(":", 1)
-
-        # Remove whitespace that may be present.
-        # Header lines include the trailing newline, and there may be whitespace
-        # around the colon.
-        name = name.strip()
-        value = value.strip()
-
-        # Header names are case insensitive.
-        # Lowercase name here.
-        name = name.lower()
-
-        # Now we can actually record the header name and value.
-        if name in self.response_headers:
-            if isinstance(self.response_headers[name], list):
-                self.response_headers[name].append(value)
-            else:
-                self.response_headers[name] = [self.response_headers[name], value]
-        else:
-            self.response_headers[name] = value
+        self.response_headers.parse_line(header_line)
 
     def inflate_response(self, response_body: bytes) -> bytes:
         """
-        Attempts to transparently decompress the response body if needed.
+        Decompresses the response body according to its `content-encoding`.
         """
-        try:
-            is_gzip = response_body[0] == 0x1F and response_body[1] == 0x8B
-        except IndexError:
-            # IndexError here indicates the response body was empty
+        content_encoding = get_content_encoding(self.response_headers)
+        if not content_encoding or not response_body:
             return response_body
 
-        if is_gzip:
-            return zlib.decompress(response_body, 16 + zlib.MAX_WBITS)
-
-        try:
-            return brotli.decompress(response_body)
-        except brotli.error as e:
-            logging.info("Error while trying to decompress brotli response", e)
-
-        return response_body
+        decoder = ResponseDecoder(content_encoding, max_size=self.max_decoded_size)
+        return decoder.decode(response_body) + decoder.flush()
 
     def is_websockets_request(self):
         scheme = urlparse(self.url).scheme
@@ -161,33 +264,180 @@ class Request:
         - `response_body_decoded`
         - `response_headers`
         """
+        result_dict = self.replay()
+        if result_dict is not None:
+            return self.decode_result(result_dict)
+
         if self.is_websockets_request():
             result_dict = self.fire_websockets_request()
         else:
             result_dict = self.fire_pycurl_request()
 
-        if "response_body" in result_dict:
+        return self.decode_result(result_dict)
+
+    def replay(self) -> dict:
+        """
+        Returns the result of this request recorded in the cassette, if any,
+        in which case the request doesn't have to be fired.
+        """
+        if self.cassette is None:
+            return None
+        return self.cassette.replay(self.fingerprint(), self.url)
+
+    def decode_result(self, result_dict: dict) -> dict:
+        """
+        Adds the decoded (decompressed) response body to the results, unless
+        it was already decoded while the response was being downloaded.
+        """
+        if "response_body" in result_dict and "response_body_decoded" not in result_dict:
             decoded_content = self.inflate_response(result_dict["response_body"])
             result_dict["response_body_decoded"] = decoded_content
 
+        if self.body_matcher is not None:
+            result_dict["body_matches"] = {
+                pattern: self.body_matcher.is_found(pattern) for pattern in self.body_patterns
+            }
+
+        if self.cassette is not None:
+            self.cassette.record(self.fingerprint(), self.url, result_dict)
+
         return result_dict
 
     def fire_pycurl_request(self) -> dict:
-        response = BytesIO()
+        c = self.prepare_pycurl_request()
+
+        try:
+            try:
+                c.perform()
+            except pycurl.error:
+                if not self.transfer_aborted():
+                    self.release_client(c)
+                    raise
+
+            return self.finish_pycurl_request(c)
+        finally:
+            self.close_buffers()
+
+    def prepare_pycurl_request(self) -> pycurl.Curl:
+        """
+        Sets up the pycurl handle for this request without performing it.
+        The handle can either be `perform()`ed directly or added to
+        a `pycurl.CurlMulti` instance to be driven concurrently with others.
+        Once the transfer is complete, `finish_pycurl_request()` collects
+        the results.
+        """
+        self.response = self.new_body_buffer()
+        self.response_decoded = None
+        self.decoder = None
+        self.transfer_error = None
+        self.body_matcher = self.body_patterns_matcher.copy() if self.body_patterns_matcher is not None else None
+        self.body_hash = hashlib.sha256() if self.hash_body else None
+        self.stopped_early = False
+
+        # Opened first, as a missing payload file fails the request before
+        # it gets a pycurl handle
+        if self.payload_file:
+            self.request_payload = RequestPayload(path=self.payload_file)
+        elif self.payload:
+            self.request_payload = RequestPayload(data=self.payload)
 
         c = self.client()
-        c.setopt(c.WRITEDATA, response)
+        c.setopt(c.WRITEFUNCTION, self.write_function)
 
         self.response_headers.clear()
         c.setopt(c.HEADERFUNCTION, self.header_function)
 
-        if self.payload:
-            request_body = StringIO(self.payload)
-            c.setopt(c.POST, 1)
-            c.setopt(c.READDATA, request_body)
-            c.setopt(c.POSTFIELDSIZE, len(self.payload))
+        if self.request_payload is not None:
+            self.request_payload.setup(c, chunked=self.chunked)
+
+        return c
+
+    def new_body_buffer(self):
+        return SpillBuffer() if self.keep_body else DiscardBuffer()
 
-        c.perform()
+    def write_function(self, chunk: bytes):
+        """
+        Receives the response body from pycurl, one chunk at a time,
+        decoding it on the fly according to its `content-encoding`.
+        """
+        self.response.write(chunk)
+
+        if self.max_body_size is not None and self.response.size > self.max_body_size:
+            return self.abort_transfer(f"Response body larger than {self.max_body_size} bytes")
+
+        if self.response_decoded is None:
+            # This is the first chunk, so we have all the response headers
+            content_encoding = get_content_encoding(self.response_headers)
+            if content_encoding:
+                self.response_decoded = self.new_body_buffer()
+                try:
+                    self.decoder = ResponseDecoder(content_encoding, max_size=self.max_decoded_size)
+                except ValueError as e:
+                    return self.abort_transfer(f"Error while decoding response body: {e}")
+            else:
+                # Without content-encoding, the decoded body is the same
+                # as the raw body, and there's no need to keep two copies
+                self.response_decoded = self.response
+
+        if self.decoder is not None:
+            try:
+                chunk = self.decoder.decode(chunk)
+            except Exception as e:
+                return self.abort_transfer(f"Error while decoding response body: {e}")
+            self.response_decoded.write(chunk)
+
+        if self.body_hash is not None:
+            self.body_hash.update(chunk)
+
+        if self.body_matcher is not None and self.body_matcher.feed(chunk) and self.stop_on_match:
+            # All the body patterns have been found, there's no need to
+            # download the rest of the response.
+            self.stopped_early = True
+            return 0
+
+        return None
+
+    def abort_transfer(self, error: str) -> int:
+        """
+        Records an error, f.ex. a decoding error, and aborts the transfer.
+        Returning anything other than the chunk length from the write
+        function makes pycurl abort the transfer.
+        """
+        self.transfer_error = error
+        return 0
+
+    def transfer_aborted(self) -> bool:
+        """
+        Returns True if the transfer was aborted on purpose, either because
+        all the body patterns were found, or because of a decoding error or
+        a response body too large.
+        """
+        return self.stopped_early or self.transfer_error is not None
+
+    def decoded_body(self) -> bytes:
+        if self.response_decoded is None:
+            # The response had no body at all
+            return self.response.getvalue()
+
+        if self.decoder is not None and not self.transfer_aborted():
+            try:
+                chunk = self.decoder.flush()
+                self.response_decoded.write(chunk)
+                if self.body_hash is not None:
+                    self.body_hash.update(chunk)
+                if self.body_matcher is not None:
+                    self.body_matcher.feed(chunk)
+            except Exception as e:
+                self.abort_transfer(f"Error while decoding response body: {e}")
+
+        return self.response_decoded.getvalue()
+
+    def finish_pycurl_request(self, c: pycurl.Curl) -> dict:
+        response_body = self.response.getvalue()
+        if self.response_decoded is self.response:
+            response_body_decoded = response_body
+        else:
+            response_body_decoded = self.decoded_body()
 
         result_dict = {
             "status_code": c.getinfo(c.RESPONSE_CODE),
@@ -195,14 +445,91 @@ class Request:
             "request_id": self.request_id,
             "request_headers": self.headers,
             "response_headers": self.response_headers,
-            "response_body": response.getvalue(),
+            "response_body": response_body,
+            "response_body_decoded": response_body_decoded,
             "elapsed": c.getinfo(c.TOTAL_TIME),
+            "timings": self.get_timings(c),
+            "size_download": c.getinfo(c.SIZE_DOWNLOAD),
+            "size_upload": c.getinfo(c.SIZE_UPLOAD),
+            "header_size": c.getinfo(c.HEADER_SIZE),
+            "request_size": c.getinfo(c.REQUEST_SIZE),
+            "speed_download": c.getinfo(c.SPEED_DOWNLOAD),
+            "speed_upload": c.getinfo(c.SPEED_UPLOAD),
+            "num_connects": c.getinfo(c.NUM_CONNECTS),
+            "stopped_early": self.stopped_early,
         }
 
-        c.close()
+        if self.body_hash is not None:
+            result_dict["body_sha256"] = self.body_hash.hexdigest()
+
+        if self.transfer_error is not None:
+            result_dict["error"] = self.transfer_error
+
+        self.release_client(c)
+        self.close_buffers()
 
         return result_dict
 
+    def close_buffers(self) -> None:
+        """
+        Closes the response buffers and the request payload, which may hold
+        a temporary file or a memory map. Called once the transfer is over,
+        whether it succeeded, failed or was interrupted.
+        """
+        if self.response is not None:
+            self.response.close()
+        if self.response_decoded is not None:
+            self.response_decoded.close()
+        if self.request_payload is not None:
+            self.request_payload.close()
+        self.response = None
+        self.response_decoded = None
+        self.request_payload = None
+        self.decoder = None
+
+    def get_timings(self, c: pycurl.Curl) -> dict:
+        """
+        Breaks down the request elapsed time into its phases, in seconds.
+        curl reports cumulative times since the start of the request, see
+        https://curl.se/libcurl/c/curl_easy_getinfo.html#TIMES
+
+        When an existing connection is reused, `dns`, `connect` and `tls`
+        will be zero.
+        """
+        namelookup = c.getinfo(c.NAMELOOKUP_TIME)
+        connect = c.getinfo(c.CONNECT_TIME)
+        appconnect = c.getinfo(c.APPCONNECT_TIME)
+        pretransfer = c.getinfo(c.PRETRANSFER_TIME)
+        starttransfer = c.getinfo(c.STARTTRANSFER_TIME)
+        total = c.getinfo(c.TOTAL_TIME)
+
+        return {
+            "dns": namelookup,
+            "connect": max(0.0, connect - namelookup),
+            "tls": max(0.0, appconnect - connect) if appconnect else 0.0,
+            "pretransfer": pretransfer,
+            "server": max(0.0, starttransfer - pretransfer),
+            "ttfb": starttransfer,
+            "transfer": max(0.0, total - starttransfer),
+            "redirect": c.getinfo(c.REDIRECT_TIME),
+            "total": total,
+        }
+
+    def release_client(self, c: pycurl.Curl) -> None:
+        """
+        Gives the pycurl handle back to the connection pool, or closes it
+        if this request wasn't supposed to use a pooled connection.
+        """
+        if self.fresh_connection:
+            c.close()
+        else:
+            (self.pool or get_default_pool()).release(self.pool_key(), c)
+
+        # The transfer is over, whether it succeeded or not
+        if self.request_payload is not None:
+            self.request_payload.close()
+            self.request_payload = None
+
     def resolve_connect_to(self):
         """
         Emulate curl's --connect-to functionality with the same semantics.
@@ -257,20 +584,67 @@ class Request:
         return False
 
     def fire_websockets_request(self) -> dict:
+        return get_background_loop().run(self.websockets_request())
+
+    def websockets_connect_params(self) -> dict:
+        """
+        Returns the parameters needed to open a websocket connection for
+        this request, honouring the `connect_to` settings.
+        """
         hostname = urlparse(self.url).hostname
         ct_host, ct_port = self.resolve_connect_to()
-        result_dict = asyncio.run(
-            ws_connect(
-                self.url,
-                host=ct_host,
-                port=ct_port,
-                server_hostname=hostname,
-                message=self.payload,
-                extra_headers=self.headers,
-            )
+        return {
+            "url": self.url,
+            "host": ct_host,
+            "port": ct_port,
+            "server_hostname": hostname,
+            "extra_headers": self.headers,
+        }
+
+    async def websockets_request(self) -> dict:
+        """
+        Coroutine performing the websocket request. All websocket requests
+        run in the same, long-lived, background event loop, see
+        `fire_websockets_request()`.
+        """
+        result_dict = self.replay()
+        if result_dict is not None:
+            return result_dict
+
+        start_time = time.monotonic()
+
+        timeout = self.effective_timeout()
+        # Websocket messages are sent whole, so a payload file is read first
+        message = Path(self.payload_file).read_bytes() if self.payload_file else self.payload
+
+        ws_request = ws_connect(
+            message=message,
+            read_timeout=DEFAULT_WS_TIMEOUT if timeout is None else max(0.0, timeout),
+            open_timeout=self.connect_timeout,
+            **self.websockets_connect_params(),
         )
 
+        # The timeout covers the whole request, from the connection
+        # to the response, same as for the pycurl requests
+        if timeout is None:
+            result_dict = await ws_request
+        else:
+            result_dict = await asyncio.wait_for(ws_request, max(0.0, timeout))
+
+        elapsed = time.monotonic() - start_time
+        result_dict["elapsed"] = elapsed
+        result_dict["timings"] = {"total": elapsed}
         result_dict["connect_to"] = self.connect_to
         result_dict["request_id"] = self.request_id
 
         return result_dict
+
+
+def is_timeout_error(error: Exception) -> bool:
+    """
+    Returns True if the error is a request timing out, either a pycurl
+    timeout (`timeout`, or `min_speed` not met) or a websocket one.
+    """
+    if isinstance(error, pycurl.error):
+        return error.args[0] == pycurl.E_OPERATION_TIMEDOUT
+    return isinstance(error, (asyncio.TimeoutError, concurrent.futures.TimeoutError, TimeoutError))
@@ -0,0 +1,203 @@
+"""
+This module writes the test result records (see `runner.result_record()`)
+to files, as JSON lines or JUnit XML, one record at a time as each test
+completes. JSON lines results files can be read back, so that the results
+of a test suite split across several machines (see `http_test.sharding`)
+can be merged together.
+"""
+
+import json
+import re
+import shutil
+import socket
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from xml.sax.saxutils import escape, quoteattr
+
+# Characters that are not allowed anywhere in an XML 1.0 document
+INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+
+
+class JsonLinesWriter:
+    """
+    Writes each result record as a single JSON line, as soon as it's
+    available. Any `extra` fields (f.ex. the shard) are added to each record.
+
+    A header line is written as soon as the file is opened, so that even
+    a run interrupted before its first test tells which shard it was. A final
+    summary line is written on `close()`, so that a complete run, even with
+    no tests at all, can be told apart from an interrupted one.
+    """
+
+    def __init__(self, path: Path, extra: dict = None):
+        self.path = Path(path)
+        self.extra = extra or {}
+        self.file = self.path.open("w", encoding="utf-8")
+        self.counts = {"pass": 0, "fail": 0, "skip": 0}
+        self.write_line({"started": datetime.now().isoformat(timespec="seconds"), **self.extra})
+
+    def write(self, record: dict) -> None:
+        self.counts[record["status"]] = self.counts.get(record["status"], 0) + 1
+        self.write_line({**record, **self.extra})
+
+    def write_line(self, data: dict) -> None:
+        self.file.write(json.dumps(data, default=str) + "\n")
+        self.file.flush()
+
+    def flush(self) -> None:
+        self.file.flush()
+
+    def close(self) -> None:
+        self.write_line({"summary": self.counts, **self.extra})
+        self.file.close()
+
+
+def xml_text(value) -> str:
+    return escape(INVALID_XML_CHARS.sub("\ufffd", str(value)))
+
+
+def xml_attr(value) -> str:
+    return quoteattr(INVALID_XML_CHARS.sub("\ufffd", str(value)))
+
+
+class JUnitXmlWriter:
+    """
+    Writes the results in the JUnit XML format understood by most CI
+    systems, with a `<testcase>` element for each test.
+
+    The `<testsuite>` element needs the test counts upfront, so the test
+    cases are written to a temporary file as they come, and copied after
+    the counts once all the tests are done.
+    """
+
+    def __init__(self, path: Path, suite_name: str = "http-test"):
+        self.path = Path(path)
+        self.suite_name = suite_name
+        self.testcases = tempfile.TemporaryFile(mode="w+", encoding="utf-8")
+        self.counts = {"pass": 0, "fail": 0, "skip": 0}
+        self.total_time = 0.0
+        self.timestamp = datetime.now().isoformat(timespec="seconds")
+
+    def write(self, record: dict) -> None:
+        self.counts[record["status"]] = self.counts.get(record["status"], 0) + 1
+
+        elapsed = record.get("elapsed") or 0.0
+        self.total_time += elapsed
+
+        testcase = [
+            f"    <testcase classname={xml_attr(record.get('file') or self.suite_name)}"
+            f" name={xml_attr(record['name'])} time={xml_attr(f'{elapsed:.6f}')}>"
+        ]
+
+        if record["status"] == "skip":
+            testcase.append("      <skipped/>")
+        elif record["status"] == "fail":
+            fail_reason = record.get("fail_reason") or ""
+            message = fail_reason.splitlines()[0] if fail_reason else "failed"
+            testcase.append(f"      <failure message={xml_attr(message)}>{xml_text(fail_reason)}</failure>")
+            if record.get("response_body") is not None:
+                testcase.append(f"      <system-err>{xml_text(record['response_body'])}</system-err>")
+
+        details = {
+            "description": record.get("description"),
+            "request_id": record.get("request_id"),
+            "status_code": record.get("status_code"),
+            "timings": record.get("timings"),
+            "size_download": record.get("size_download"),
+            "size_upload": record.get("size_upload"),
+        }
+        testcase.append(f"      <system-out>{xml_text(json.dumps(details, default=str))}</system-out>")
+        testcase.append("    </testcase>")
+
+        self.testcases.write("\n".join(testcase) + "\n")
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        tests = sum(self.counts.values())
+
+        with self.path.open("w", encoding="utf-8") as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            f.write(f"<testsuites tests=\"{tests}\" failures=\"{self.counts['fail']}\">\n")
+            f.write(
+                f"  <testsuite name={xml_attr(self.suite_name)} tests=\"{tests}\" failures=\"{self.counts['fail']}\""
+                f' errors="0" skipped="{self.counts["skip"]}" time="{self.total_time:.6f}"'
+                f" timestamp={xml_attr(self.timestamp)} hostname={xml_attr(socket.gethostname())}>\n"
+            )
+
+            self.testcases.seek(0)
+            shutil.copyfileobj(self.testcases, f)
+
+            f.write("  </testsuite>\n")
+            f.write("</testsuites>\n")
+
+        self.testcases.close()
+
+
+def read_results(path: Path):
+    """
+    Yields the lines of a JSON lines results file, including the header
+    and the summary.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def merge_results(paths: list) -> dict:
+    """
+    Merges the results files of all the shards of a test suite.
+
+    Returns a dict with the merged `records`, the `shards` that completed,
+    the `missing_shards` whose results file wasn't given, and the
+    `incomplete_files`: those of the runs interrupted before writing their
+    summary, sharded or not.
+    """
+    records = []
+    shards = set()
+    given_shards = set()
+    shard_count = None
+    incomplete_files = []
+
+    for path in paths:
+        is_complete = False
+
+        for line in read_results(path):
+            shard = line.get("shard")
+            if shard:
+                index, shard_count = map(int, shard.split("/"))
+                given_shards.add(index)
+
+            if "summary" in line:
+                is_complete = True
+                if shard:
+                    shards.add(index)
+                continue
+
+            if "started" in line:
+                continue
+
+            records.append(line)
+
+        if not is_complete:
+            incomplete_files.append(str(path))
+
+    missing_shards = sorted(set(range(1, shard_count + 1)) - given_shards) if shard_count else []
+
+    return {
+        "records": records,
+        "shards": sorted(shards),
+        "missing_shards": missing_shards,
+        "incomplete_files": incomplete_files,
+    }
+
+
+def durations_from_results(records: list) -> dict:
+    """
+    Returns a dict mapping each test id to its duration in seconds, to be
+    used to balance the shards of the next runs (see `--durations`).
+    """
+    return {record["id"]: record["elapsed"] for record in records if record.get("elapsed") is not None}
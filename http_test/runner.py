@@ -1,15 +1,27 @@
+import concurrent.futures
 import logging
+import multiprocessing
+import os
+import time
+from collections import Counter, deque
 from pathlib import Path
 
-from http_test.spec import SpecFile, SpecTest
+from http_test.cache import SpecCache
+from http_test.colors import GREEN, RED, RESET, YELLOW
+from http_test.multi import DEFAULT_MAX_STREAMS, CurlMultiDriver
+from http_test.request import is_timeout_error
+from http_test.sharding import select_shard
+from http_test.spec import SpecError, SpecFile, SpecTest
+from http_test.ws_request import get_background_loop
 
-RED = "\033[91m"
-GREEN = "\033[92m"
-YELLOW = "\033[93m"
-RESET = "\033[0m"
+# How much of the response body to keep in the records of failed tests
+MAX_BODY_EXCERPT = 2048
 
+# Failure reason of the tests that couldn't start before the suite deadline
+DEADLINE_EXCEEDED = "Timed out: suite deadline exceeded"
 
-def inject_test_config_dict(test: dict, target_host: str, template_vars: dict) -> None:
+
+def inject_test_config_dict(test: dict, target_host: str, template_vars: dict, run_config: dict = None) -> None:
     """
     This is a bad kludge to keep the conftest.py pytest plugin working
 
@@ -23,12 +35,17 @@ def inject_test_config_dict(test: dict, target_host: str, template_vars: dict) -
     used in various attributes of the yaml file, such as `url`, `headers`, and
     others. This makes the yaml test files parametric, which is super handy
     if you want to test different environments with the same test files.
+
+    The `run_config` settings, f.ex. the `cassette`, apply to the whole run,
+    unless the YAML file sets them itself.
     """
     config = test["spec"].get("config", dict())
     if target_host:
         config["target_host"] = target_host
     if template_vars:
         config["template_vars"] = template_vars
+    for key, value in (run_config or {}).items():
+        config.setdefault(key, value)
 
     if config:
         test["spec"]["config"] = config
@@ -36,49 +53,639 @@ def inject_test_config_dict(test: dict, target_host: str, template_vars: dict) -
     return
 
 
-def run_specfiles(
+def spec_file_id(test_filename) -> str:
+    """
+    Returns the path of a test file as used in the test ids: normalized,
+    and relative to the current directory, so that the ids, and the shards
+    they're in, don't depend on how the path was given.
+    """
+    try:
+        path = os.path.relpath(test_filename)
+    except ValueError:
+        # On Windows, a file on another drive than the current directory
+        path = os.path.abspath(test_filename)
+    return Path(path).as_posix()
+
+
+def iter_spec_tests(
     test_files: list,
     target_host: str = None,
     template_vars: dict = None,
-    verbose: bool = False,
+    cache: SpecCache = None,
+    shard: tuple = None,
+    durations: dict = None,
+    run_config: dict = None,
 ):
-    fail_count = 0
+    """
+    Loads the YAML test files one at a time, and yields a `SpecTest`
+    instance for each test found. Raises a `SpecError`, naming the file,
+    for the first invalid test.
 
-    ok_mark = GREEN + "✓" + RESET
-    ko_mark = RED + "✗" + RESET
-    skip_mark = YELLOW + "⚠" + RESET
+    The `run_config` settings are added to the config of each test, see
+    `inject_test_config_dict()`.
+
+    With `shard` as a `(K, N)` tuple, only the tests belonging to shard K
+    out of N are yielded (see `http_test.sharding`).
+    """
+    if shard is not None:
+        specs = iter_spec_tests(
+            test_files, target_host=target_host, template_vars=template_vars, cache=cache, run_config=run_config
+        )
+        yield from select_shard(specs, *shard, durations=durations)
+        return
 
     for test_filename in test_files:
         test_file = Path(test_filename)
         spec_file = SpecFile(path=test_file)
-        tests = spec_file.load_tests(template_vars=template_vars)
+        tests = spec_file.load_tests(template_vars=template_vars, cache=cache)
+        file_id = spec_file_id(test_filename)
+        test_ids = {}
 
         for test in tests:
-            inject_test_config_dict(test, target_host, template_vars)
-            spec = SpecTest(name=test["name"], spec=test["spec"])
+            inject_test_config_dict(test, target_host, template_vars, run_config)
 
-            is_skipped = False
+            # Test ids must be unique, even if two tests share the same name
+            test_id = f"{file_id}::{test['name']}"
+            test_ids[test_id] = test_ids.get(test_id, 0) + 1
+            if test_ids[test_id] > 1:
+                test_id = f"{test_id}#{test_ids[test_id]}"
 
             try:
-                is_success, fail_reason = spec.run()
-            except AssertionError as e:
-                is_success = False
-                fail_reason = str(e)
-
-            if fail_reason == "skipped":
-                is_skipped = True
-                fail_reason = None
-
-            if verbose:
-                test_description = spec.describe()
-                if is_skipped:
-                    print(f"{skip_mark} {test_description} (SKIPPED)")
+                spec = SpecTest(name=test["name"], spec=test["spec"], test_id=test_id, spec_file=str(test_filename))
+            except SpecError as e:
+                raise SpecError(f"{test_filename}: {e}") from e
+            yield spec
+
+
+def run_spec_test(spec: SpecTest, deadline: float = None):
+    """
+    Runs a single test, returning a `(is_success, fail_reason)` tuple.
+    A request timing out fails its test, rather than interrupting the run.
+    """
+    if is_past_deadline(spec, deadline):
+        return False, DEADLINE_EXCEEDED
+
+    try:
+        return spec.run(deadline=deadline)
+    except AssertionError as e:
+        return False, str(e)
+    except Exception as e:
+        if is_timeout_error(e):
+            return timeout_outcome(e, deadline)
+        raise
+
+
+def is_past_deadline(spec: SpecTest, deadline: float) -> bool:
+    return deadline is not None and not spec.skip() and time.time() >= deadline
+
+
+def timeout_outcome(error: Exception, deadline: float) -> tuple:
+    """
+    Returns the `(is_success, fail_reason)` outcome of a request that
+    timed out, either on its own or because of the suite deadline.
+    """
+    if deadline is not None and time.time() >= deadline:
+        return False, DEADLINE_EXCEEDED
+
+    # pycurl errors are a `(code, message)` tuple
+    message = error.args[-1] if error.args else "request timed out"
+    return False, f"Timed out: {message}"
+
+
+def verify_spec_test(spec: SpecTest, result: dict):
+    """
+    Same as `run_spec_test()`, for a test whose request was already fired.
+    """
+    try:
+        return spec.verify(result)
+    except AssertionError as e:
+        return False, str(e)
+
+
+def run_shared_spec_test(spec: SpecTest, shared_results: dict, remaining_uses: Counter, deadline: float = None):
+    """
+    Same as `run_spec_test()`, but the request is only fired if no identical
+    request was fired before, otherwise the earlier result is verified.
+    """
+    if is_past_deadline(spec, deadline):
+        return False, DEADLINE_EXCEEDED
+
+    request = spec.build_request(deadline=deadline)
+    key = request.fingerprint()
+
+    result = shared_results.get(key)
+    if result is None:
+        try:
+            result = request.fire()
+        except Exception as e:
+            if is_timeout_error(e):
+                return timeout_outcome(e, deadline)
+            raise
+
+    if is_last_use(remaining_uses, key):
+        shared_results.pop(key, None)
+    else:
+        shared_results[key] = result
+
+    return verify_spec_test(spec, result)
+
+
+def is_shared(spec: SpecTest, share_requests: bool) -> bool:
+    return share_requests and not spec.skip() and spec.can_share_request()
+
+
+def count_shared_requests(specs: list) -> Counter:
+    """
+    Returns how many tests share each request, by request fingerprint, so
+    that each shared result can be dropped as soon as the last of its tests
+    got it, rather than being kept for the whole run.
+    """
+    uses = Counter()
+    for spec in specs:
+        if not is_shared(spec, True):
+            continue
+        try:
+            uses[spec.build_request().fingerprint()] += 1
+        except Exception:
+            # The error is raised again when the test is run
+            continue
+    return uses
+
+
+def is_last_use(remaining_uses: Counter, key: str) -> bool:
+    """
+    Counts one more test getting the shared result of the request `key`,
+    and returns True if no other test will need it.
+    """
+    remaining_uses[key] -= 1
+    return remaining_uses[key] <= 0
+
+
+def run_spec_tests(
+    specs,
+    concurrency: int = 1,
+    ws_concurrency: int = None,
+    share_requests: bool = False,
+    deadline: float = None,
+    multiplex: bool = False,
+    max_streams: int = DEFAULT_MAX_STREAMS,
+):
+    """
+    Runs the given tests, and yields a `(spec, is_success, fail_reason)`
+    tuple for each of them, in the same order the tests were given.
+
+    With `concurrency` greater than 1, up to `concurrency` pycurl requests
+    are kept in flight at the same time through a `pycurl.CurlMulti` loop,
+    and up to `ws_concurrency` websocket requests (same as `concurrency`
+    by default) run at the same time in the background event loop.
+
+    With `share_requests`, tests with identical requests (see
+    `Request.fingerprint()`) share a single fetch, and each of them verifies
+    its own requirements against the same result. Tests marked `no_share`
+    always fire their own request.
+
+    With `multiplex`, concurrent HTTP/2 tests to the same origin share
+    a single connection, with up to `max_streams` requests in flight on it
+    (see `CurlMultiDriver`).
+
+    With a `deadline` (wall clock time, see `time.time()`), the requests
+    still in flight at the deadline time out, and the tests not started
+    yet fail right away, so that the run can't take any longer.
+    """
+    # Results of the requests fired so far, by request fingerprint, kept
+    # until all the tests sharing them got them
+    shared_results = {}
+    remaining_uses = Counter()
+    if share_requests:
+        specs = list(specs)
+        remaining_uses = count_shared_requests(specs)
+
+    if concurrency <= 1:
+        for spec in specs:
+            if is_shared(spec, share_requests):
+                yield (spec, *run_shared_spec_test(spec, shared_results, remaining_uses, deadline))
+            else:
+                yield (spec, *run_spec_test(spec, deadline))
+        return
+
+    if ws_concurrency is None:
+        ws_concurrency = concurrency
+
+    # Completed tests are held back until all the tests that come before
+    # them are complete too, so the results are reported in the original
+    # order. This bounds how many tests can be started ahead of the oldest
+    # one that is still running.
+    max_pending = concurrency * 4
+
+    driver = CurlMultiDriver(multiplex=multiplex, max_streams=max_streams)
+    ws_futures = {}
+    pending = deque()
+    specs = iter(specs)
+    exhausted = False
+
+    try:
+        while True:
+            while (
+                not exhausted
+                and len(driver) < concurrency
+                and len(ws_futures) < ws_concurrency
+                and len(pending) < max_pending
+            ):
+                spec = next(specs, None)
+                if spec is None:
+                    exhausted = True
+                    break
+
+                entry = {"spec": spec, "outcome": None, "error": None, "followers": []}
+                pending.append(entry)
+
+                if spec.skip():
+                    entry["outcome"] = (True, "skipped")
+                    continue
+
+                if is_past_deadline(spec, deadline):
+                    entry["outcome"] = (False, DEADLINE_EXCEEDED)
+                    continue
+
+                try:
+                    request = spec.build_request(deadline=deadline)
+
+                    if is_shared(spec, share_requests):
+                        key = request.fingerprint()
+                        leader = shared_results.get(key)
+                        if is_last_use(remaining_uses, key):
+                            # No later test looks for this request, nor
+                            # needs its result once complete
+                            leader = shared_results.pop(key, leader)
+                            if leader is not None:
+                                leader["keep_result"] = False
+                        if leader is not None:
+                            # An identical request was already fired: wait
+                            # for its result, or verify it right away
+                            if leader["error"] is not None:
+                                entry["error"] = leader["error"]
+                            elif "timeout" in leader:
+                                entry["outcome"] = leader["timeout"]
+                            elif "result" in leader:
+                                entry["outcome"] = verify_spec_test(spec, leader["result"])
+                                if not leader["keep_result"]:
+                                    del leader["result"]
+                            else:
+                                leader["followers"].append(entry)
+                            continue
+                        if remaining_uses[key] > 0:
+                            entry["keep_result"] = True
+                            shared_results[key] = entry
+
+                    if request.is_websockets_request():
+                        future = get_background_loop().submit(request.websockets_request())
+                        ws_futures[future] = (request, entry)
+                    else:
+                        driver.add(request, tag=entry)
+                except Exception as e:
+                    entry["error"] = e
+
+            while pending and (pending[0]["outcome"] is not None or pending[0]["error"] is not None):
+                entry = pending.popleft()
+                if entry["error"] is not None:
+                    # Same as in the sequential case, anything other than
+                    # a failed assertion interrupts the whole run.
+                    raise entry["error"]
+                yield (entry["spec"], *entry["outcome"])
+
+            if exhausted and not pending:
+                break
+
+            if len(driver):
+                # Don't let the curl requests hold up the websocket ones
+                # for too long, their completion is checked in between.
+                timeout = 0.05 if ws_futures else 1.0
+                for entry, result, error in driver.poll(timeout):
+                    complete_entry(entry, result, error, deadline)
+                done = [future for future in ws_futures if future.done()]
+            else:
+                done, _ = concurrent.futures.wait(ws_futures, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for future in done:
+                request, entry = ws_futures.pop(future)
+                try:
+                    result = request.decode_result(future.result())
+                except Exception as e:
+                    complete_entry(entry, None, e, deadline)
                 else:
-                    print(f"{ok_mark if is_success else ko_mark} {test_description}")
-                    if not is_success:
-                        print(f"    {RED}{fail_reason}{RESET}")
+                    complete_entry(entry, result, None, deadline)
+    finally:
+        driver.close()
+        for future in ws_futures:
+            future.cancel()
+
+
+def complete_entry(entry: dict, result: dict, error: Exception, deadline: float = None) -> None:
+    """
+    Records the outcome of a completed request for its test, and for all
+    the tests that were waiting to share the same result.
+    """
+    if error is not None and is_timeout_error(error):
+        # Timeouts fail the tests, and don't interrupt the run
+        entry["timeout"] = timeout_outcome(error, deadline)
+        error = None
+
+    for waiting_entry in [entry] + entry["followers"]:
+        if error is not None:
+            waiting_entry["error"] = error
+        elif "timeout" in entry:
+            waiting_entry["outcome"] = entry["timeout"]
+        else:
+            waiting_entry["outcome"] = verify_spec_test(waiting_entry["spec"], result)
+
+    entry["followers"] = []
+    # Only kept for the tests sharing the same request that come later
+    if error is None and "timeout" not in entry and entry.get("keep_result"):
+        entry["result"] = result
+
+
+def result_record(spec: SpecTest, is_success: bool, fail_reason: str) -> dict:
+    """
+    Returns a compact record of a test outcome, without the response headers
+    and body. Records are what gets reported, and what worker processes send
+    back to the parent process.
+    """
+    if fail_reason == "skipped":
+        status = "skip"
+    else:
+        status = "pass" if is_success else "fail"
+
+    result = spec.test_result[0] if spec.test_result else {}
+
+    record = {
+        "id": spec.test_id,
+        "file": spec.spec_file,
+        "name": spec.name,
+        "description": spec.describe(),
+        "host": spec.target_host(),
+        "status": status,
+        "fail_reason": fail_reason if status == "fail" else None,
+        "request_id": result.get("request_id"),
+        "status_code": result.get("status_code"),
+        "elapsed": result.get("elapsed"),
+        "timings": result.get("timings"),
+        "size_download": result.get("size_download"),
+        "size_upload": result.get("size_upload"),
+    }
+
+    # The response body helps finding out why a test failed, but it's
+    # only kept for failed tests, and only its beginning
+    if status == "fail" and result.get("response_body_decoded") is not None:
+        record["response_body"] = body_excerpt(result["response_body_decoded"])
+
+    return record
+
+
+def body_excerpt(body: bytes, max_size: int = MAX_BODY_EXCERPT) -> str:
+    excerpt = body[:max_size].decode("utf-8", errors="replace")
+    if len(body) > max_size:
+        excerpt += f"... [{len(body) - max_size} more bytes]"
+    return excerpt
+
+
+def iter_result_records(outcomes):
+    """
+    Yields a result record for each `(spec, is_success, fail_reason)`
+    outcome. The full results of each test are dropped as soon as its
+    record is built, so memory use doesn't grow with the number of tests.
+    """
+    for spec, is_success, fail_reason in outcomes:
+        record = result_record(spec, is_success, fail_reason)
+        spec.test_result = []
+        yield record
+
+
+def print_result_record(record: dict) -> None:
+    ok_mark = GREEN + "✓" + RESET
+    ko_mark = RED + "✗" + RESET
+    skip_mark = YELLOW + "⚠" + RESET
+
+    test_description = record["description"]
+
+    if record["status"] == "skip":
+        print(f"{skip_mark} {test_description} (SKIPPED)")
+    elif record["status"] == "pass":
+        print(f"{ok_mark} {test_description}")
+    else:
+        print(f"{ko_mark} {test_description}")
+        print(f"    {RED}{record['fail_reason']}{RESET}")
+
+
+# Tests loaded by each worker process, see `init_worker()`
+_worker_specs = None
+
+
+def init_worker(
+    test_files: list, target_host: str, template_vars: dict, cache_dir: str, shard, durations, run_config: dict
+) -> None:
+    """
+    Worker processes load the tests by themselves, so only the test index
+    ranges, and not the whole test specs, have to be sent to them.
+    """
+    global _worker_specs
+
+    cache = SpecCache(directory=cache_dir) if cache_dir else None
+    specs = iter_spec_tests(
+        test_files,
+        target_host=target_host,
+        template_vars=template_vars,
+        cache=cache,
+        shard=shard,
+        durations=durations,
+        run_config=run_config,
+    )
+    _worker_specs = list(specs)
+
+
+def run_worker_batch(
+    start: int,
+    end: int,
+    concurrency: int,
+    ws_concurrency: int,
+    share_requests: bool,
+    deadline: float,
+    multiplex: bool,
+    max_streams: int,
+) -> list:
+    """
+    Runs the tests in the `[start, end)` range in a worker process, each
+    worker using its own connection pool. Returns their result records.
+    """
+    outcomes = run_spec_tests(
+        _worker_specs[start:end],
+        concurrency=concurrency,
+        ws_concurrency=ws_concurrency,
+        share_requests=share_requests,
+        deadline=deadline,
+        multiplex=multiplex,
+        max_streams=max_streams,
+    )
+    return list(iter_result_records(outcomes))
+
+
+def run_in_workers(
+    test_files: list,
+    target_host: str = None,
+    template_vars: dict = None,
+    workers: int = 2,
+    concurrency: int = 1,
+    ws_concurrency: int = None,
+    cache: SpecCache = None,
+    shard: tuple = None,
+    durations: dict = None,
+    share_requests: bool = False,
+    deadline: float = None,
+    multiplex: bool = False,
+    max_streams: int = DEFAULT_MAX_STREAMS,
+    run_config: dict = None,
+):
+    """
+    Runs the tests split in contiguous batches across a pool of `workers`
+    processes, and yields their result records in the original test order.
+    """
+    # Loading all the tests also validates them before the workers start
+    specs = iter_spec_tests(
+        test_files, target_host, template_vars, cache=cache, shard=shard, durations=durations, run_config=run_config
+    )
+    test_count = sum(1 for _ in specs)
+
+    # Smaller batches than strictly needed, so that a batch of slow tests
+    # doesn't leave the other workers idle, and results can be reported
+    # while the run progresses.
+    batch_size = max(1, -(-test_count // (workers * 4)))
+
+    # Worker processes are spawned rather than forked, as a forked process
+    # would share the parent's pycurl handles and background event loop.
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(
+            test_files,
+            target_host,
+            template_vars,
+            str(cache.directory) if cache else None,
+            shard,
+            durations,
+            run_config,
+        ),
+    )
+
+    with executor:
+        futures = [
+            executor.submit(
+                run_worker_batch,
+                start,
+                min(start + batch_size, test_count),
+                concurrency,
+                ws_concurrency,
+                share_requests,
+                deadline,
+                multiplex,
+                max_streams,
+            )
+            for start in range(0, test_count, batch_size)
+        ]
+
+        for future in futures:
+            yield from future.result()
+
+
+def run_specfiles(
+    test_files: list,
+    target_host: str = None,
+    template_vars: dict = None,
+    verbose: bool = False,
+    concurrency: int = 1,
+    ws_concurrency: int = None,
+    cache: SpecCache = None,
+    workers: int = 1,
+    shard: tuple = None,
+    durations: dict = None,
+    result_sinks: list = None,
+    share_requests: bool = False,
+    deadline: float = None,
+    multiplex: bool = False,
+    max_streams: int = DEFAULT_MAX_STREAMS,
+    run_config: dict = None,
+):
+    """
+    Runs all the tests in the given YAML files, and returns the number of
+    failed tests. Each test result record is also written to all the
+    `result_sinks` (see `http_test.results` and `http_test.metrics`) as soon
+    as it's available, and the sinks are flushed at the end.
+
+    With a `deadline`, in seconds, the tests still running or not started
+    yet when the run has taken that long fail as timed out.
+
+    The `run_config` settings apply to all the tests, unless their YAML file
+    sets them itself: `max_body_size`, and the `cassette` file to record to
+    or replay from, in `cassette_mode`.
+    """
+    fail_count = 0
+    result_sinks = result_sinks or []
+
+    if deadline is not None:
+        # Wall clock time, as it's shared with the worker processes
+        deadline = time.time() + deadline
+
+    if workers > 1:
+        records = run_in_workers(
+            test_files,
+            target_host=target_host,
+            template_vars=template_vars,
+            workers=workers,
+            concurrency=concurrency,
+            ws_concurrency=ws_concurrency,
+            cache=cache,
+            shard=shard,
+            durations=durations,
+            share_requests=share_requests,
+            deadline=deadline,
+            multiplex=multiplex,
+            max_streams=max_streams,
+            run_config=run_config,
+        )
+    else:
+        # All the tests are loaded, and validated, before the first request
+        specs = list(
+            iter_spec_tests(
+                test_files,
+                target_host=target_host,
+                template_vars=template_vars,
+                cache=cache,
+                shard=shard,
+                durations=durations,
+                run_config=run_config,
+            )
+        )
+        outcomes = run_spec_tests(
+            specs,
+            concurrency=concurrency,
+            ws_concurrency=ws_concurrency,
+            share_requests=share_requests,
+            deadline=deadline,
+            multiplex=multiplex,
+            max_streams=max_streams,
+        )
+        records = iter_result_records(outcomes)
+
+    for record in records:
+        if verbose:
+            print_result_record(record)
+
+        for sink in result_sinks:
+            sink.write(record)
+
+        if record["status"] == "fail":
+            fail_count += 1
 
-            if not is_success:
-                fail_count += 1
+    for sink in result_sinks:
+        sink.flush()
 
     return fail_count
@@ -0,0 +1,89 @@
+"""
+This module splits a test suite into shards, so that the same YAML files can
+be run from several machines, each one running a different subset of tests.
+
+The selection is deterministic: given the same test files, every node
+computes the same partition, without any coordination between them.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+
+def parse_shard(shard: str) -> tuple:
+    """
+    Parses a `K/N` shard specification into a `(K, N)` tuple.
+    Shards are numbered from 1 to N.
+    """
+    try:
+        index, count = map(int, shard.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{shard}', must be in the form K/N, f.ex. 1/4")
+
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{shard}', K must be between 1 and N")
+
+    return index, count
+
+
+def load_durations(path: Path) -> dict:
+    """
+    Loads a JSON file mapping test ids to their duration in seconds,
+    as written by `http-test-merge-results.py --durations-output`.
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+def shard_of(test_id: str, count: int) -> int:
+    """
+    Returns the shard (1 to `count`) a test belongs to, based on a stable
+    hash of its id. Python's `hash()` can't be used, as it's randomized
+    for each process.
+    """
+    digest = hashlib.sha1(test_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+
+def balance_shards(test_ids: list, count: int, durations: dict) -> dict:
+    """
+    Assigns the tests to shards so that each shard takes about the same
+    time to run, according to their historical durations. Tests are assigned
+    longest first, each to the shard with the smallest total so far.
+    Tests without a known duration count as the average duration.
+
+    Returns a dict mapping each test id to its shard (1 to `count`).
+    """
+    known_durations = [durations[t] for t in test_ids if durations.get(t) is not None]
+    default_duration = sum(known_durations) / len(known_durations) if known_durations else 1.0
+
+    # Ties are broken by test id, so every node sorts the same way
+    weighted = sorted(
+        ((durations.get(t) if durations.get(t) is not None else default_duration, t) for t in test_ids),
+        key=lambda d: (-d[0], d[1]),
+    )
+
+    totals = [0.0] * count
+    assignment = {}
+
+    for duration, test_id in weighted:
+        shard = min(range(count), key=lambda s: (totals[s], s))
+        totals[shard] += duration
+        assignment[test_id] = shard + 1
+
+    return assignment
+
+
+def select_shard(specs, index: int, count: int, durations: dict = None) -> list:
+    """
+    Returns the tests belonging to shard `index` of `count`, in their
+    original order.
+    """
+    specs = list(specs)
+
+    if durations:
+        assignment = balance_shards([spec.test_id for spec in specs], count, durations)
+        return [spec for spec in specs if assignment[spec.test_id] == index]
+
+    return [spec for spec in specs if shard_of(spec.test_id, count) == index]
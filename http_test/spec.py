@@ -9,19 +9,42 @@ embedded in here.
 
 import difflib
 import os
+import re
 import urllib.parse
 from pathlib import Path
 
 import yaml
 
-from http_test.request import Request
+from http_test.cache import SpecCache
+from http_test.cassette import REPLAY, get_cassette
+from http_test.decoding import DEFAULT_MAX_DECODED_SIZE
+from http_test.headers import ResponseHeaders, as_response_headers
+from http_test.matcher import BodyMatcher
+from http_test.request import DEFAULT_CONNECT_TIMEOUT, DEFAULT_MIN_SPEED_TIME, Request
+
+# The libyaml based loader is much faster, when available
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+_jinja_environment = None
+
+# How much of the response body to include in the failure messages
+MAX_DUMP_BODY_SIZE = 1024
+
+# Request phases that can be used in `match.timing`. See `Request.get_timings()`
+TIMING_PHASES = ("total", "dns", "connect", "tls", "pretransfer", "server", "ttfb", "transfer", "redirect")
+
+
+class SpecError(ValueError):
+    """
+    An invalid test, f.ex. with a misspelled requirement.
+    """
 
 
 class SpecFile:
     def __init__(self, path: Path):
         self.path = path
 
-    def preprocess_yaml(self, template_vars=None):
+    def preprocess_yaml(self, template_vars=None, original_yaml: str = None):
         """
         Process the source YAML test file with Jinja2 replacing all variables.
         This will also execute any jinja2 directives present in the source YAML
@@ -30,18 +53,39 @@ class SpecFile:
         This is useful to factor out common expressions to use those across
         all the spec tests in a single YAML file.
         """
-        original_yaml = self.path.open().read()
+        if original_yaml is None:
+            original_yaml = self.path.open().read()
 
+        replaced_yaml = render_template(original_yaml, self.template_variables(template_vars))
+        return replaced_yaml
+
+    def template_variables(self, template_vars=None) -> dict:
+        """
+        Returns all the variables available to the Jinja2 templates.
+        """
         env_vars = get_httptest_env_variables()
         if template_vars:
             env_vars.update(template_vars)
+        return env_vars
 
-        replaced_yaml = replace_variables(original_yaml, env_vars)
-        return replaced_yaml
+    def load_tests(self, template_vars=None, cache: SpecCache = None):
+        """
+        Loads the list of tests from the YAML file. If a `SpecCache` is given,
+        the tests are loaded from it when neither the file contents nor the
+        template variables have changed since the last time.
+        """
+        original_yaml = self.path.open().read()
+        # Collected once, for both the cache key and the templates
+        variables = self.template_variables(template_vars)
 
-    def load_tests(self, template_vars=None):
-        yaml_document = self.preprocess_yaml(template_vars=template_vars)
-        test_config = yaml.safe_load(yaml_document)
+        if cache is not None:
+            cache_key = cache.key(original_yaml.encode("utf-8"), variables)
+            tests = cache.get(cache_key)
+            if tests is not None:
+                return tests
+
+        yaml_document = render_template(original_yaml, variables)
+        test_config = yaml.load(yaml_document, Loader=YAML_LOADER)
         test_specs = test_config.get("tests", [])
         tests = []
 
@@ -55,15 +99,34 @@ class SpecFile:
                 }
             )
 
+        if cache is not None:
+            cache.put(cache_key, tests)
+
         return tests
 
 
 class SpecTest:
-    def __init__(self, name: str, spec: dict):
+    def __init__(self, name: str, spec: dict, test_id: str = None, spec_file: str = None):
         self.name = name
         self.spec = spec
+        self.test_id = test_id if test_id else name
+        self.spec_file = spec_file
         self.test_result = []
 
+        # Unknown or invalid requirements are reported as soon as
+        # the test is loaded, rather than when it's run
+        try:
+            self.requirements = Requirements(spec.get("match"))
+        except ValueError as e:
+            raise SpecError(f"Test '{name}': {e}") from e
+
+        if spec.get("payload") and spec.get("payload_file"):
+            raise SpecError(f"Test '{name}': only one of 'payload' and 'payload_file' can be set")
+
+        payload = spec.get("payload")
+        if payload is not None and not isinstance(payload, (str, bytes)):
+            raise SpecError(f"Test '{name}': invalid payload {payload!r}, must be a string, f.ex. quoted in YAML")
+
     def describe(self):
         url = url_from_spec(self.spec)
         connect_to = resolve_connect_to(url, self.spec["config"])
@@ -74,54 +137,55 @@ class SpecTest:
     def skip(self):
         return self.spec.get("skip", False)
 
-    def run(self):
-        test_config = self.spec["config"]
-        test_spec = self.spec
+    def target_host(self) -> str:
+        """
+        Returns the host the test request is sent to: the target host,
+        when set, or else the host in the test URL.
+        """
+        target_host = self.spec["config"].get("target_host", os.environ.get("HTTPTEST_TARGET_HOST"))
+        return target_host or urllib.parse.urlparse(url_from_spec(self.spec)).hostname
+
+    def can_share_request(self):
+        """
+        Tests marked `no_share` always fire their own request, even when
+        request sharing is enabled for the run.
+        """
+        return not self.spec.get("no_share", False)
 
+    def run(self, deadline: float = None):
         # Test is marked as skipped: don't run, but output the assertion
         if self.skip():
             is_success = True
             fail_reason = "skipped"
             return is_success, fail_reason
 
-        request: Request = request_from_spec(test_spec, test_config)
+        request: Request = self.build_request(deadline=deadline)
         result = request.fire()
 
-        self.test_result = [result]
-
-        requirements = test_spec.get("match")
-        template_vars = test_config.get("template_vars")
-        is_success = verify_response(result, requirements, template_vars)
-        assert_msg = self.describe()
+        return self.verify(result)
 
+    def build_request(self, deadline: float = None) -> Request:
         """
-        # Repeat the same test connecting to a different IP address
-        # and comparing the two responses
-        if connect_to:
-            request2 = request_from_spec(test_spec, test_config)
-            request2.request_id = request.request_id + "/CT"
-            request2.connect_to = connect_to
-            result2 = request2.fire()
-
-            self.test_result.append(result2)
-
-            is_success = verify_response(result2, requirements)
-            assert is_success, f"Failed: {test_spec.get('description')} (connect_to: {connect_to})"
-
-        is_http_200_expected = test_spec.get("match", {}).get("status", "") == str(200)
-        compare_responses = is_http_200_expected
-
-        if connect_to and compare_responses:
-            import hashlib
+        Builds the test request. With a `deadline` (wall clock time, see
+        `time.time()`), the request times out at the deadline at the latest.
+        """
+        request = request_from_spec(self.spec, self.spec["config"], body_matcher=self.requirements.body_matcher)
+        request.deadline = deadline
+        return request
 
-            hash1 = hashlib.sha256()
-            hash1.update(result.get("response_body"))
+    def verify(self, result: dict):
+        """
+        Verifies the result of a fired request against the test requirements.
+        Like `run()`, raises an `AssertionError` on failure.
+        """
+        self.test_result = [result]
 
-            hash2 = hashlib.sha256()
-            hash2.update(result2.get("response_body"))
+        # Errors that happened while performing the request, f.ex.
+        # a response body that couldn't be decoded
+        assert not result.get("error"), result.get("error")
 
-            assert hash1.hexdigest() == hash2.hexdigest(), f"Response object from connect-to doesn't match original"
-        """
+        is_success = self.requirements.verify(result)
+        assert_msg = self.describe()
 
         try:
             assert is_success, assert_msg
@@ -131,6 +195,15 @@ class SpecTest:
 
 
 def _dump(result: dict):
+    # Keep failure messages readable, and small, even for large responses
+    result = dict(result)
+    if isinstance(result.get("response_headers"), ResponseHeaders):
+        result["response_headers"] = result["response_headers"].as_dict()
+    for key in ("response_body", "response_body_decoded"):
+        body = result.get(key)
+        if body is not None and len(body) > MAX_DUMP_BODY_SIZE:
+            result[key] = body[:MAX_DUMP_BODY_SIZE] + f"... [{len(body) - MAX_DUMP_BODY_SIZE} more bytes]".encode()
+
     return yaml.safe_dump(result)
 
 
@@ -148,101 +221,305 @@ def get_httptest_env_variables():
     return httptest_vars
 
 
-def replace_variables(s: str, vars: dict = None) -> str:
-    import jinja2
+def get_jinja_environment():
+    """
+    Returns the Jinja2 environment used to render all the YAML files.
+    """
+    global _jinja_environment
+
+    if _jinja_environment is None:
+        import jinja2
+
+        _jinja_environment = jinja2.Environment()
 
+    return _jinja_environment
+
+
+def render_template(s: str, vars: dict) -> str:
+    """
+    Renders the given Jinja2 template string with exactly the given variables.
+    """
+    return get_jinja_environment().from_string(s).render(**vars)
+
+
+def replace_variables(s: str, vars: dict = None) -> str:
     httptest_vars = get_httptest_env_variables()
     if vars:
         httptest_vars.update(vars)
 
-    t = jinja2.Template(s)
-    return t.render(**httptest_vars)
+    return render_template(s, httptest_vars)
 
 
-def verify_response(result: dict, requirements: dict, template_vars: dict = None) -> bool:
-    if not requirements:
-        return True
+def parse_duration(duration) -> float:
+    """
+    Parses a duration such as `500ms`, `1.5s`, `5m`, `1h` or `2` (seconds)
+    into seconds.
+    """
+    if isinstance(duration, (int, float)):
+        return float(duration)
+
+    duration = duration.strip()
+    if duration.endswith("ms"):
+        return float(duration[:-2]) / 1000
+    if duration.endswith("s"):
+        return float(duration[:-1])
+    if duration.endswith("m"):
+        return float(duration[:-1]) * 60
+    if duration.endswith("h"):
+        return float(duration[:-1]) * 3600
+
+    return float(duration)
+
+
+SIZE_UNITS = {"KB": 1024, "MB": 1024**2, "GB": 1024**3, "B": 1}
+
+
+def parse_size(size) -> int:
+    """
+    Parses a size such as `512KB`, `10MB`, `1GB` or `4096` (bytes) into bytes.
+    """
+    if isinstance(size, int):
+        return size
+
+    size = size.strip().upper()
+    for unit, multiplier in SIZE_UNITS.items():
+        if size.endswith(unit):
+            return int(float(size[: -len(unit)]) * multiplier)
+
+    return int(size)
+
+
+class StatusRequirement:
+    """
+    `status: 200` or `status: [200, 301]`
+    """
+
+    def __init__(self, expected_status_codes):
+        if expected_status_codes and not isinstance(expected_status_codes, list):
+            expected_status_codes = [expected_status_codes]
+
+        self.expected_status_codes = expected_status_codes
+        self.status_codes = frozenset(expected_status_codes or ())
 
-    for requirement in requirements.keys():
-        if requirement == "status":
-            status_code = result.get("status_code")
-            expected_status_codes = requirements.get("status")
-            if expected_status_codes and not isinstance(expected_status_codes, list):
-                expected_status_codes = [expected_status_codes]
+    def verify(self, result: dict) -> None:
+        status_code = result.get("status_code")
+        assert (
+            status_code in self.status_codes
+        ), f"Expected status codes {self.expected_status_codes}, got {status_code}"
+
+
+def split_header(header: str) -> tuple:
+    """
+    Splits a `name: value` header requirement into its name and value.
+    """
+    if ":" not in header:
+        raise ValueError(f"Invalid header requirement '{header}', must be in the form 'name: value'")
+
+    header_name, value = map(str.strip, header.split(":", 1))
+    return header_name, value
+
+
+def header_values(result: dict, header_name: str) -> list:
+    # A missing header has an empty value, for the failure messages
+    return as_response_headers(result.get("response_headers")).getall(header_name) or [""]
+
+
+class HeadersRequirement:
+    """
+    `headers: ["content-type: text/html"]`, each header must contain the
+    given value, case-insensitively.
+    """
+
+    def __init__(self, expected_headers: list):
+        self.expected_headers = []
+        for expected_header in expected_headers:
+            header_name, expected_value = split_header(expected_header)
+            self.expected_headers.append((header_name, expected_value, expected_value.lower()))
+
+    def verify(self, result: dict) -> None:
+        for header_name, expected_value, expected_value_lower in self.expected_headers:
+            at_least_one_matches = False
+
+            for actual_value in header_values(result, header_name):
+                if expected_value_lower in actual_value.lower():
+                    at_least_one_matches = True
+                    break
+
+            if at_least_one_matches:
+                continue
+
+            text_diff = "\n".join(list(difflib.ndiff([expected_value], [actual_value])))
+            raise AssertionError(
+                f"Expected header {header_name} to contain '{expected_value}'\n"
+                f"    was '{actual_value}'\n\nDiff:\n{text_diff}"
+            )
+
+
+class HeadersRegexRequirement:
+    """
+    `headers_regex: ["cache-control: max-age=\\d+"]`, each header must match
+    the given regular expression, case-insensitively.
+    """
+
+    def __init__(self, expected_headers: list):
+        self.expected_headers = []
+        for expected_header in expected_headers:
+            header_name, pattern = split_header(expected_header)
+            self.expected_headers.append((header_name, compile_regex(pattern, re.IGNORECASE)))
+
+    def verify(self, result: dict) -> None:
+        for header_name, regex in self.expected_headers:
+            actual_values = header_values(result, header_name)
+            assert any(
+                regex.search(actual_value) for actual_value in actual_values
+            ), f"Expected header {header_name} to match '{regex.pattern}'\n    was '{actual_values[-1]}'"
+
+
+class HeadersAbsentRequirement:
+    """
+    `headers_absent: ["x-debug"]`, header names are case-insensitive.
+    """
+
+    def __init__(self, expected_absent_headers: list):
+        self.absent_headers = {name.strip().lower(): name.strip() for name in expected_absent_headers}
+
+    def verify(self, result: dict) -> None:
+        response_headers = as_response_headers(result.get("response_headers"))
+        for lowercase_name, header_name in self.absent_headers.items():
             assert (
-                status_code in expected_status_codes
-            ), f"Expected status codes {expected_status_codes}, got {status_code}"
-
-        elif requirement == "headers":
-            response_headers = result.get("response_headers")
-            expected_headers = requirements.get("headers")
-
-            for expected_header in expected_headers:
-                header_name, expected_value = list(map(str.strip, expected_header.split(":", 1)))
-                actual_values = response_headers.get(header_name) or ""
-
-                # For multiple instances of the same HTTP header, get() returns a list
-                if not isinstance(actual_values, list):
-                    actual_values = [actual_values]
-
-                at_least_one_matches = False
-                matching_value = None
-
-                for actual_value in actual_values:
-                    # print(f"Checking header '{header_name}'='{actual_value}' for value '{expected_value}'")
-                    at_least_one_matches |= expected_value.lower() in actual_value.lower()
-                    if at_least_one_matches:
-                        matching_value = actual_value
-                        break
-
-                assert_message = (
-                    f"Expected header {header_name} to contain '{expected_value}'\n" f"    was '{actual_value}'"
-                )
-
-                if not at_least_one_matches:
-                    text_diff = "\n".join(list(difflib.ndiff([expected_value], [actual_value])))
-                    assert_message += f"\n\nDiff:\n{text_diff}"
-
-                assert at_least_one_matches, assert_message
-
-        elif requirement == "headers_absent":
-            response_headers = result.get("response_headers")
-            expected_absent_headers = requirements.get("headers_absent")
-
-            for header_name in expected_absent_headers:
-                header_name = header_name.strip()
-                # Check if header exists in response headers (case-insensitive)
-                header_exists = any(
-                    actual_header.lower() == header_name.lower()
-                    for actual_header in response_headers.keys()
-                )
-                assert not header_exists, f"Expected header '{header_name}' to be absent but it was found in response"
-
-        elif requirement == "timing":
-            elapsed_time_s = result.get("elapsed")
-            max_allowed_time = requirements.get("timing")
-            if max_allowed_time.endswith("ms"):
-                max_allowed_time_s = float(max_allowed_time[:-2]) / 1000
-            else:
-                max_allowed_time_s = max_allowed_time
+                lowercase_name not in response_headers
+            ), f"Expected header '{header_name}' to be absent but it was found in response"
+
+
+class TimingRequirement:
+    """
+    `timing: 500ms` is a shortcut for `timing: {total: 500ms}`. Any of the
+    `TIMING_PHASES` can be checked.
+    """
+
+    def __init__(self, max_allowed_times):
+        if not isinstance(max_allowed_times, dict):
+            max_allowed_times = {"total": max_allowed_times}
+
+        self.max_allowed_times = []
+        for phase, max_allowed_time in max_allowed_times.items():
+            if phase not in TIMING_PHASES:
+                raise ValueError(f"Unknown timing phase '{phase}', must be one of {', '.join(TIMING_PHASES)}")
+
+            phase_name = "elapsed" if phase == "total" else phase
+            self.max_allowed_times.append((phase, phase_name, parse_duration(max_allowed_time)))
+
+    def verify(self, result: dict) -> None:
+        timings = result.get("timings") or {"total": result.get("elapsed")}
+
+        for phase, phase_name, max_allowed_time_s in self.max_allowed_times:
+            elapsed_time_s = timings.get(phase)
+
+            assert (
+                elapsed_time_s is not None
+            ), f"Expected {phase_name} time to be less than {max_allowed_time_s}s, but it wasn't measured"
             assert (
                 elapsed_time_s < max_allowed_time_s
-            ), f"Expected elapsed time to be less than {max_allowed_time_s}s, got {elapsed_time_s}s instead"
+            ), f"Expected {phase_name} time to be less than {max_allowed_time_s}s, got {elapsed_time_s}s instead"
+
+
+class BodyRequirement:
+    """
+    `body: ["<html>"]`, the response body must contain all the given strings.
+    """
+
+    def __init__(self, expected_strings: list):
+        self.expected_strings = list(expected_strings)
+        self.expected_set = frozenset(self.expected_strings)
+        # Copied for each response, see `Requirements.body_matcher`
+        self.matcher = BodyMatcher(self.expected_strings)
+
+    def verify(self, result: dict) -> None:
+        # Body patterns are normally matched while the response is being
+        # downloaded. Otherwise, search for all of them in a single pass.
+        body_matches = result.get("body_matches")
+        if body_matches is None or not body_matches.keys() >= self.expected_set:
+            matcher = self.matcher.copy()
+            matcher.feed(result.get("response_body_decoded"))
+            body_matches = {pattern: matcher.is_found(pattern) for pattern in self.expected_strings}
+
+        for expected_string in self.expected_strings:
+            assert body_matches[
+                expected_string
+            ], f"Expected response body to contain '{expected_string}': {_dump(result)}"
+
+
+class BodyRegexRequirement:
+    """
+    `body_regex: ["<title>.+</title>"]`, the response body must match all
+    the given regular expressions.
+    """
+
+    def __init__(self, patterns: list):
+        self.regexes = [compile_regex(pattern.encode("utf-8")) for pattern in patterns]
+
+    def verify(self, result: dict) -> None:
+        body = result.get("response_body_decoded") or b""
+
+        for regex in self.regexes:
+            assert regex.search(
+                body
+            ), f"Expected response body to match '{regex.pattern.decode('utf-8')}': {_dump(result)}"
+
 
-        elif requirement == "body":
-            expected_strings = requirements.get("body")
-            response_body = result.get("response_body_decoded")
-            for expected_string in expected_strings:
-                # Must compare bytes vs bytes here
-                expected_bytes = expected_string.encode("utf-8")
-                assert (
-                    expected_bytes in response_body
-                ), f"Expected response body to contain '{expected_string}': {_dump(result)}"
+def compile_regex(pattern, flags=0):
+    try:
+        return re.compile(pattern, flags)
+    except re.error as e:
+        raise ValueError(f"Invalid regular expression '{pattern}': {e}")
 
-        else:
-            raise ValueError(f"Unknown or misspelled requirement '{requirement}'")
 
-    return True
+REQUIREMENTS = {
+    "status": StatusRequirement,
+    "headers": HeadersRequirement,
+    "headers_regex": HeadersRegexRequirement,
+    "headers_absent": HeadersAbsentRequirement,
+    "timing": TimingRequirement,
+    "body": BodyRequirement,
+    "body_regex": BodyRegexRequirement,
+}
+
+
+class Requirements:
+    """
+    The compiled form of a test's `match` section. Requirements are parsed
+    and validated only once, when the test is loaded, and can then be
+    verified against any number of responses.
+    """
+
+    def __init__(self, match: dict):
+        self.requirements = []
+
+        for requirement, value in (match or {}).items():
+            requirement_class = REQUIREMENTS.get(requirement)
+            if requirement_class is None:
+                raise ValueError(f"Unknown or misspelled requirement '{requirement}'")
+
+            self.requirements.append(requirement_class(value))
+
+        # The patterns of the `body` requirement, compiled only once, are
+        # also matched while the response is being downloaded
+        self.body_matcher = next(
+            (requirement.matcher for requirement in self.requirements if isinstance(requirement, BodyRequirement)), None
+        )
+
+    def verify(self, result: dict) -> bool:
+        """
+        Raises an `AssertionError` for the first requirement not met.
+        """
+        for requirement in self.requirements:
+            requirement.verify(result)
+
+        return True
+
+
+def verify_response(result: dict, requirements: dict, template_vars: dict = None) -> bool:
+    return Requirements(requirements).verify(result)
 
 
 def is_relative_url(url: str) -> bool:
@@ -283,7 +560,7 @@ def url_from_spec(test_spec: dict) -> str:
     return url
 
 
-def request_from_spec(test_spec: dict, test_config: dict) -> Request:
+def request_from_spec(test_spec: dict, test_config: dict, body_matcher: BodyMatcher = None) -> Request:
     """
     Transform the following YAML spec test into a Request object.
 
@@ -314,6 +591,35 @@ def request_from_spec(test_spec: dict, test_config: dict) -> Request:
     use_http2 = test_spec.get("http2", False)
     verbose_output = test_spec.get("verbose", False)
     payload = test_spec.get("payload", None)
+    # Large payloads are streamed from a file, relative to the current directory
+    payload_file = test_spec.get("payload_file", None)
+    chunked = test_spec.get("chunked", False)
+    fresh_connection = test_spec.get("fresh_connection", False)
+    body_patterns = (test_spec.get("match") or {}).get("body")
+    stop_on_match = test_spec.get("stop_on_match", False)
+    max_decoded_size = test_spec.get("max_decoded_size", test_config.get("max_decoded_size", DEFAULT_MAX_DECODED_SIZE))
+
+    # The maximum size of the (raw) response body can also be set for the
+    # whole run, f.ex. with `--max-body-size`, or through the
+    # `HTTPTEST_MAX_BODY_SIZE` environment variable
+    max_body_size = test_spec.get(
+        "max_body_size", test_config.get("max_body_size", os.environ.get("HTTPTEST_MAX_BODY_SIZE"))
+    )
+
+    # Timeouts can be set for a single test, or for all the tests in a file
+    timeout = test_spec.get("timeout", test_config.get("timeout"))
+    connect_timeout = test_spec.get("connect_timeout", test_config.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT))
+    min_speed = test_spec.get("min_speed", test_config.get("min_speed"))
+    min_speed_time = test_spec.get("min_speed_time", test_config.get("min_speed_time", DEFAULT_MIN_SPEED_TIME))
+
+    # Results are recorded to, or replayed from, a cassette file for the
+    # whole run, f.ex. with `--cassette`, or through the `HTTPTEST_CASSETTE`
+    # environment variables
+    cassette = None
+    cassette_path = test_config.get("cassette", os.environ.get("HTTPTEST_CASSETTE"))
+    if cassette_path:
+        cassette_mode = test_config.get("cassette_mode", os.environ.get("HTTPTEST_CASSETTE_MODE", REPLAY))
+        cassette = get_cassette(cassette_path, cassette_mode)
 
     if verbose_output:
         print()
@@ -322,10 +628,23 @@ def request_from_spec(test_spec: dict, test_config: dict) -> Request:
         url=url,
         connect_to=connect_to,
         payload=payload,
+        payload_file=payload_file,
+        chunked=chunked,
         method=method,
         headers=headers,
         verbose=verbose_output,
         http2=use_http2,
+        fresh_connection=fresh_connection,
+        body_patterns=body_patterns,
+        body_matcher=body_matcher,
+        stop_on_match=stop_on_match,
+        max_decoded_size=parse_size(max_decoded_size),
+        max_body_size=parse_size(max_body_size) if max_body_size else None,
+        timeout=parse_duration(timeout) if timeout else None,
+        connect_timeout=parse_duration(connect_timeout) if connect_timeout else None,
+        min_speed=parse_size(min_speed) if min_speed else None,
+        min_speed_time=parse_duration(min_speed_time),
+        cassette=cassette,
     )
 
     return r
@@ -0,0 +1,150 @@
+"""
+This module puts a websocket endpoint under load: it opens many concurrent
+connections, each sending a number of messages at a given rate, and measures
+the connection setup latency and the round-trip time of each message.
+"""
+
+import asyncio
+import logging
+import time
+
+import websockets
+
+from http_test.histogram import LatencyHistogram, format_percentiles
+from http_test.runner import RED, RESET
+from http_test.ws_request import get_ws_connect_args
+
+
+class WsLoadStats:
+    """
+    Collects the results of a websocket load run.
+    """
+
+    def __init__(self):
+        self.connect_latency = LatencyHistogram()
+        self.rtt = LatencyHistogram()
+        self.connections = 0
+        self.connected = 0
+        self.messages_sent = 0
+        self.messages_received = 0
+        self.timeouts = 0
+        self.unexpected_closes = 0
+        self.errors = {}
+
+    def record_error(self, error: Exception) -> None:
+        description = type(error).__name__
+        self.errors[description] = self.errors.get(description, 0) + 1
+
+    def error_count(self) -> int:
+        return self.timeouts + self.unexpected_closes + sum(self.errors.values())
+
+
+async def ws_load_connection(
+    stats: WsLoadStats,
+    url: str,
+    connect_args: dict,
+    message: str,
+    messages: int,
+    interval: float,
+    read_timeout: float,
+):
+    """
+    Opens a single websocket connection, and sends `messages` messages
+    spaced by `interval` seconds, waiting for a reply to each of them.
+
+    A connection is closed after the first reply that times out, as a late
+    reply would otherwise be taken for the reply to the next message.
+    """
+    stats.connections += 1
+    start_time = time.monotonic()
+
+    try:
+        async with websockets.connect(url, **connect_args) as websocket:
+            stats.connected += 1
+            stats.connect_latency.record(time.monotonic() - start_time)
+
+            first_message_time = time.monotonic()
+
+            for i in range(messages):
+                delay = first_message_time + i * interval - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                sent_time = time.monotonic()
+                await websocket.send(message)
+                stats.messages_sent += 1
+
+                try:
+                    await asyncio.wait_for(websocket.recv(), read_timeout)
+                except asyncio.TimeoutError:
+                    stats.timeouts += 1
+                    return
+
+                stats.messages_received += 1
+
+                # A slow reply delays all the following messages of this
+                # connection: account for the ones that should have been
+                # sent in the meantime (coordinated omission).
+                stats.rtt.record_corrected(time.monotonic() - sent_time, interval)
+
+    except websockets.ConnectionClosed:
+        stats.unexpected_closes += 1
+    except asyncio.TimeoutError:
+        # Opening handshake timed out
+        stats.timeouts += 1
+    except Exception as e:
+        logging.info(f"Websocket connection to {url} failed: {e}")
+        stats.record_error(e)
+
+
+async def ws_load(
+    connect_params: dict,
+    message: str = "Hello",
+    connections: int = 10,
+    messages: int = 10,
+    rate: float = 10.0,
+    read_timeout: float = 3,
+) -> WsLoadStats:
+    """
+    Opens `connections` concurrent websocket connections using the given
+    connection parameters (see `Request.websockets_connect_params()`).
+    Each connection sends `messages` messages at `rate` messages per second.
+    """
+    stats = WsLoadStats()
+    interval = 1 / rate if rate else 0.0
+    connect_args = get_ws_connect_args(read_timeout=read_timeout, **connect_params)
+
+    await asyncio.gather(
+        *(
+            ws_load_connection(
+                stats,
+                connect_params["url"],
+                connect_args,
+                message=message,
+                messages=messages,
+                interval=interval,
+                read_timeout=read_timeout,
+            )
+            for _ in range(connections)
+        )
+    )
+
+    return stats
+
+
+def print_ws_report(description: str, stats: WsLoadStats) -> None:
+    print()
+    print(description)
+    print(
+        f"    connections: {stats.connections} (ok {stats.connected}, failed {stats.connections - stats.connected}), "
+        f"messages: {stats.messages_sent} sent, {stats.messages_received} received"
+    )
+    print(f"    connect:  {format_percentiles(stats.connect_latency)}")
+    print(f"    rtt:      {format_percentiles(stats.rtt)}")
+
+    if stats.timeouts:
+        print(f"    {RED}{stats.timeouts}x timeout{RESET}")
+    if stats.unexpected_closes:
+        print(f"    {RED}{stats.unexpected_closes}x unexpected close{RESET}")
+    for error, error_count in sorted(stats.errors.items(), key=lambda e: -e[1]):
+        print(f"    {RED}{error_count}x {error}{RESET}")
@@ -4,13 +4,19 @@ a response, using asyncio, via the python-websockets library.
 """
 
 import asyncio
+import concurrent.futures
+import functools
+import http
 import logging
 import ssl
+import threading
 
 import certifi
 import websockets
 from websockets.exceptions import InvalidStatusCode
 
+from http_test.headers import ResponseHeaders
+
 NO_RESPONSE = {
     "status_code": 0,
     "response_body": b"",
@@ -30,7 +36,74 @@ def headers_to_dict(headers: list) -> dict:
     return headers_dict
 
 
+def ws_response_headers(status_code: int, headers) -> ResponseHeaders:
+    """
+    Returns the headers of a websocket handshake response, parsed the same
+    way as the pycurl response headers.
+    """
+    try:
+        reason = http.HTTPStatus(status_code).phrase
+    except ValueError:
+        reason = ""
+
+    response_headers = ResponseHeaders()
+    response_headers.parse_line(f"HTTP/1.1 {status_code} {reason}\r\n".encode("iso-8859-1"))
+    for name, value in headers.raw_items():
+        response_headers.parse_line(f"{name}: {value}\r\n".encode("iso-8859-1", "replace"))
+
+    return response_headers
+
+
+class BackgroundEventLoop:
+    """
+    A long-lived asyncio event loop running in a background thread.
+
+    All the websocket connections of a run are performed in this same loop,
+    instead of creating and tearing down a new event loop for each of them.
+    Coroutines can be submitted from any thread, and many of them can run
+    concurrently.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="http-test-ws-loop", daemon=True)
+        self.thread.start()
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """
+        Schedules the coroutine in the background loop, and returns
+        a `concurrent.futures.Future` for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        """
+        Runs the coroutine in the background loop, and waits for its result.
+        """
+        return self.submit(coro).result()
+
+
+_background_loop = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> BackgroundEventLoop:
+    global _background_loop
+
+    with _background_loop_lock:
+        if _background_loop is None:
+            _background_loop = BackgroundEventLoop()
+
+    return _background_loop
+
+
+@functools.lru_cache(maxsize=None)
 def get_ssl_context():
+    """
+    Builds the SSL context used for all `wss://` connections.
+    The context is built only once, as loading the CA certificates
+    bundle is expensive.
+    """
     ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
 
     ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2
@@ -40,6 +113,29 @@ def get_ssl_context():
     return ssl_context
 
 
+def get_ws_connect_args(url, host, port, server_hostname, extra_headers, read_timeout, open_timeout=None) -> dict:
+    """
+    Returns the `websockets.connect()` keyword arguments to connect to `url`
+    through the given host and port (see `Request.resolve_connect_to()`).
+    """
+    ws_connect_args = {
+        "host": host,
+        "port": port,
+        "compression": None,
+        "close_timeout": read_timeout,
+        "extra_headers": headers_to_dict(extra_headers),
+    }
+
+    if open_timeout:
+        ws_connect_args["open_timeout"] = open_timeout
+
+    is_secure_ws = url.startswith("wss://")
+    if is_secure_ws:
+        ws_connect_args.update(server_hostname=server_hostname, ssl=get_ssl_context())
+
+    return ws_connect_args
+
+
 async def ws_connect(
     url,
     host=None,
@@ -48,23 +144,16 @@ async def ws_connect(
     message="Hello",
     extra_headers=None,
     read_timeout=3,
+    open_timeout=None,
 ):
     """
     Connect to a websocket URL and send a message.
     Returns any response received from the server.
     """
     try:
-        ws_connect_args = {
-            "host": host,
-            "port": port,
-            "compression": None,
-            "close_timeout": read_timeout,
-            "extra_headers": headers_to_dict(extra_headers),
-        }
-
-        is_secure_ws = url.startswith("wss://")
-        if is_secure_ws:
-            ws_connect_args.update(server_hostname=server_hostname, ssl=get_ssl_context())
+        ws_connect_args = get_ws_connect_args(
+            url, host, port, server_hostname, extra_headers, read_timeout, open_timeout=open_timeout
+        )
 
         async with websockets.connect(url, **ws_connect_args) as websocket:
             try:
@@ -76,16 +165,18 @@ async def ws_connect(
                     response = await asyncio.wait_for(websocket.recv(), read_timeout)
                 except asyncio.TimeoutError:
                     logging.warning("Timeout while waiting for websocket response")
-                    return NO_RESPONSE
+                    return dict(NO_RESPONSE)
 
             except websockets.ConnectionClosed:
                 logging.warning("Connection closed while waiting for websocket response")
-                return NO_RESPONSE
+                return dict(NO_RESPONSE)
 
             response = {
                 # Is there an HTTP status for a websocket connection?
                 "status_code": 200,
-                "response_body": response.encode(),
+                # Binary messages are received as bytes, text ones as str
+                "response_body": response if isinstance(response, bytes) else response.encode(),
+                "response_headers": ws_response_headers(101, websocket.response_headers),
             }
 
             logging.info(f"< {response}")
@@ -95,6 +186,6 @@ async def ws_connect(
         logging.warning(f"Invalid status code received: {e.status_code}")
         return {
             "status_code": e.status_code,
-            "response_headers": e.headers,
+            "response_headers": ws_response_headers(e.status_code, e.headers),
             "exception": e,
         }
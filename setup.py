@@ -23,7 +23,7 @@ setup(
     license="MIT",
     install_requires=open("requirements.txt").readlines(),
     python_requires=">=3.8",
-    scripts=["bin/http-test-runner.py"],
+    scripts=["bin/http-test-runner.py", "bin/http-test-merge-results.py"],
     classifiers=[
         "Development Status :: 4 - Beta",
         "Environment :: Console",
@@ -0,0 +1,208 @@
+import asyncio
+import gzip
+import hashlib
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import brotli
+import pytest
+import websockets
+
+from http_test.spec import SpecTest
+
+ENCODED_BODY = b"<html>" + b"lorem ipsum dolor sit amet " * 1000 + b"</html>"
+
+
+class LocalHandler(BaseHTTPRequestHandler):
+    """
+    Minimal HTTP/1.1 server used by tests that need to fire real requests.
+
+    - `/delay/<ms>` waits `<ms>` milliseconds before responding
+    - `/status/<code>` responds with the given status code
+    - `/large/<kb>` streams a `<kb>` kilobytes body, ending with "THE END"
+    - `/encoded/<encoding>` responds with a body compressed with `<encoding>`
+    - anything else responds with 200 and echoes the request path
+    - `POST` and `PUT` requests respond with the size and sha256 of the request body,
+      and how it was sent (`content-length` or `chunked`)
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        status = 200
+        parts = self.path.strip("/").split("/")
+
+        if parts[0] == "delay":
+            time.sleep(int(parts[1]) / 1000)
+        elif parts[0] == "status":
+            status = int(parts[1])
+        elif parts[0] == "encoded":
+            return self.send_encoded_body(parts[1])
+        elif parts[0] == "large":
+            return self.send_large_body(int(parts[1]))
+
+        body = f"path={self.path}".encode()
+        self.send_response(status)
+        self.send_header("content-type", "text/plain")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.headers.get("transfer-encoding") == "chunked":
+            sent_as = "chunked"
+            request_body = b""
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                request_body += self.rfile.read(size)
+                self.rfile.readline()
+                if size == 0:
+                    break
+        else:
+            sent_as = "content-length"
+            request_body = self.rfile.read(int(self.headers["content-length"]))
+
+        body = f"size={len(request_body)} sha256={hashlib.sha256(request_body).hexdigest()} {sent_as}".encode()
+        self.send_response(200)
+        self.send_header("content-type", "text/plain")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_PUT = do_POST
+
+    def send_encoded_body(self, encoding: str):
+        body = ENCODED_BODY
+        if encoding == "gzip":
+            body = gzip.compress(body)
+        elif encoding == "br":
+            body = brotli.compress(body)
+
+        self.send_response(200)
+        self.send_header("content-type", "text/plain")
+        self.send_header("content-encoding", encoding)
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_large_body(self, size_kb: int):
+        chunk = b"x" * 1023 + b"\n"
+        self.send_response(200)
+        self.send_header("content-type", "text/plain")
+        self.send_header("content-length", str(len(b"THE START") + size_kb * 1024 + len(b"THE END")))
+        self.end_headers()
+        try:
+            self.wfile.write(b"THE START")
+            for _ in range(size_kb):
+                self.wfile.write(chunk)
+            self.wfile.write(b"THE END")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="session")
+def local_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), LocalHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+
+    server.shutdown()
+    server.server_close()
+
+
+async def ws_echo(websocket):
+    """
+    Echoes back each message. Messages such as `delay <ms>` are echoed back
+    after `<ms>` milliseconds.
+    """
+    async for message in websocket:
+        if message.startswith("delay "):
+            await asyncio.sleep(int(message.split()[1]) / 1000)
+        await websocket.send(message)
+
+
+@pytest.fixture(scope="session")
+def ws_server():
+    async def start_server():
+        return await websockets.serve(ws_echo, "127.0.0.1", 0)
+
+    # The server must be started from within the running loop
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server = asyncio.run_coroutine_threadsafe(start_server(), loop).result()
+
+    port = list(server.sockets)[0].getsockname()[1]
+    yield f"ws://127.0.0.1:{port}"
+
+    async def stop_server():
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run_coroutine_threadsafe(stop_server(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+
+
+@pytest.fixture
+def silent_server():
+    """
+    A server that accepts connections, in the listen backlog, but never
+    responds, so that the requests sent to it stay in flight.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        sock.listen(8)
+        yield f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+@pytest.fixture
+def make_spec():
+    """
+    Returns a function building a `SpecTest` named `name`, from its URL, its
+    base URL, and any other spec settings.
+    """
+
+    def make_spec(name="index", url="/", base_url="http://example.com", test_id=None, **spec):
+        spec = {"url": url, "description": name, "config": {"base_url": base_url}, **spec}
+        return SpecTest(name=name, spec=spec, test_id=test_id)
+
+    return make_spec
+
+
+@pytest.fixture
+def make_record():
+    """
+    Returns a function building a result record, as sent to the result
+    sinks (see `result_record()`), of the test `name` in `tests.yaml`.
+    Any other field can be overridden.
+    """
+
+    def make_record(name="index", status="pass", elapsed=0.25, **fields):
+        record = {
+            "id": f"tests.yaml::{name}",
+            "file": "tests.yaml",
+            "name": name,
+            "description": f"{name} for url https://example.com/",
+            "host": "example.com",
+            "status": status,
+            "fail_reason": None,
+            "request_id": "HTTPTEST/1.ABCD",
+            "status_code": 200,
+            "elapsed": elapsed,
+            "timings": {"ttfb": 0.02, "total": elapsed} if elapsed is not None else None,
+            "size_download": 2000,
+            "size_upload": 0,
+        }
+        record.update(fields)
+        return record
+
+    return make_record
@@ -0,0 +1,62 @@
+from http_test.baseline import BaselineStore, record_samples
+
+
+def test_record_samples(make_record):
+    assert record_samples(make_record(elapsed=0.1)) == [("example.com", "tests.yaml::index", 0.1)]
+    assert record_samples(make_record(elapsed=0.1, status="fail")) == []
+    assert record_samples(make_record(elapsed=None)) == []
+
+    fan_out = {
+        **make_record(elapsed=0.1),
+        "targets": [{"target": "a:443", "elapsed": 0.1}, {"target": "b:443", "elapsed": 0.2}],
+    }
+    assert record_samples(fan_out) == [("a:443", "tests.yaml::index", 0.1), ("b:443", "tests.yaml::index", 0.2)]
+
+
+def test_regressions_are_flagged_per_host(tmp_path, make_record):
+    path = tmp_path / "baseline.db"
+
+    store = BaselineStore(path)
+    for elapsed in (0.10, 0.11, 0.12, 0.10, 0.11, 0.10, 0.12, 0.11):
+        store.write(make_record(elapsed=elapsed))
+        store.write(make_record(elapsed=elapsed * 3, host="slow.example.com"))
+        store.flush()
+    store.close()
+
+    # A single slow response, and no baseline yet for another host
+    store = BaselineStore(path, check=True)
+    store.write(make_record(elapsed=0.5))
+    store.write(make_record(elapsed=0.5, host="new.example.com"))
+    store.flush()
+    assert store.regressions == []
+
+    # A lasting slowdown
+    store.write(make_record(elapsed=0.2))
+    store.write(make_record(elapsed=0.36, host="slow.example.com"))
+    store.flush()
+    assert store.regressions == []
+
+    store.write(make_record(elapsed=0.2))
+    store.write(make_record(elapsed=0.36, host="slow.example.com"))
+    store.flush()
+    assert [(regression["host"], regression["baseline_samples"]) for regression in store.regressions] == [
+        ("example.com", 6)
+    ]
+    assert store.regressions[0]["actual"] == 0.2
+    assert round(store.regressions[0]["baseline"], 3) == 0.105
+    store.close()
+
+    # The slower samples are part of the baseline too
+    store = BaselineStore(path)
+    assert store.stored_samples("example.com", "tests.yaml::index")[:3] == [0.2, 0.2, 0.5]
+    store.close()
+
+
+def test_samples_are_pruned(tmp_path, make_record):
+    store = BaselineStore(tmp_path / "baseline.db", max_samples=3)
+    for elapsed in (0.1, 0.2, 0.3, 0.4, 0.5):
+        store.write(make_record(elapsed=elapsed))
+        store.flush()
+
+    assert store.stored_samples("example.com", "tests.yaml::index") == [0.5, 0.4, 0.3]
+    store.close()
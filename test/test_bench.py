@@ -0,0 +1,21 @@
+from http_test.bench import run_benchmark
+from http_test.spec import SpecTest
+
+
+def test_run_benchmark(local_server):
+    config = {"base_url": local_server}
+    specs = [
+        SpecTest(name="ok", spec={"url": "/", "description": "ok", "config": config, "match": {"status": 200}}),
+        SpecTest(
+            name="ko",
+            spec={"url": "/status/503", "description": "ko", "config": config, "match": {"status": 200}},
+        ),
+    ]
+
+    stats, elapsed = run_benchmark(specs, rps=200, iterations=10)
+
+    assert [s.count for s in stats] == [10, 10]
+    assert stats[0].errors == {}
+    assert stats[1].errors == {"Expected status codes [200], got 503": 10}
+    assert elapsed >= 19 / 200, "Requests should have been sent at the target rate"
+    assert stats[0].latency.total_count == 10
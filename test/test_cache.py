@@ -0,0 +1,47 @@
+from http_test.cache import SpecCache
+from http_test.spec import SpecFile
+
+SPEC = """
+base_url: "https://{{ hostname }}"
+tests:
+  - url: "/"
+    description: "Index page"
+    match:
+      status: 200
+"""
+
+
+def test_load_tests_from_cache(tmp_path, monkeypatch):
+    test_file = tmp_path / "test.yaml"
+    test_file.write_text(SPEC)
+    cache = SpecCache(directory=tmp_path / "cache")
+
+    tests = SpecFile(path=test_file).load_tests(template_vars={"hostname": "example.com"}, cache=cache)
+    assert tests[0]["spec"]["config"]["base_url"] == "https://example.com"
+    assert len(list(cache.directory.glob("*.pickle"))) == 1
+
+    # A cache hit must not render the template nor parse the YAML again
+    monkeypatch.setattr("http_test.spec.render_template", None)
+    cached_tests = SpecFile(path=test_file).load_tests(template_vars={"hostname": "example.com"}, cache=cache)
+    assert [t["name"] for t in cached_tests] == [t["name"] for t in tests]
+    assert cached_tests[0]["spec"]["match"] == tests[0]["spec"]["match"]
+
+
+def test_cache_key_depends_on_content_and_variables(tmp_path):
+    test_file = tmp_path / "test.yaml"
+    test_file.write_text(SPEC)
+    cache = SpecCache(directory=tmp_path / "cache")
+
+    tests = SpecFile(path=test_file).load_tests(template_vars={"hostname": "a.example.com"}, cache=cache)
+    assert tests[0]["spec"]["config"]["base_url"] == "https://a.example.com"
+
+    tests = SpecFile(path=test_file).load_tests(template_vars={"hostname": "b.example.com"}, cache=cache)
+    assert tests[0]["spec"]["config"]["base_url"] == "https://b.example.com"
+
+    test_file.write_text(SPEC.replace("Index page", "Home page"))
+    tests = SpecFile(path=test_file).load_tests(template_vars={"hostname": "b.example.com"}, cache=cache)
+    assert tests[0]["name"] == "Home page"
+
+    assert len(list(cache.directory.glob("*.pickle"))) == 3
+    cache.clear()
+    assert len(list(cache.directory.glob("*.pickle"))) == 0
@@ -0,0 +1,68 @@
+from http_test.cassette import ONCE, RECORD, REPLAY, Cassette
+from http_test.request import Request
+from http_test.runner import run_specfiles
+
+
+def test_record_and_replay(tmp_path, local_server):
+    path = tmp_path / "cassette.db"
+    url = f"{local_server}/encoded/gzip"
+
+    recorded = Request(url, headers=["Accept: */*"], cassette=Cassette(path, RECORD)).fire()
+    assert "replayed" not in recorded
+
+    cassette = Cassette(path, REPLAY)
+    replayed = Request(url, headers=["Accept: */*"], cassette=cassette).fire()
+
+    assert replayed["replayed"]
+    assert replayed["status_code"] == 200
+    assert replayed["response_headers"]["content-encoding"] == "gzip"
+    assert replayed["response_body_decoded"] == recorded["response_body_decoded"]
+    assert replayed["timings"] == recorded["timings"]
+
+    # A different request wasn't recorded
+    missing = Request(url, headers=["Accept: text/html"], cassette=cassette).fire()
+    assert missing["error"].startswith(f"No recorded result for {url}")
+
+
+def test_once_mode_fires_missing_requests(tmp_path, local_server):
+    cassette = Cassette(tmp_path / "cassette.db", ONCE)
+
+    first = Request(f"{local_server}/", cassette=cassette).fire()
+    second = Request(f"{local_server}/", cassette=cassette).fire()
+
+    assert "replayed" not in first
+    assert second["replayed"]
+    assert second["response_body_decoded"] == b"path=/"
+
+
+def test_replay_test_files(tmp_path, local_server, ws_server, monkeypatch):
+    test_file = tmp_path / "test.yaml"
+    test_file.write_text(
+        f"""
+tests:
+  - url: "{local_server}/status/404"
+    description: "http"
+    match:
+      status: 404
+  - url: "{ws_server}/"
+    description: "websocket"
+    payload: "hello"
+    match:
+      body:
+        - "hello"
+"""
+    )
+    cassette = str(tmp_path / "cassette.db")
+
+    run_config = {"cassette": cassette, "cassette_mode": RECORD}
+    assert run_specfiles([test_file], concurrency=4, run_config=run_config) == 0
+
+    # The recorded results pass, the others fail with nothing to replay
+    run_config = {"cassette": cassette, "cassette_mode": REPLAY}
+    assert run_specfiles([test_file], run_config=run_config) == 0
+    assert run_specfiles([test_file], concurrency=4, run_config=run_config) == 0
+
+    # The cassette can also be set through the environment
+    monkeypatch.setenv("HTTPTEST_CASSETTE", cassette)
+    test_file.write_text(test_file.read_text().replace("/status/404", "/status/500"))
+    assert run_specfiles([test_file], concurrency=4) == 1
@@ -0,0 +1,84 @@
+import gzip
+import tracemalloc
+import zlib
+
+import brotli
+import pytest
+
+from http_test.decoding import ResponseDecoder
+
+BODY = b"<!DOCTYPE html>" + b"Hello, world! " * 10000
+
+
+def decode_in_chunks(decoder: ResponseDecoder, data: bytes, chunk_size: int = 1000) -> bytes:
+    decoded = b""
+    for i in range(0, len(data), chunk_size):
+        decoded += decoder.decode(data[i : i + chunk_size])
+    return decoded + decoder.flush()
+
+
+@pytest.mark.parametrize(
+    "content_encoding,encoded",
+    [
+        ("gzip", gzip.compress(BODY)),
+        ("deflate", zlib.compress(BODY)),
+        ("br", brotli.compress(BODY)),
+        ("identity", BODY),
+        ("gzip, br", brotli.compress(gzip.compress(BODY))),
+    ],
+)
+def test_decode_incrementally(content_encoding, encoded):
+    assert decode_in_chunks(ResponseDecoder(content_encoding), encoded) == BODY
+
+
+def test_decode_raw_deflate():
+    """
+    Some servers send raw deflate streams, without the zlib wrapper.
+    """
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    encoded = compressor.compress(BODY) + compressor.flush()
+
+    assert decode_in_chunks(ResponseDecoder("deflate"), encoded) == BODY
+
+
+def test_decode_zstd():
+    zstandard = pytest.importorskip("zstandard")
+    encoded = zstandard.ZstdCompressor().compress(BODY)
+
+    assert decode_in_chunks(ResponseDecoder("zstd"), encoded) == BODY
+
+
+def test_decoded_size_limit():
+    bomb = gzip.compress(b"\0" * 10_000_000)
+    decoder = ResponseDecoder("gzip", max_size=1_000_000)
+
+    with pytest.raises(ValueError, match="exceeds the maximum allowed size"):
+        decode_in_chunks(decoder, bomb)
+
+
+@pytest.mark.parametrize("content_encoding", ["br", "zstd"])
+def test_decoded_size_limit_bounds_memory(content_encoding):
+    """
+    A tiny bomb, received in a single chunk, must not be inflated whole
+    before its size is checked.
+    """
+    if content_encoding == "br":
+        bomb = brotli.compress(b"\0" * 200_000_000, quality=5)
+    else:
+        bomb = pytest.importorskip("zstandard").ZstdCompressor(level=1).compress(b"\0" * 200_000_000)
+    decoder = ResponseDecoder(content_encoding, max_size=1_000_000)
+
+    tracemalloc.start()
+    try:
+        with pytest.raises(ValueError, match="exceeds the maximum allowed size"):
+            decoder.decode(bomb)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert peak < 50_000_000
+
+
+def test_unsupported_encoding():
+    with pytest.raises(ValueError, match="Unsupported content-encoding 'compress'"):
+        ResponseDecoder("compress")
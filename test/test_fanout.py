@@ -0,0 +1,126 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import pytest
+
+from http_test.fanout import fan_out_spec_test, fan_out_specfiles
+
+SUITE_YAML = """
+base_url: "http://example.com"
+tests:
+  - url: "/"
+    description: "index"
+    match:
+      status: 200
+"""
+
+
+class OtherHandler(BaseHTTPRequestHandler):
+    """
+    Responds like the local server, but with a different body.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = f"path={self.path}?".encode()
+        self.send_response(200)
+        self.send_header("content-type", "text/plain")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def other_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OtherHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f"127.0.0.1:{server.server_address[1]}"
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_identical_targets_pass(local_server, make_spec):
+    target = urlparse(local_server).netloc
+    spec = make_spec(match={"status": 200})
+    is_success, fail_reason, rows = fan_out_spec_test(spec, [target, f"localhost:{target.split(':')[1]}"])
+
+    assert is_success, fail_reason
+    assert [row["status_code"] for row in rows] == [200, 200]
+    assert rows[0]["body_sha256"] == rows[1]["body_sha256"]
+    assert all(row["elapsed"] > 0 for row in rows)
+
+
+def test_diverging_target_fails(local_server, other_server, make_spec):
+    target = urlparse(local_server).netloc
+    is_success, fail_reason, rows = fan_out_spec_test(make_spec(match={"status": 200}), [target, other_server])
+
+    assert not is_success
+    assert fail_reason == f"{other_server}: differs from {target} in body"
+    assert rows[0]["differs"] == []
+    assert rows[1]["differs"] == ["body"]
+
+    # Each target is also verified on its own
+    spec = make_spec(url="/status/404", match={"status": 404}, compare_headers=["Content-Type"])
+    is_success, fail_reason, rows = fan_out_spec_test(spec, [target, other_server])
+    assert rows[1]["differs"] == ["status", "body"]
+    assert fail_reason.splitlines() == [
+        f"{other_server}: Expected status codes [404], got 200",
+        f"{other_server}: differs from {target} in status, body",
+    ]
+
+
+def test_bodies_are_only_kept_for_body_requirements(local_server, make_spec):
+    target = urlparse(local_server).netloc
+    targets = [target, f"localhost:{target.split(':')[1]}"]
+
+    spec = make_spec(match={"status": 200})
+    is_success, fail_reason, rows = fan_out_spec_test(spec, targets)
+    assert is_success, fail_reason
+    assert spec.test_result[0]["response_body_decoded"] == b""
+    assert rows[0]["body_sha256"] == rows[1]["body_sha256"]
+
+    spec = make_spec(match={"status": 200, "body_regex": ["path=/"]})
+    is_success, fail_reason, rows = fan_out_spec_test(spec, targets)
+    assert is_success, fail_reason
+    assert spec.test_result[0]["response_body_decoded"] == b"path=/"
+
+
+def test_unreachable_target_fails(local_server, make_spec):
+    target = urlparse(local_server).netloc
+    is_success, fail_reason, rows = fan_out_spec_test(make_spec(match={"status": 200}), [target, "127.0.0.1:1"])
+
+    assert not is_success
+    assert fail_reason.startswith("127.0.0.1:1: ")
+    assert rows[1]["error"]
+
+
+def test_fan_out_specfiles(tmp_path, local_server, capsys):
+    path = tmp_path / "suite.yaml"
+    path.write_text(SUITE_YAML)
+    target = urlparse(local_server).netloc
+
+    records = []
+
+    class Sink:
+        def write(self, record):
+            records.append(record)
+
+        def flush(self):
+            pass
+
+    targets = [target, f"localhost:{target.split(':')[1]}"]
+    assert fan_out_specfiles([str(path)], targets, verbose=True, result_sinks=[Sink()]) == 0
+    assert records[0]["status_code"] == 200
+    assert [row["target"] for row in records[0]["targets"]] == targets
+    assert target in capsys.readouterr().out
+
+    with pytest.raises(ValueError):
+        fan_out_specfiles([str(path)], [target, target])
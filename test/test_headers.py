@@ -0,0 +1,61 @@
+from http_test.headers import ResponseHeaders
+from http_test.request import Request
+from http_test.spec import _dump, verify_response
+
+HEADER_LINES = [
+    b"HTTP/1.1 200 OK\r\n",
+    b"Content-Type: text/html\r\n",
+    b"Set-Cookie: a=1\r\n",
+    b"X-Folded: first\r\n",
+    b"\t second\r\n",
+    b"set-cookie: b=2\r\n",
+    b"\r\n",
+]
+
+
+def parse(lines: list) -> ResponseHeaders:
+    headers = ResponseHeaders()
+    for line in lines:
+        headers.parse_line(line)
+    return headers
+
+
+def test_parse_header_lines():
+    headers = parse(HEADER_LINES)
+
+    assert headers.status_line == "HTTP/1.1 200 OK"
+    assert headers["CONTENT-TYPE"] == "text/html"
+    assert headers.get("set-cookie") == "a=1"
+    assert headers.getall("Set-Cookie") == ["a=1", "b=2"]
+    assert headers["x-folded"] == "first second"
+    assert "x-missing" not in headers and headers.getall("x-missing") == []
+    assert list(headers) == ["content-type", "set-cookie", "x-folded"]
+    assert headers.raw_lines == HEADER_LINES[:-1]
+    assert headers.as_dict() == {"content-type": "text/html", "set-cookie": ["a=1", "b=2"], "x-folded": "first second"}
+
+
+def test_only_last_response_headers_are_kept():
+    headers = parse([b"HTTP/1.1 100 Continue\r\n", b"X-Interim: yes\r\n", b"\r\n"] + HEADER_LINES)
+
+    assert headers.status_line == "HTTP/1.1 200 OK"
+    assert "x-interim" not in headers
+
+    headers.clear()
+    assert headers.status_line is None and len(headers) == 0 and headers.raw_lines == []
+
+
+def test_verify_parsed_headers():
+    result = {"status_code": 200, "response_headers": parse(HEADER_LINES)}
+
+    assert verify_response(result, {"headers": ["Set-Cookie: b=2"], "headers_absent": ["X-Debug"]})
+    assert "set-cookie:\n  - a=1\n  - b=2" in _dump(result)
+
+
+def test_response_headers_of_requests(local_server, ws_server):
+    result = Request(url=f"{local_server}/encoded/gzip").fire()
+    assert result["response_headers"].status_line == "HTTP/1.1 200 OK"
+    assert result["response_headers"]["Content-Encoding"] == "gzip"
+
+    result = Request(url=f"{ws_server}/", payload="hello").fire()
+    assert result["response_headers"].status_line == "HTTP/1.1 101 Switching Protocols"
+    assert result["response_headers"]["upgrade"] == "websocket"
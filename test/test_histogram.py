@@ -0,0 +1,33 @@
+import pytest
+
+from http_test.histogram import LatencyHistogram
+
+
+def test_histogram_percentiles():
+    histogram = LatencyHistogram()
+    for ms in range(1, 1001):
+        histogram.record(ms / 1000)
+
+    assert histogram.total_count == 1000
+    assert histogram.value_at_percentile(50) == pytest.approx(0.5, rel=0.001)
+    assert histogram.value_at_percentile(99) == pytest.approx(0.99, rel=0.001)
+    assert histogram.value_at_percentile(100) == pytest.approx(1.0, rel=0.001)
+
+
+def test_histogram_precision_on_large_values():
+    histogram = LatencyHistogram()
+    histogram.record(123.456789)
+
+    assert histogram.value_at_percentile(50) == pytest.approx(123.456789, rel=0.001)
+
+
+def test_histogram_coordinated_omission_correction():
+    """
+    A single 1s stall with requests expected every 100ms also accounts for
+    the 9 requests that couldn't be sent in the meantime.
+    """
+    histogram = LatencyHistogram()
+    histogram.record_corrected(1.0, expected_interval_s=0.1)
+
+    assert histogram.total_count == 10
+    assert histogram.value_at_percentile(50) == pytest.approx(0.5, rel=0.001)
@@ -0,0 +1,44 @@
+from http_test.matcher import BodyMatcher
+
+
+def test_body_matcher_single_pass():
+    matcher = BodyMatcher(["<html>", "<h1>Hello</h1>", "missing"])
+    matcher.feed(b"<!DOCTYPE html><html><body><h1>Hello</h1></body></html>")
+
+    assert matcher.is_found("<html>")
+    assert matcher.is_found("<h1>Hello</h1>")
+    assert not matcher.is_found("missing")
+    assert not matcher.all_found()
+
+
+def test_body_matcher_across_chunk_boundaries():
+    body = b"0123456789" * 10 + b"needle in a haystack" + b"9876543210" * 10
+    patterns = ["needle in a haystack", "haystack9876"]
+
+    for chunk_size in (1, 3, 7, 16, 1000):
+        matcher = BodyMatcher(patterns)
+        for i in range(0, len(body), chunk_size):
+            matcher.feed(body[i : i + chunk_size])
+        assert matcher.all_found(), f"Patterns not found with chunk size {chunk_size}"
+
+
+def test_body_matcher_overlapping_patterns():
+    """
+    Patterns starting at the same position, or overlapping each other,
+    must all be found.
+    """
+    matcher = BodyMatcher(["abc", "ab", "bcd", "cd"])
+    assert matcher.feed(b"xabcdx")
+
+
+def test_body_matcher_copies_reuse_compiled_patterns():
+    matcher = BodyMatcher(["abc", "xyz"])
+    matcher.feed(b"abc")
+
+    copy = matcher.copy()
+    assert not copy.is_found("abc")
+    assert copy.regex is matcher.regexes[frozenset([b"abc", b"xyz"])]
+
+    copy.feed(b"abc")
+    assert copy.regex is matcher.regex
+    assert copy.feed(b"xyz") and not matcher.all_found()
@@ -0,0 +1,46 @@
+import urllib.request
+
+from http_test.metrics import HttpExporter, PrometheusMetrics, TextfileExporter
+
+# Label values must be escaped
+TEST_NAME = 'The "index" page'
+
+
+def test_metrics_aggregation(make_record):
+    metrics = PrometheusMetrics()
+    metrics.write(make_record(TEST_NAME, elapsed=0.3))
+    metrics.write(make_record(TEST_NAME, "fail", elapsed=0.05))
+    metrics.write(make_record(TEST_NAME, "skip", elapsed=None, size_download=None))
+
+    lines = metrics.render().splitlines()
+    labels = 'file="tests.yaml",test="The \\"index\\" page",host="example.com"'
+
+    assert f'httptest_tests_total{{{labels},status="pass"}} 1' in lines
+    assert f'httptest_tests_total{{{labels},status="fail"}} 1' in lines
+    assert f'httptest_tests_total{{{labels},status="skip"}} 1' in lines
+
+    assert f'httptest_request_duration_seconds_bucket{{{labels},phase="total",le="0.05"}} 1' in lines
+    assert f'httptest_request_duration_seconds_bucket{{{labels},phase="total",le="0.25"}} 1' in lines
+    assert f'httptest_request_duration_seconds_bucket{{{labels},phase="total",le="0.5"}} 2' in lines
+    assert f'httptest_request_duration_seconds_bucket{{{labels},phase="total",le="+Inf"}} 2' in lines
+    assert f'httptest_request_duration_seconds_count{{{labels},phase="ttfb"}} 2' in lines
+    assert f'httptest_response_size_bytes_bucket{{{labels},le="4096"}} 2' in lines
+    assert "# TYPE httptest_request_duration_seconds histogram" in lines
+
+
+def test_textfile_and_http_exporters(tmp_path, make_record):
+    textfile = TextfileExporter(tmp_path / "httptest.prom")
+    textfile.write(make_record(TEST_NAME))
+    textfile.close()
+
+    assert "httptest_tests_total{" in (tmp_path / "httptest.prom").read_text()
+
+    exporter = HttpExporter(port=0, host="127.0.0.1")
+    try:
+        exporter.write(make_record(TEST_NAME))
+        port = exporter.server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+            assert "httptest_tests_total{" in response.read().decode()
+    finally:
+        exporter.close()
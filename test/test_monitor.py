@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+from http_test.monitor import Monitor, MonitoredSuite, parse_interval
+
+SUITE_YAML = """
+base_url: "{base_url}"
+monitor:
+  interval: 100ms
+tests:
+  - url: "/"
+    description: "index"
+    match:
+      status: 200
+"""
+
+
+def test_suite_reloaded_only_when_changed(tmp_path, local_server):
+    path = tmp_path / "suite.yaml"
+    path.write_text(SUITE_YAML.format(base_url=local_server))
+
+    suite = MonitoredSuite(path, interval=60)
+    assert suite.reload_if_changed()
+    assert not suite.reload_if_changed()
+    assert [spec.name for spec in suite.specs] == ["index"]
+    assert suite.interval == 0.1
+
+    path.write_text(SUITE_YAML.format(base_url=local_server).replace("index", "home page"))
+    os.utime(path, ns=(0, 0))
+    assert suite.reload_if_changed()
+    assert [spec.name for spec in suite.specs] == ["home page"]
+
+    # A broken file keeps the previous version of the tests running
+    path.write_text("tests: [")
+    assert not suite.reload_if_changed()
+    assert [spec.name for spec in suite.specs] == ["home page"]
+
+
+def test_non_positive_interval_rejected(tmp_path, local_server, caplog):
+    with pytest.raises(ValueError, match="Invalid monitor interval '0s', it must be positive"):
+        parse_interval("0s")
+
+    path = tmp_path / "suite.yaml"
+    path.write_text(SUITE_YAML.format(base_url=local_server))
+    suite = MonitoredSuite(path, interval=60)
+    assert suite.reload_if_changed()
+
+    # The previous version of the tests keeps running on its interval
+    path.write_text(SUITE_YAML.format(base_url=local_server).replace("100ms", "0").replace("index", "home page"))
+    os.utime(path, ns=(0, 0))
+    assert not suite.reload_if_changed()
+    assert [spec.name for spec in suite.specs] == ["index"]
+    assert suite.interval == 0.1
+    assert "Invalid monitor interval '0', it must be positive" in caplog.text
+
+
+def test_overrunning_suite_skips_runs():
+    suite = MonitoredSuite("suite.yaml", interval=10)
+    suite.schedule_first(100.0)
+
+    suite.schedule_next(105.0)
+    assert suite.next_run == 110.0
+
+    # The run scheduled at 110 took 25s: the runs at 120 and 130
+    # are skipped rather than started back to back
+    suite.schedule_next(135.0)
+    assert suite.next_run == 140.0
+    assert suite.missed_runs == 2
+
+
+def test_monitor_runs_suites_until_stopped(tmp_path, local_server):
+    path = tmp_path / "suite.yaml"
+    path.write_text(SUITE_YAML.format(base_url=local_server))
+
+    records = []
+
+    class StopAfter:
+        def write(self, record):
+            records.append(record)
+            if len(records) == 3:
+                monitor.stop()
+
+        def flush(self):
+            pass
+
+    suite = MonitoredSuite(path)
+    monitor = Monitor([suite], result_sinks=[StopAfter()])
+    monitor.run()
+
+    assert suite.runs == 3
+    assert [record["status"] for record in records] == ["pass"] * 3
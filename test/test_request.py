@@ -1,4 +1,13 @@
-from http_test.request import Request
+import hashlib
+import os
+import time
+
+import pycurl
+import pytest
+
+from http_test.pool import ConnectionPool
+from http_test.request import Request, is_timeout_error
+from http_test.ws_request import get_background_loop, get_ssl_context
 
 
 def test_resolve_connect_to_default_ports():
@@ -78,3 +87,185 @@ def test_resolve_connect_to_no_matching_entries():
     host, port = r.resolve_connect_to()
     assert host == "test.example.com"
     assert port == 443
+
+
+def test_pooled_requests_reuse_connections(local_server):
+    pool = ConnectionPool()
+
+    first = Request(url=f"{local_server}/", pool=pool).fire()
+    second = Request(url=f"{local_server}/", pool=pool).fire()
+
+    assert first["status_code"] == second["status_code"] == 200
+    assert first["num_connects"] == 1
+    assert second["num_connects"] == 0, "Second request should have reused the first connection"
+
+    pool.close()
+
+
+def test_fresh_connection_opts_out_of_pool(local_server):
+    pool = ConnectionPool()
+
+    Request(url=f"{local_server}/", pool=pool).fire()
+    result = Request(url=f"{local_server}/", pool=pool, fresh_connection=True).fire()
+
+    assert result["num_connects"] == 1
+
+    pool.close()
+
+
+def test_body_patterns_matched_while_downloading(local_server):
+    r = Request(url=f"{local_server}/large/256", body_patterns=["THE START", "THE END", "missing"])
+    result = r.fire()
+
+    assert result["body_matches"] == {"THE START": True, "THE END": True, "missing": False}
+    assert result["stopped_early"] is False
+
+
+def test_stop_on_match_aborts_transfer(local_server):
+    r = Request(url=f"{local_server}/large/4096", body_patterns=["THE START"], stop_on_match=True)
+    result = r.fire()
+
+    assert result["status_code"] == 200
+    assert result["stopped_early"] is True
+    assert result["body_matches"] == {"THE START": True}
+    assert len(result["response_body"]) < 4096 * 1024
+
+
+def test_response_decoded_according_to_content_encoding(local_server):
+    for encoding in ("gzip", "br"):
+        r = Request(url=f"{local_server}/encoded/{encoding}", body_patterns=["</html>"])
+        result = r.fire()
+
+        assert result["response_body"] != result["response_body_decoded"]
+        assert result["response_body_decoded"].startswith(b"<html>lorem ipsum")
+        assert result["body_matches"] == {"</html>": True}
+
+
+def test_decoded_size_limit_fails_request(local_server):
+    r = Request(url=f"{local_server}/encoded/gzip", max_decoded_size=1000)
+    result = r.fire()
+
+    assert "exceeds the maximum allowed size" in result["error"]
+
+
+def test_timing_breakdown(local_server):
+    result = Request(url=f"{local_server}/delay/100", fresh_connection=True).fire()
+    timings = result["timings"]
+
+    assert timings["total"] == result["elapsed"]
+    assert timings["server"] >= 0.1
+    assert timings["ttfb"] >= timings["server"]
+    assert timings["tls"] == 0.0, "No TLS handshake over plain http"
+    assert result["size_download"] == len(result["response_body"])
+
+
+def test_websocket_requests_share_event_loop(ws_server):
+    results = [Request(url=f"{ws_server}/", payload=f"hello {i}").fire() for i in range(2)]
+
+    assert [r["response_body_decoded"] for r in results] == [b"hello 0", b"hello 1"]
+    assert get_background_loop().loop.is_running()
+    assert get_ssl_context() is get_ssl_context()
+
+
+def test_fingerprint_ignores_request_id():
+    headers = ["Accept: text/html"]
+
+    r1 = Request("https://example.com/", headers=headers)
+    r2 = Request("https://example.com/", headers=headers)
+    assert r1.fingerprint() == r2.fingerprint()
+
+    assert Request("https://example.com/", method="POST", headers=headers).fingerprint() != r1.fingerprint()
+    assert Request("https://example.com/", headers=["Accept: */*"]).fingerprint() != r1.fingerprint()
+    assert Request("https://example.com/", headers=headers, connect_to=["::a:"]).fingerprint() != r1.fingerprint()
+
+
+def test_max_body_size_fails_request(local_server):
+    result = Request(url=f"{local_server}/large/256", max_body_size=100 * 1024).fire()
+
+    assert result["error"] == "Response body larger than 102400 bytes"
+    assert len(result["response_body"]) < 256 * 1024
+
+
+def test_large_bodies_spill_to_disk(local_server):
+    r = Request(url=f"{local_server}/large/2048", body_patterns=["THE END"])
+    result = r.fire()
+
+    body = result["response_body_decoded"]
+    assert not isinstance(body, bytes)
+    assert body is result["response_body"]
+    assert len(body) == 2048 * 1024 + len("THE START") + len("THE END")
+    assert body[:9] == b"THE START"
+    assert result["body_matches"] == {"THE END": True}
+
+
+def test_request_timeout(local_server, ws_server):
+    with pytest.raises(pycurl.error) as e:
+        Request(url=f"{local_server}/delay/2000", timeout=0.2).fire()
+    assert is_timeout_error(e.value)
+
+    # The deadline cuts the request timeout short
+    with pytest.raises(pycurl.error) as e:
+        Request(url=f"{local_server}/delay/2000", timeout=10, deadline=time.time() + 0.2).fire()
+    assert is_timeout_error(e.value)
+
+    # The pooled handle doesn't keep the timeout
+    assert Request(url=f"{local_server}/delay/300").fire()["status_code"] == 200
+
+    with pytest.raises(Exception) as e:
+        Request(url=f"{ws_server}/", payload="delay 1000", timeout=0.2).fire()
+    assert is_timeout_error(e.value)
+
+
+def upload_summary(body: bytes, sent_as: str = "content-length") -> bytes:
+    return f"size={len(body)} sha256={hashlib.sha256(body).hexdigest()} {sent_as}".encode()
+
+
+def test_payload_sized_in_bytes(local_server):
+    payload = "héllo wörld ✓"
+    result = Request(url=f"{local_server}/upload", payload=payload).fire()
+    assert result["response_body"] == upload_summary(payload.encode("utf-8"))
+
+    payload = bytes(range(256))
+    result = Request(url=f"{local_server}/upload", method="PUT", payload=payload).fire()
+    assert result["response_body"] == upload_summary(payload)
+
+    with pytest.raises(ValueError, match="Invalid payload 42"):
+        Request(url=f"{local_server}/upload", payload=42).fire()
+
+
+def test_payload_streamed_from_file(local_server, tmp_path):
+    payload_file = tmp_path / "payload.bin"
+    payload = os.urandom(3 * 1024 * 1024)
+    payload_file.write_bytes(payload)
+
+    r = Request(url=f"{local_server}/upload", payload_file=str(payload_file))
+    result = r.fire()
+    assert result["response_body"] == upload_summary(payload)
+    assert result["size_upload"] == len(payload)
+    # After curl's `Expect: 100-continue`, only the final response headers are kept
+    assert result["response_headers"].status_line == "HTTP/1.1 200 OK"
+    assert r.request_payload is None
+
+    result = Request(url=f"{local_server}/upload", payload_file=str(payload_file), chunked=True).fire()
+    assert result["response_body"] == upload_summary(payload, "chunked")
+
+    empty_file = tmp_path / "empty.bin"
+    empty_file.write_bytes(b"")
+    result = Request(url=f"{local_server}/upload", payload_file=str(empty_file)).fire()
+    assert result["response_body"] == upload_summary(b"")
+
+    with pytest.raises(FileNotFoundError):
+        Request(url=f"{local_server}/upload", payload_file=str(tmp_path / "missing.bin")).fire()
+
+
+def test_failed_transfer_closes_buffers(silent_server, tmp_path):
+    payload_file = tmp_path / "payload.bin"
+    payload_file.write_bytes(b"x" * 1024)
+
+    r = Request(url=f"{silent_server}/upload", payload_file=str(payload_file), timeout=0.2)
+    with pytest.raises(pycurl.error) as e:
+        r.fire()
+    assert is_timeout_error(e.value)
+
+    assert r.response is None
+    assert r.request_payload is None
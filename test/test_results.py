@@ -0,0 +1,37 @@
+import xml.etree.ElementTree as ElementTree
+
+from http_test.results import JUnitXmlWriter
+from http_test.runner import result_record
+from http_test.spec import SpecTest
+
+
+def test_junit_xml_writer(tmp_path, make_record):
+    writer = JUnitXmlWriter(tmp_path / "junit.xml")
+    writer.write(make_record("index <page>", "pass"))
+    fail_reason = "Expected status codes [200], got 500\nmore"
+    writer.write(make_record("api", "fail", fail_reason=fail_reason, response_body="Internal \x00error"))
+    writer.write(make_record("old", "skip"))
+    writer.close()
+
+    testsuite = ElementTree.parse(tmp_path / "junit.xml").getroot().find("testsuite")
+
+    assert testsuite.attrib["tests"] == "3"
+    assert testsuite.attrib["failures"] == "1"
+    assert testsuite.attrib["skipped"] == "1"
+
+    testcases = testsuite.findall("testcase")
+    assert [t.attrib["name"] for t in testcases] == ["index <page>", "api", "old"]
+    assert testcases[1].find("failure").attrib["message"] == "Expected status codes [200], got 500"
+    assert testcases[1].find("system-err").text == "Internal �error"
+    assert testcases[2].find("skipped") is not None
+
+
+def test_response_body_only_recorded_on_failure():
+    spec = SpecTest(name="test", spec={"url": "/", "config": {"base_url": "https://example.com"}})
+    spec.test_result = [{"status_code": 500, "response_body_decoded": b"x" * 10000}]
+
+    assert "response_body" not in result_record(spec, True, "")
+
+    record = result_record(spec, False, "Expected status codes [200], got 500")
+    assert record["response_body"].startswith("x" * 2048 + "...")
+    assert len(record["response_body"]) < 2100
@@ -0,0 +1,285 @@
+import time
+
+import pytest
+
+from http_test.fanout import fan_out_specfiles
+from http_test.multi import CurlMultiDriver
+from http_test.request import Request
+from http_test.runner import DEADLINE_EXCEEDED, iter_spec_tests, run_spec_tests, run_specfiles
+from http_test.spec import SpecError
+
+
+def test_concurrent_run_keeps_test_order(local_server, make_spec):
+    """
+    Tests complete out of order when run concurrently, but their results
+    must still be reported in the original order.
+    """
+    specs = [
+        make_spec("slow", "/delay/300", local_server, match={"status": 200}),
+        make_spec("fast", "/", local_server, match={"status": 200}),
+        make_spec("skipped", "/", local_server, skip=True),
+        make_spec("failing", "/status/404", local_server, match={"status": 200}),
+    ]
+
+    outcomes = list(run_spec_tests(specs, concurrency=4))
+
+    assert [spec.name for spec, _, _ in outcomes] == ["slow", "fast", "skipped", "failing"]
+    assert [is_success for _, is_success, _ in outcomes] == [True, True, True, False]
+    assert outcomes[2][2] == "skipped"
+    assert "Expected status codes [200], got 404" in outcomes[3][2]
+
+
+def test_invalid_test_stops_the_run_before_any_request(local_server, tmp_path, monkeypatch):
+    test_file = tmp_path / "test.yaml"
+    test_file.write_text(
+        f"""
+base_url: "{local_server}"
+tests:
+  - url: "/"
+    description: "valid"
+    match:
+      status: 200
+  - url: "/"
+    description: "misspelled"
+    match:
+      statuss: 200
+"""
+    )
+
+    fired = []
+    monkeypatch.setattr(Request, "prepare_pycurl_request", lambda request: fired.append(request.url))
+
+    error = "test.yaml: Test 'misspelled': Unknown or misspelled requirement 'statuss'"
+    for kwargs in ({}, {"concurrency": 2}, {"workers": 2}):
+        with pytest.raises(SpecError, match=error):
+            run_specfiles([test_file], **kwargs)
+
+    with pytest.raises(SpecError):
+        fan_out_specfiles([test_file], ["127.0.0.1:1", "127.0.0.1:2"])
+
+    assert fired == []
+
+
+def test_run_config_applies_unless_set_in_the_file(tmp_path):
+    test_file = tmp_path / "test.yaml"
+    test_file.write_text('max_body_size: "1KB"\ntests:\n  - url: "http://example.com/"\n    description: "index"\n')
+    run_config = {"max_body_size": "1MB", "cassette": str(tmp_path / "run.cassette"), "cassette_mode": "record"}
+
+    (spec,) = iter_spec_tests([test_file], run_config=run_config)
+    request = spec.build_request()
+
+    assert request.max_body_size == 1024
+    assert request.cassette.path.name == "run.cassette"
+
+
+def test_concurrent_run_is_faster_than_sequential(local_server, make_spec):
+    specs = [make_spec(f"test {i}", "/delay/200", local_server, match={"status": 200}) for i in range(5)]
+
+    start = time.monotonic()
+    outcomes = list(run_spec_tests(specs, concurrency=5))
+    elapsed = time.monotonic() - start
+
+    assert all(is_success for _, is_success, _ in outcomes)
+    assert elapsed < 0.8, f"5 requests of 200ms each should run in parallel, took {elapsed}s"
+
+
+def test_run_specfiles_fail_count(local_server, tmp_path):
+    test_file = tmp_path / "test.yaml"
+    test_file.write_text(
+        f"""
+base_url: "{local_server}"
+tests:
+  - url: "/"
+    description: "ok"
+    match:
+      status: 200
+  - url: "/status/500"
+    description: "ko"
+    match:
+      status: 200
+  - url: "/status/503"
+    description: "ko again"
+    match:
+      status: 200
+"""
+    )
+
+    assert run_specfiles([test_file]) == 2
+    assert run_specfiles([test_file], concurrency=3) == 2
+    assert run_specfiles([test_file], workers=2) == 2
+
+
+def test_concurrent_websocket_tests(ws_server, local_server, make_spec):
+    specs = [
+        make_spec(f"ws {i}", "/", ws_server, payload="delay 300", match={"status": 200, "body": ["delay 300"]})
+        for i in range(4)
+    ]
+    specs.append(make_spec("http", "/", local_server, match={"status": 200}))
+
+    start = time.monotonic()
+    outcomes = list(run_spec_tests(specs, concurrency=8))
+    elapsed = time.monotonic() - start
+
+    assert [spec.name for spec, _, _ in outcomes] == ["ws 0", "ws 1", "ws 2", "ws 3", "http"]
+    assert all(is_success for _, is_success, _ in outcomes), outcomes
+    assert elapsed < 1.0, f"4 websocket requests of 300ms each should run in parallel, took {elapsed}s"
+
+
+def test_workers_report_results_in_order(local_server, tmp_path, capsys):
+    tests = "\n".join(
+        f"""
+  - url: "/delay/{(10 - i) * 20}"
+    description: "test {i}"
+    match:
+      status: {200 if i % 3 else 404}"""
+        for i in range(10)
+    )
+    test_file = tmp_path / "test.yaml"
+    test_file.write_text(f'base_url: "{local_server}"\ntests:{tests}\n')
+
+    fail_count = run_specfiles([test_file], workers=3, concurrency=2, verbose=True)
+
+    output = capsys.readouterr().out
+    reported = [line.split(" ")[2] for line in output.splitlines() if " test " in line]
+    assert reported == [str(i) for i in range(10)]
+    assert fail_count == 4
+
+
+def test_share_requests(local_server, make_spec):
+    """
+    Tests with identical requests share a single fetch, unless they're
+    marked `no_share`, both when run sequentially and concurrently.
+    """
+    for concurrency in (1, 4):
+        specs = [
+            make_spec("status", "/delay/100", local_server, match={"status": 200}),
+            make_spec("body", "/delay/100", local_server, match={"body": ["path=/delay/100"]}),
+            make_spec("other", "/", local_server, match={"status": 200}),
+            make_spec("own fetch", "/delay/100", local_server, match={"status": 200}, no_share=True),
+            make_spec("failing", "/delay/100", local_server, match={"status": 404}),
+        ]
+
+        outcomes = list(run_spec_tests(specs, concurrency=concurrency, share_requests=True))
+
+        assert [is_success for _, is_success, _ in outcomes] == [True, True, True, True, False]
+
+        request_ids = [spec.test_result[0]["request_id"] for spec in specs]
+        assert request_ids[0] == request_ids[1] == request_ids[4]
+        assert len(set(request_ids)) == 3
+
+
+def test_shared_results_dropped_after_last_use(local_server, make_spec):
+    """
+    A shared result is only kept until the last test sharing its request
+    got it, rather than for the whole run.
+    """
+    for concurrency in (1, 4):
+        specs = [
+            make_spec("first", "/delay/100", local_server, match={"status": 200}),
+            make_spec("second", "/delay/100", local_server, match={"status": 200}),
+            make_spec("other", "/", local_server, match={"status": 200}),
+            make_spec("third", "/delay/100", local_server, match={"status": 200}),
+        ]
+
+        outcomes = run_spec_tests(specs, concurrency=concurrency, share_requests=True)
+        assert all(next(outcomes)[1] for _ in specs)
+
+        # The generator is suspended after the last test, with the
+        # results it still holds in its local state
+        assert outcomes.gi_frame.f_locals["shared_results"] == {}
+        assert len({spec.test_result[0]["request_id"] for spec in specs}) == 2
+
+
+def test_timeouts_fail_tests(local_server, make_spec):
+    specs = [
+        make_spec("slow", "/delay/1000", local_server, timeout="200ms", match={"status": 200}),
+        make_spec("fast", "/", local_server, match={"status": 200}),
+    ]
+
+    for concurrency in (1, 4):
+        outcomes = list(run_spec_tests(specs, concurrency=concurrency))
+        assert [is_success for _, is_success, _ in outcomes] == [False, True]
+        assert outcomes[0][2].startswith("Timed out: ")
+
+
+def test_suite_deadline(local_server, make_spec):
+    specs = [make_spec(f"test {i}", "/delay/500", local_server, match={"status": 200}) for i in range(6)]
+
+    for concurrency in (1, 3):
+        start = time.monotonic()
+        outcomes = list(run_spec_tests(specs, concurrency=concurrency, deadline=time.time() + 0.7))
+        elapsed = time.monotonic() - start
+
+        assert elapsed < 1.2, f"The run should stop at the deadline, took {elapsed}s"
+        assert not all(is_success for _, is_success, _ in outcomes)
+        assert outcomes[-1][2] == DEADLINE_EXCEEDED
+
+
+def test_multiplex_caps_streams_per_origin(local_server, monkeypatch, make_spec):
+    specs = [make_spec(f"h2 {i}", "/delay/200", local_server, http2=True, match={"status": 200}) for i in range(6)]
+    specs += [make_spec(f"h1 {i}", "/delay/200", local_server, match={"status": 200}) for i in range(2)]
+
+    # Number of HTTP/1.1 and HTTP/2 requests in flight, as each one starts
+    in_flight = []
+    start = CurlMultiDriver._start
+
+    def record_start(driver, request, tag):
+        start(driver, request, tag)
+        requests = [request for request, _ in driver.in_flight.values()]
+        in_flight.append((sum(not r.http2 for r in requests), sum(r.http2 for r in requests)))
+
+    monkeypatch.setattr(CurlMultiDriver, "_start", record_start)
+
+    outcomes = list(run_spec_tests(specs, concurrency=8, multiplex=True, max_streams=2))
+
+    assert [spec.name for spec, _, _ in outcomes] == [spec.name for spec in specs]
+    assert all(is_success for _, is_success, _ in outcomes), outcomes
+
+    # 6 HTTP/2 requests, 2 at a time, while HTTP/1.1 requests aren't capped
+    assert len(in_flight) == 8
+    assert max(http2 for _, http2 in in_flight) == 2
+    assert max(http1 for http1, _ in in_flight) == 2
+
+
+def test_multiplex_failed_requests_release_their_stream(local_server, tmp_path):
+    missing_file = tmp_path / "missing"
+    driver = CurlMultiDriver(multiplex=True, max_streams=1)
+
+    try:
+        with pytest.raises(FileNotFoundError):
+            driver.add(Request(f"{local_server}/", http2=True, payload_file=missing_file), tag="missing")
+
+        # Waiting requests that fail to start hand their stream over too
+        driver.add(Request(f"{local_server}/delay/100", http2=True), tag="first")
+        driver.add(Request(f"{local_server}/", http2=True, payload_file=missing_file), tag="waiting missing")
+        driver.add(Request(f"{local_server}/", http2=True), tag="last")
+        assert len(driver.in_flight) == 1
+
+        completed = {}
+        while len(driver):
+            for tag, result, error in driver.poll():
+                completed[tag] = (result, error)
+    finally:
+        driver.close()
+
+    assert completed["first"][0]["status_code"] == 200
+    assert isinstance(completed["waiting missing"][1], FileNotFoundError)
+    assert completed["last"][0]["status_code"] == 200
+    assert driver.streams == {}
+
+
+def test_closed_driver_closes_buffers_in_flight(silent_server, tmp_path):
+    payload_file = tmp_path / "payload.bin"
+    payload_file.write_bytes(b"x" * 1024)
+    driver = CurlMultiDriver()
+
+    request = Request(f"{silent_server}/upload", payload_file=str(payload_file))
+    driver.add(request, tag="in flight")
+    payload = request.request_payload
+    assert driver.poll(timeout=0.1) == []
+
+    driver.close()
+
+    assert request.response is None
+    assert request.request_payload is None
+    assert payload.data is None
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from http_test.results import JsonLinesWriter, durations_from_results, merge_results
+from http_test.runner import iter_spec_tests
+from http_test.sharding import balance_shards, parse_shard, select_shard
+
+
+def test_parse_shard():
+    assert parse_shard("2/4") == (2, 4)
+
+    for shard in ("0/4", "5/4", "1", "a/b", "1/0"):
+        with pytest.raises(ValueError):
+            parse_shard(shard)
+
+
+def test_shards_cover_all_tests_exactly_once(make_spec):
+    specs = [make_spec(f"test {i}", test_id=f"tests.yaml::test {i}") for i in range(100)]
+
+    shards = [select_shard(specs, k, 4) for k in range(1, 5)]
+    selected = [spec.test_id for shard in shards for spec in shard]
+
+    assert sorted(selected) == sorted(spec.test_id for spec in specs)
+    assert all(shard for shard in shards)
+
+    # Every node must compute the same partition, from its own specs
+    node_specs = [make_spec(spec.name, test_id=spec.test_id) for spec in specs]
+    assert [s.test_id for s in select_shard(node_specs, 3, 4)] == [s.test_id for s in shards[2]]
+
+
+def test_balance_shards_by_duration():
+    durations = {"slow": 10.0, "a": 3.0, "b": 3.0, "c": 2.0, "d": 2.0}
+
+    assignment = balance_shards(list(durations), 2, durations)
+
+    assert assignment["slow"] != assignment["a"]
+    totals = [sum(d for t, d in durations.items() if assignment[t] == k) for k in (1, 2)]
+    assert sorted(totals) == [10.0, 10.0]
+
+
+def test_merge_results(tmp_path):
+    records = [
+        {"id": "tests.yaml::a", "status": "pass", "elapsed": 0.1},
+        {"id": "tests.yaml::b", "status": "fail", "elapsed": 0.2},
+    ]
+
+    for k, record in enumerate(records, start=1):
+        writer = JsonLinesWriter(tmp_path / f"shard{k}.jsonl", extra={"shard": f"{k}/3"})
+        writer.write(record)
+        writer.close()
+
+    merged = merge_results([tmp_path / "shard1.jsonl", tmp_path / "shard2.jsonl"])
+
+    assert [r["id"] for r in merged["records"]] == ["tests.yaml::a", "tests.yaml::b"]
+    assert merged["shards"] == [1, 2]
+    assert merged["missing_shards"] == [3]
+    assert merged["incomplete_files"] == []
+    assert durations_from_results(merged["records"]) == {"tests.yaml::a": 0.1, "tests.yaml::b": 0.2}
+
+    lines = [json.loads(line) for line in (tmp_path / "shard2.jsonl").read_text().splitlines()]
+    assert lines[0]["shard"] == "2/3" and "started" in lines[0]
+    assert lines[1]["id"] == "tests.yaml::b" and lines[1]["shard"] == "2/3"
+    assert lines[2] == {"summary": {"pass": 0, "fail": 1, "skip": 0}, "shard": "2/3"}
+
+
+def test_merge_interrupted_results(tmp_path):
+    # A shard interrupted before its first test, and an unsharded run
+    JsonLinesWriter(tmp_path / "shard1.jsonl", extra={"shard": "1/2"})
+    JsonLinesWriter(tmp_path / "unsharded.jsonl")
+    (tmp_path / "empty.jsonl").write_text("")
+
+    merged = merge_results([tmp_path / "shard1.jsonl"])
+    assert merged["records"] == [] and merged["shards"] == []
+    assert merged["missing_shards"] == [2]
+    assert merged["incomplete_files"] == [str(tmp_path / "shard1.jsonl")]
+
+    merged = merge_results([tmp_path / "unsharded.jsonl", tmp_path / "empty.jsonl"])
+    assert merged["missing_shards"] == []
+    assert merged["incomplete_files"] == [str(tmp_path / "unsharded.jsonl"), str(tmp_path / "empty.jsonl")]
+
+
+def test_test_ids_dont_depend_on_the_path_spelling(tmp_path, monkeypatch):
+    (tmp_path / "tests").mkdir()
+    (tmp_path / "tests" / "a.yaml").write_text('tests:\n  - url: "http://example.com/"\n    description: "index"\n')
+    monkeypatch.chdir(tmp_path)
+
+    for path in ("tests/a.yaml", "./tests/a.yaml", str(tmp_path / "tests" / "a.yaml"), "tests/../tests/a.yaml"):
+        assert [spec.test_id for spec in iter_spec_tests([path])] == ["tests/a.yaml::index"]
@@ -1,6 +1,7 @@
 import pycurl
 import pytest
 
+from http_test.buffers import SpillBuffer
 from http_test.spec import SpecTest, verify_response
 
 
@@ -159,3 +160,118 @@ def test_verify_response_headers_absent_mixed_with_present():
     }
 
     assert verify_response(response, requirements)
+
+
+def test_verify_response_timing_total():
+    response = {"status_code": 200, "elapsed": 0.3}
+
+    assert verify_response(response, {"timing": "500ms"})
+    assert verify_response(response, {"timing": "1s"})
+
+    with pytest.raises(AssertionError) as exc_info:
+        verify_response(response, {"timing": "200ms"})
+
+    assert "Expected elapsed time to be less than 0.2s, got 0.3s instead" in str(exc_info.value)
+
+
+def test_verify_response_timing_phases():
+    response = {
+        "status_code": 200,
+        "elapsed": 0.3,
+        "timings": {"total": 0.3, "dns": 0.01, "connect": 0.02, "tls": 0.08, "ttfb": 0.25},
+    }
+
+    assert verify_response(response, {"timing": {"ttfb": "300ms", "total": 0.5}})
+
+    with pytest.raises(AssertionError) as exc_info:
+        verify_response(response, {"timing": {"ttfb": "300ms", "tls": "50ms"}})
+
+    assert "Expected tls time to be less than 0.05s, got 0.08s instead" in str(exc_info.value)
+
+    with pytest.raises(ValueError):
+        verify_response(response, {"timing": {"handshake": "50ms"}})
+
+
+def test_invalid_requirements_rejected_at_load_time():
+    with pytest.raises(ValueError, match="Unknown or misspelled requirement 'header'"):
+        SpecTest(name="test", spec={"match": {"header": ["content-type: text/html"]}, "config": {}})
+
+    with pytest.raises(ValueError, match="Unknown timing phase"):
+        SpecTest(name="test", spec={"match": {"timing": {"handshake": "50ms"}}, "config": {}})
+
+    with pytest.raises(ValueError, match="Invalid regular expression"):
+        SpecTest(name="test", spec={"match": {"body_regex": ["(unclosed"]}, "config": {}})
+
+
+def test_invalid_payload_rejected_at_load_time():
+    for payload in (42, 4.2, True, ["a"], {"a": 1}):
+        with pytest.raises(ValueError, match="Test 'test': invalid payload"):
+            SpecTest(name="test", spec={"payload": payload, "config": {}})
+
+    assert SpecTest(name="test", spec={"payload": "42", "config": {}})
+
+
+def test_verify_response_regex():
+    response = {
+        "status_code": 200,
+        "response_headers": {
+            "cache-control": ["no-transform", "public, max-age=3600"],
+        },
+        "response_body_decoded": b"<html><title>Home page</title></html>",
+    }
+
+    assert verify_response(response, {"headers_regex": ["cache-control: MAX-AGE=\\d+"]})
+    assert verify_response(response, {"body_regex": ["<title>[^<]+</title>"]})
+
+    with pytest.raises(AssertionError, match="Expected header cache-control to match"):
+        verify_response(response, {"headers_regex": ["cache-control: ^private"]})
+
+    with pytest.raises(AssertionError, match="Expected response body to match"):
+        verify_response(response, {"body_regex": ["<h1>"]})
+
+
+def test_verify_spilled_response_body():
+    buffer = SpillBuffer(max_memory=1024)
+    for _ in range(100):
+        buffer.write(b"x" * 1000)
+    buffer.write(b"<title>The end</title>")
+    assert buffer.is_spilled()
+
+    response = {"status_code": 200, "response_body_decoded": buffer.getvalue()}
+    buffer.close()
+
+    assert verify_response(response, {"body": ["The end"], "body_regex": ["<title>[^<]+</title>"]})
+
+    # Only the beginning of the body is included in the failure message
+    with pytest.raises(AssertionError) as e:
+        verify_response(response, {"body": ["missing"]})
+    assert len(str(e.value)) < 2000
+
+
+def test_timeouts_from_file_and_test():
+    config = {"base_url": "http://example.com", "timeout": "5s", "min_speed": "1KB"}
+
+    request = SpecTest(name="test", spec={"url": "/", "config": config}).build_request()
+    assert (request.timeout, request.connect_timeout, request.min_speed) == (5.0, 30.0, 1024)
+
+    spec = {"url": "/", "timeout": "500ms", "connect_timeout": 1, "config": config}
+    request = SpecTest(name="test", spec=spec).build_request(deadline=123.0)
+    assert (request.timeout, request.connect_timeout, request.deadline) == (0.5, 1.0, 123.0)
+
+
+def test_payload_file_from_spec(local_server, tmp_path):
+    payload_file = tmp_path / "payload.json"
+    payload_file.write_text('{"name": "wörld"}')
+
+    spec = {
+        "url": f"{local_server}/upload",
+        "payload_file": str(payload_file),
+        "chunked": True,
+        "match": {"body": ["size=18 ", " chunked"]},
+        "config": {},
+    }
+    is_success, _ = SpecTest(name="upload", spec=spec).run()
+    assert is_success
+
+    with pytest.raises(ValueError, match="only one of 'payload' and 'payload_file'"):
+        SpecTest(name="upload", spec=dict(spec, payload="inline"))
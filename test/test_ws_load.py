@@ -0,0 +1,27 @@
+from http_test.request import Request
+from http_test.ws_load import ws_load
+from http_test.ws_request import get_background_loop
+
+
+def test_ws_load(ws_server):
+    request = Request(url=f"{ws_server}/")
+    stats = get_background_loop().run(
+        ws_load(request.websockets_connect_params(), message="ping", connections=20, messages=5, rate=100)
+    )
+
+    assert stats.connections == stats.connected == 20
+    assert stats.messages_sent == stats.messages_received == 100
+    assert stats.connect_latency.total_count == 20
+    assert stats.rtt.total_count >= 100
+    assert stats.error_count() == 0
+
+
+def test_ws_load_timeouts(ws_server):
+    request = Request(url=f"{ws_server}/")
+    stats = get_background_loop().run(
+        ws_load(request.websockets_connect_params(), message="delay 500", connections=3, messages=2, read_timeout=0.1)
+    )
+
+    assert stats.timeouts == 3
+    assert stats.messages_sent == 3, "Connections are closed after the first timeout"
+    assert stats.error_count() == 3